@@ -1,51 +1,215 @@
 import os
-import re
-from typing import Tuple
+import time
+import random
+import threading
+import json
+from typing import List, Optional, Tuple
 from .models import EmailRecord, ClassificationResult, Extraction, ResponseDraft
+from .classification_cache import classification_cache, cache_key
+from . import heuristics
+from .heuristics import HeuristicResult
+from .extraction import extractor
+from .local_model import local_classifier, LocalPrediction
+from .metrics import span, LLM_CALLS, CLASSIFICATIONS, LLM_FALLBACKS
 from google.generativeai import configure, GenerativeModel
+from google.api_core.exceptions import ResourceExhausted, TooManyRequests
 
 # Configure Gemini once (if key exists)
 GEMINI_KEY = os.getenv("GEMINI_API_KEY", "")
 if GEMINI_KEY:
     configure(api_key=GEMINI_KEY)
 
+MODEL_NAME = "gemini-1.5-flash"
+PROMPT_VERSION = "1"  # bump whenever either prompt changes so cached results are not reused
+
+# Batch prompting: several emails per generate_content call
+BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "12000"))
+BATCH_MAX_EMAILS = int(os.getenv("LLM_BATCH_MAX_EMAILS", "15"))  # bounded by the output token limit
+BATCH_BODY_CHARS = 2000
+
+_RESULT_SCHEMA = """summary, category, sentiment (positive|neutral|negative), priority (urgent|not_urgent), urgency_score (1-10),
+requires_response (true|false), confidence (0-1), extraction: {phone_numbers:[], emails:[], product_mentions:[], keywords:[]}."""
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1.0"))
+
+# Shared across worker threads: once any call is rate limited, every caller waits out the backoff
+_rate_limit_lock = threading.Lock()
+_rate_limited_until = 0.0
+
+_model: Optional[GenerativeModel] = None
+
+def _get_model() -> GenerativeModel:
+    # GenerativeModel holds no per-request state, so one instance is shared by all threads
+    global _model
+    if _model is None:
+        _model = GenerativeModel(MODEL_NAME)
+    return _model
+
+def _estimate_tokens(email: EmailRecord) -> int:
+    # ~4 chars per token, plus per-email framing and room for its share of the JSON output
+    chars = len(email.subject or "") + len(email.sender or "") + min(len(email.body or ""), BATCH_BODY_CHARS)
+    return chars // 4 + 200
+
+def _parse_json(text: str):
+    text = text.strip()
+    # Best-effort: if model wrapped JSON in code fences
+    if text.startswith("```"):
+        text = text.strip("`").strip()
+        if text.lower().startswith("json"):
+            text = text[4:]
+    return json.loads(text)
+
+def _result_from_json(data: dict, email: EmailRecord, priority_tag: str, urgency: int) -> ClassificationResult:
+    extraction = data.get("extraction") or {}
+    return ClassificationResult(
+        summary=data.get("summary") or email.subject,
+        category=data.get("category", "CUSTOMER_SUPPORT"),
+        sentiment=data.get("sentiment", "neutral"),
+        priority=data.get("priority", priority_tag),
+        urgency_score=int(data.get("urgency_score", urgency)),
+        requires_response=bool(data.get("requires_response", True)),
+        confidence=float(data.get("confidence", 0.7)),
+        extraction=Extraction(
+            phone_numbers=extraction.get("phone_numbers", []),
+            emails=extraction.get("emails", []),
+            product_mentions=extraction.get("product_mentions", []),
+            keywords=extraction.get("keywords", []),
+        ),
+        source="llm",
+    )
+
+def _generate(model: GenerativeModel, prompt: str):
+    """
+    generate_content with a per-call timeout and jittered exponential backoff on 429s.
+    Other errors (including timeouts) propagate so callers can fall back to heuristics.
+    """
+    global _rate_limited_until
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        wait = _rate_limited_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            with span("llm.call"):
+                resp = model.generate_content(prompt, request_options={"timeout": LLM_TIMEOUT_S})
+            LLM_CALLS.inc(outcome="ok")
+            return resp
+        except (ResourceExhausted, TooManyRequests):
+            LLM_CALLS.inc(outcome="rate_limited")
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = LLM_BACKOFF_BASE_S * (2 ** attempt) * (1 + random.random())
+            with _rate_limit_lock:
+                _rate_limited_until = max(_rate_limited_until, time.monotonic() + delay)
+        except Exception:
+            LLM_CALLS.inc(outcome="error")
+            raise
+
+def _heuristic_score(email: EmailRecord) -> HeuristicResult:
+    with span("heuristics"):
+        return heuristics.engine.score(email.subject, email.body)
+
 def _heuristic_priority(subject: str, body: str) -> Tuple[str, int]:
-    text = f"{subject} {body}".lower()
-    urgent_words = ["urgent", "immediately", "asap", "critical", "cannot access", "down", "blocked", "error", "failed"]
-    score = 5
-    for w in urgent_words:
-        if w in text:
-            score = max(score, 9)
-    return ("urgent" if score >= 8 else "not_urgent", score)
+    with span("heuristics"):
+        h = heuristics.engine.score(subject, body)
+    return (h.priority, h.urgency_score)
+
+def _heuristic_classification(email: EmailRecord, confidence: float, h: Optional[HeuristicResult] = None) -> ClassificationResult:
+    if h is None:
+        h = _heuristic_score(email)
+    CLASSIFICATIONS.inc(source="heuristic")
+    return ClassificationResult(
+        summary=(email.body or "").strip()[:200] or email.subject,
+        category=h.category,
+        sentiment=h.sentiment,
+        priority=h.priority,
+        urgency_score=h.urgency_score,
+        requires_response=True,
+        confidence=confidence,
+        extraction=_extract_contacts(email.body or ""),
+        source="heuristic",
+    )
+
+def relabel(email: EmailRecord, labels: ClassificationResult, source: str) -> ClassificationResult:
+    """
+    Another email's category, sentiment and priority applied to `email`; the summary and extracted contacts
+    come from `email` itself, so nothing of the other sender's text carries over.
+    """
+    return ClassificationResult(
+        summary=(email.body or "").strip()[:200] or email.subject,
+        category=labels.category,
+        sentiment=labels.sentiment,
+        priority=labels.priority,
+        urgency_score=labels.urgency_score,
+        requires_response=labels.requires_response,
+        confidence=labels.confidence,
+        extraction=_extract_contacts(email.body or ""),
+        source=source,
+    )
 
 def _extract_contacts(body: str) -> Extraction:
-    phones = re.findall(r"(?:\+?\d{1,3}[-.\s]?)?(?:\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}", body)
-    emails = re.findall(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", body)
-    return Extraction(phone_numbers=list(set(phones)), emails=list(set(emails)), product_mentions=[], keywords=[])
+    with span("extract_contacts"):
+        return extractor.extract(body)
 
-def classify_with_gemini(email: EmailRecord) -> ClassificationResult:
+def _local_classification(email: EmailRecord, pred: LocalPrediction) -> ClassificationResult:
+    CLASSIFICATIONS.inc(source="local")
+    return ClassificationResult(
+        summary=(email.body or "").strip()[:200] or email.subject,
+        category=pred.category,
+        sentiment=pred.sentiment,
+        priority=pred.priority,
+        urgency_score=pred.urgency_score,
+        requires_response=pred.requires_response,
+        confidence=pred.confidence,
+        extraction=_extract_contacts(email.body or ""),
+        source="local",
+    )
+
+def _confident_local(emails: List[EmailRecord]) -> List[Optional[ClassificationResult]]:
+    """
+    Local model results for the emails it is confident about (see local_model.py), None for the rest.
+    """
+    return [
+        _local_classification(e, p) if p is not None and p.confidence >= local_classifier.min_confidence else None
+        for e, p in zip(emails, local_classifier.predict(emails))
+    ]
+
+def classify_with_gemini(email: EmailRecord, use_local: bool = True) -> ClassificationResult:
     """
     Uses Gemini 1.5 Flash if GEMINI_API_KEY is present.
     Falls back to heuristics otherwise.
+    LLM results are cached by content, so re-fetched mail skips the model call, and a confident local model
+    answer skips it too. use_local=False when the caller already asked the local model.
     """
-    priority_tag, urgency = _heuristic_priority(email.subject, email.body)
     if not GEMINI_KEY:
+        local = _confident_local([email])[0] if use_local else None
+        if local is not None:
+            return local
         # Fallback classification
-        sentiment = "negative" if any(k in (email.body or "").lower() for k in ["cannot", "unable", "error", "issue", "down"]) else "neutral"
-        category = "CUSTOMER_SUPPORT"
-        summary = (email.body or "").strip()[:200] or email.subject
-        extraction = _extract_contacts(email.body or "")
-        return ClassificationResult(
-            summary=summary,
-            category=category,
-            sentiment=sentiment, priority=priority_tag, urgency_score=urgency,
-            requires_response=True, confidence=0.6, extraction=extraction
-        )
+        LLM_FALLBACKS.inc(reason="no_api_key")
+        return _heuristic_classification(email, 0.6)
+
+    key = cache_key(email, MODEL_NAME, PROMPT_VERSION)
+    cached = classification_cache.get(key)
+    if cached is not None:
+        CLASSIFICATIONS.inc(source="cache")
+        return cached
+    local = _confident_local([email])[0] if use_local else None
+    if local is not None:
+        return local
+    return _classify_uncached(email, key)
+
+def _classify_uncached(email: EmailRecord, key: str) -> ClassificationResult:
+    """
+    One model call for an email already known to miss the cache under `key`; caches the result.
+    """
+    # Defaults for fields the model leaves out, and the fallback if the call fails
+    h = _heuristic_score(email)
 
     prompt = f"""
 You are an expert support triage assistant. Analyze this email and return STRICT JSON with keys:
-summary, category, sentiment (positive|neutral|negative), priority (urgent|not_urgent), urgency_score (1-10),
-requires_response (true|false), confidence (0-1), extraction: {{phone_numbers:[], emails:[], product_mentions:[], keywords:[]}}.
+{_RESULT_SCHEMA}
 
 Email:
 Subject: {email.subject}
@@ -53,44 +217,94 @@ From: {email.sender}
 Body:
 {email.body[:4000]}
 """
-    model = GenerativeModel("gemini-1.5-flash")
     try:
-        resp = model.generate_content(prompt)
-        text = resp.text.strip()
-        # Best-effort: if model wrapped JSON in code fences
-        text = text.strip("`").strip()
-        import json
-        data = json.loads(text)
-        extraction = data.get("extraction") or {}
-        return ClassificationResult(
-            summary=data.get("summary") or email.subject,
-            category=data.get("category", "CUSTOMER_SUPPORT"),
-            sentiment=data.get("sentiment", "neutral"),
-            priority=data.get("priority", priority_tag),
-            urgency_score=int(data.get("urgency_score", urgency)),
-            requires_response=bool(data.get("requires_response", True)),
-            confidence=float(data.get("confidence", 0.7)),
-            extraction=Extraction(
-                phone_numbers=extraction.get("phone_numbers", []),
-                emails=extraction.get("emails", []),
-                product_mentions=extraction.get("product_mentions", []),
-                keywords=extraction.get("keywords", []),
-            ),
-        )
+        resp = _generate(_get_model(), prompt)
+        result = _result_from_json(_parse_json(resp.text), email, h.priority, h.urgency_score)
     except Exception:
-        # Fall back gracefully
-        extraction = _extract_contacts(email.body or "")
-        sentiment = "negative" if any(k in (email.body or "").lower() for k in ["cannot", "unable", "error", "issue", "down"]) else "neutral"
-        return ClassificationResult(
-            summary=(email.body or "").strip()[:200] or email.subject,
-            category="CUSTOMER_SUPPORT",
-            sentiment=sentiment,
-            priority=priority_tag,
-            urgency_score=urgency,
-            requires_response=True,
-            confidence=0.55,
-            extraction=extraction,
-        )
+        # Fall back gracefully (counted, so a failing LLM shows up in /metrics)
+        LLM_FALLBACKS.inc(reason="llm_error")
+        return _heuristic_classification(email, 0.55, h)
+    CLASSIFICATIONS.inc(source="llm")
+    # Only model output is cached; heuristic fallbacks should get another LLM attempt next time
+    classification_cache.put(key, result)
+    return result
+
+def pack_batches(emails: List[EmailRecord], token_budget: Optional[int] = None, max_emails: Optional[int] = None) -> List[List[EmailRecord]]:
+    """
+    Greedily groups emails (in order) into prompts that stay under the token budget.
+    """
+    token_budget = token_budget or BATCH_TOKEN_BUDGET
+    max_emails = max_emails or BATCH_MAX_EMAILS
+    batches: List[List[EmailRecord]] = []
+    current: List[EmailRecord] = []
+    used = 0
+    for e in emails:
+        cost = _estimate_tokens(e)
+        if current and (used + cost > token_budget or len(current) >= max_emails):
+            batches.append(current)
+            current, used = [], 0
+        current.append(e)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def classify_batch(emails: List[EmailRecord]) -> List[ClassificationResult]:
+    """
+    Classifies several emails with one model call; returns results in input order.
+    Cache hits are served first, then confident local model answers (one vectorized call for the batch).
+    Entries missing or malformed in the model's JSON array, or a failed call, fall back to one call per email
+    (which itself falls back to heuristics) without a second cache lookup. Callers should size the list with
+    pack_batches.
+    """
+    if len(emails) <= 1:
+        return [classify_with_gemini(e) for e in emails]
+    if not GEMINI_KEY:
+        local = _confident_local(emails)
+        return [r if r is not None else classify_with_gemini(e, use_local=False) for e, r in zip(emails, local)]
+
+    keys = [cache_key(e, MODEL_NAME, PROMPT_VERSION) for e in emails]
+    results: List[Optional[ClassificationResult]] = [classification_cache.get(k) for k in keys]
+    pending = [i for i, r in enumerate(results) if r is None]
+    CLASSIFICATIONS.inc(len(emails) - len(pending), source="cache")
+    for i, r in zip(pending, _confident_local([emails[i] for i in pending])):
+        results[i] = r
+    pending = [i for i in pending if results[i] is None]
+
+    if len(pending) > 1:
+        sections = []
+        for n, i in enumerate(pending):
+            e = emails[i]
+            sections.append(f"[[email {n}]]\nSubject: {e.subject}\nFrom: {e.sender}\nBody:\n{e.body[:BATCH_BODY_CHARS]}")
+        prompt = f"""
+You are an expert support triage assistant. Analyze each of the {len(pending)} emails below and return a STRICT JSON array
+with exactly one object per email. Each object has an integer "index" matching the [[email N]] marker, plus keys:
+{_RESULT_SCHEMA}
+
+Emails:
+""" + "\n\n".join(sections)
+        try:
+            items = _parse_json(_generate(_get_model(), prompt).text)
+        except Exception:
+            LLM_FALLBACKS.inc(len(pending), reason="batch_error")
+            items = None
+        for item in items if isinstance(items, list) else []:
+            try:
+                n = int(item["index"])
+                if not 0 <= n < len(pending) or results[pending[n]] is not None:
+                    continue
+                e = emails[pending[n]]
+                priority_tag, urgency = _heuristic_priority(e.subject, e.body)
+                results[pending[n]] = _result_from_json(item, e, priority_tag, urgency)
+                classification_cache.put(keys[pending[n]], results[pending[n]])
+                CLASSIFICATIONS.inc(source="llm_batch")
+            except Exception:
+                continue
+        missing = sum(1 for i in pending if results[i] is None)
+        if missing and items is not None:
+            LLM_FALLBACKS.inc(missing, reason="batch_item")
+
+    return [r if r is not None else _classify_uncached(e, k) for e, r, k in zip(emails, results, keys)]
 
 def generate_reply(email: EmailRecord, cls: ClassificationResult) -> ResponseDraft:
     tone = "professional"
@@ -0,0 +1,35 @@
+import os
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+# Routes are async and never block the event loop. The blocking libraries underneath (sqlite3,
+# googleapiclient, google-generativeai's sync client and its retry loop) run on two dedicated pools
+# instead of Starlette's shared threadpool: short DB calls on one, whole fetch/classify runs on the
+# other, so a pile of slow fetches can queue up without delaying reads.
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+BLOCKING_THREADS = int(os.getenv("BLOCKING_THREADS", "4"))  # concurrent Gmail fetch / LLM runs
+
+db_pool = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="blocking")
+
+T = TypeVar("T")
+
+async def run_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Awaits a database.py call on the DB pool; each pool thread keeps its own pooled connection.
+    """
+    return await _run(db_pool, fn, *args, **kwargs)
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Awaits a long blocking call (Gmail, LLM, a whole processing run) on the blocking pool.
+    """
+    return await _run(blocking_pool, fn, *args, **kwargs)
+
+async def _run(pool: ThreadPoolExecutor, fn: Callable[..., T], *args, **kwargs) -> T:
+    # Carry context variables (the request's metrics profile) over to the pool thread
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(pool, call)
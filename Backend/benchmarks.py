@@ -0,0 +1,835 @@
+"""
+Offline benchmarks with stubbed backends. Nothing here talks to Gmail or Gemini.
+
+    python -m Backend.benchmarks classify --emails 64 --latency 0.05
+    python -m Backend.benchmarks db --emails 2000
+    python -m Backend.benchmarks heuristics --emails 20000 --body-chars 2000
+    python -m Backend.benchmarks extraction --mb 4
+    python -m Backend.benchmarks search --emails 200000
+    python -m Backend.benchmarks load --fetchers 48 --seconds 10
+    python -m Backend.benchmarks queue --sizes 10000 100000 300000
+    python -m Backend.benchmarks local-model --emails 10000
+    python -m Backend.benchmarks dedup --emails 20000 --incidents 50 --copies 40
+    python -m Backend.benchmarks retention --emails 50000 --days 365 --archive-after-days 30
+    python -m Backend.benchmarks suite --emails 5000 --json bench.json [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .models import EmailRecord, ProcessedEmail, ClassificationResult, ResponseDraft, EmailFilters
+from . import database as db
+from . import ai_classifier
+from . import heuristics
+from . import local_model
+from . import main as app_main
+from .gmail_fetcher import GmailClient, gmail_clients
+from .extraction import extractor
+from .classification_cache import classification_cache
+from .dedup import DEDUP_ENABLED, near_duplicates
+from .retention import RetentionScheduler
+from .pipeline import classify_all
+from .priority_queue import PriorityEmailQueue
+from .synthetic import MailboxShape, FakeGmailService, generate_mailbox
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class SlowStubModel:
+    """
+    Stands in for GenerativeModel: sleeps for a fixed latency, then returns a valid classification.
+    """
+    latency_s = 0.05
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        SlowStubModel.calls += 1
+        time.sleep(self.latency_s)
+        result = {
+            "summary": "stub", "category": "CUSTOMER_SUPPORT", "sentiment": "neutral",
+            "priority": "not_urgent", "urgency_score": 5, "requires_response": True,
+            "confidence": 0.9, "extraction": {},
+        }
+        batch_size = prompt.count("[[email ")
+        if batch_size:
+            return _StubResponse(json.dumps([dict(result, index=n) for n in range(batch_size)]))
+        return _StubResponse(json.dumps(result))
+
+def _synthetic_emails(n: int) -> List[EmailRecord]:
+    return [
+        EmailRecord(
+            id=f"bench-{i}", sender=f"user{i}@example.com", subject=f"Issue #{i}",
+            body=f"Hello, our dashboard is down since this morning (ticket {i}). Call +1 555 010 {i:04d}.",
+            sent_date=datetime.utcnow(), source="manual",
+        )
+        for i in range(n)
+    ]
+
+def bench_classify(n_emails: int, latency_s: float, levels: List[int], batch_size: int):
+    """
+    Throughput of pipeline.classify_all against a fixed-latency stub model, per concurrency level.
+    """
+    SlowStubModel.latency_s = latency_s
+    saved = (ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model,
+             ai_classifier.BATCH_MAX_EMAILS, classification_cache.enabled)
+    ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model = "stub", SlowStubModel, None
+    ai_classifier.BATCH_MAX_EMAILS = batch_size
+    classification_cache.enabled = False  # every level must pay the model latency
+    near_duplicates.enabled = False  # the synthetic emails differ only in their numbers
+    try:
+        emails = _synthetic_emails(n_emails)
+        print(f"classify: {n_emails} emails, stub latency {latency_s * 1000:.0f} ms, up to {batch_size} emails/prompt")
+        for level in levels:
+            SlowStubModel.calls = 0
+            start = time.perf_counter()
+            classify_all(emails, concurrency=level)
+            elapsed = time.perf_counter() - start
+            print(f"  concurrency={level:<3d} {elapsed:7.2f} s  {n_emails / elapsed:8.1f} emails/s  {SlowStubModel.calls} model calls")
+    finally:
+        (ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model,
+         ai_classifier.BATCH_MAX_EMAILS, classification_cache.enabled) = saved
+        near_duplicates.enabled = DEDUP_ENABLED
+
+@contextmanager
+def _temp_db():
+    """
+    Points database.py at a throwaway SQLite file for the duration of the block.
+    """
+    saved = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        try:
+            db.init_db()
+            yield db.DB_PATH
+        finally:
+            db.DB_PATH = saved
+
+def _processed(n: int) -> List[ProcessedEmail]:
+    emails = _synthetic_emails(n)
+    out = []
+    for e in emails:
+        cls = ai_classifier.classify_with_gemini(e)
+        out.append(ProcessedEmail(record=e, classification=cls, draft=ai_classifier.generate_reply(e, cls)))
+    return out
+
+def bench_db(n_emails: int, batch: int):
+    """
+    Emails persisted per second: the original connect-per-upsert path, pooled per-row upserts,
+    and bulk save_processed in batches.
+    """
+    saved_key, ai_classifier.GEMINI_KEY = ai_classifier.GEMINI_KEY, ""  # heuristic results, no model calls
+    try:
+        items = _processed(n_emails)
+    finally:
+        ai_classifier.GEMINI_KEY = saved_key
+
+    def per_row():
+        for p in items:
+            db.upsert_email(p.record)
+            db.upsert_classification(p.record.id, p.classification)
+            db.upsert_draft(p.record.id, p.draft)
+
+    def bulk():
+        for i in range(0, len(items), batch):
+            db.save_processed(items[i:i + batch])
+
+    print(f"db: {n_emails} emails (email + classification + draft rows each)")
+    runs = [("connect per upsert", per_row, True), ("pooled WAL, per row", per_row, False), (f"bulk x{batch}", bulk, False)]
+    for label, fn, fresh_connections in runs:
+        with _temp_db() as path:
+            pooled = db._conn
+            if fresh_connections:
+                db._conn = lambda: sqlite3.connect(path)  # pre-pooling behaviour, default rollback journal
+            try:
+                start = time.perf_counter()
+                fn()
+                elapsed = time.perf_counter() - start
+            finally:
+                db._conn = pooled
+            print(f"  {label:<22s} {elapsed:7.2f} s  {n_emails / elapsed:10.1f} emails/s")
+
+_FILLER = ("the a we our your team account please update on for with this that report access server "
+           "login page customer order ticket meeting schedule week today").split()
+
+def _synthetic_text(rng: random.Random, n_chars: int, keywords: List[str], keyword_rate: float) -> str:
+    words: List[str] = []
+    size = 0
+    while size < n_chars:
+        w = rng.choice(keywords) if rng.random() < keyword_rate else rng.choice(_FILLER)
+        words.append(w.upper() if rng.random() < 0.05 else w)
+        size += len(w) + 1
+    return " ".join(words)
+
+def _legacy_heuristics(subject: str, body: str):
+    # Pre-rule-engine fallback: one substring scan per keyword, body lowercased twice
+    text = f"{subject} {body}".lower()
+    score = 5
+    for w in ["urgent", "immediately", "asap", "critical", "cannot access", "down", "blocked", "error", "failed"]:
+        if w in text:
+            score = max(score, 9)
+    sentiment = "negative" if any(k in (body or "").lower() for k in ["cannot", "unable", "error", "issue", "down"]) else "neutral"
+    return ("urgent" if score >= 8 else "not_urgent", score, sentiment)
+
+def bench_heuristics(n_emails: int, body_chars: int, seed: int):
+    """
+    Emails/s and MB/s of the legacy keyword scans vs the compiled rule engine over a synthetic corpus.
+    """
+    rng = random.Random(seed)
+    keywords = [k for rule in heuristics.engine.rules for k in rule["keywords"]]
+    corpus = [
+        (f"Ticket {i}", _synthetic_text(rng, body_chars, keywords, keyword_rate=rng.choice([0.0, 0.001, 0.02])))
+        for i in range(n_emails)
+    ]
+    total_mb = sum(len(s) + len(b) for s, b in corpus) / 1e6
+    print(f"heuristics: {n_emails} emails, ~{body_chars} chars each ({total_mb:.1f} MB)")
+    same_rules = heuristics.RuleEngine([r for r in heuristics.DEFAULT_RULES if r["label"] in ("urgent", "negative")])
+    runs = [
+        ("legacy scans (urgency + sentiment)", lambda: [_legacy_heuristics(s, b) for s, b in corpus]),
+        ("rule engine, legacy rules only", lambda: [same_rules.score(s, b) for s, b in corpus]),
+        ("rule engine, default rules", lambda: [heuristics.engine.score(s, b) for s, b in corpus]),
+    ]
+    for label, fn in runs:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<46s} {elapsed:7.2f} s  {n_emails / elapsed:10.0f} emails/s  {total_mb / elapsed:7.1f} MB/s")
+
+def bench_local_model(n_emails: int, holdout: float, seed: int):
+    """
+    Trains the local classifier on a synthetic mailbox labelled by the rule engine (standing in for stored
+    LLM labels), prints its evaluation report, and compares prediction cost with the rule engine.
+    """
+    messages = generate_mailbox(MailboxShape(n_emails=n_emails, urgent_ratio=0.3, seed=seed))
+    records = GmailClient(service=FakeGmailService(messages)).fetch_recent(max_results=n_emails, only_unread=False)
+    examples = []
+    for r in records:
+        h = heuristics.engine.score(r.subject, r.body)
+        examples.append(local_model.Example(
+            r.id, r.sender, r.subject, r.body, h.category, h.sentiment, h.priority, h.urgency_score, "true"))
+    train, test = local_model.split(examples, holdout)
+    start = time.perf_counter()
+    model = local_model.train(train)
+    print(f"local-model: trained on {len(train)} emails in {time.perf_counter() - start:.1f} s")
+    print(local_model.format_report(local_model.evaluate(model, test)))
+
+    by_id = {r.id: r for r in records}
+    held_out = [by_id[e.id] for e in test]
+    runs = [("rule engine, one email at a time", lambda: [ai_classifier._heuristic_score(r) for r in held_out])]
+    for size in (1, ai_classifier.BATCH_MAX_EMAILS, 1000):
+        runs.append((f"local model, batches of {size}", lambda size=size: [
+            model.predict(held_out[i:i + size]) for i in range(0, len(held_out), size)]))
+    for label, fn in runs:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<40s} {elapsed / len(held_out) * 1e6:8.1f} µs/email")
+
+def _incident_copies(rng: random.Random, n_incidents: int, copies: int, words: List[str]):
+    """
+    (incident, subject, body) for `copies` variants of each incident: a few words swapped and fresh
+    host names, ids and times, like repeated alerts or reports of the same outage.
+    """
+    for k in range(n_incidents):
+        base = [rng.choice(words) for _ in range(rng.randint(25, 150))]
+        for _ in range(copies):
+            text = " ".join(rng.choice(words) if rng.random() < 0.01 else w for w in base)
+            yield k, f"[ALERT] {base[0]} {base[1]} failing on host-{rng.randint(1, 99)}", (
+                f"{text}\nincident {rng.randint(10000, 99999)} at {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} UTC")
+
+def bench_dedup(n_emails: int, incidents: int, copies: int, batch: int, seed: int):
+    """
+    Near-duplicate clustering over a synthetic mailbox with `incidents` floods of `copies` emails each mixed
+    in: precision and recall of the duplicate calls, and assignment cost per email as the index grows.
+    """
+    rng = random.Random(seed)
+    messages = generate_mailbox(MailboxShape(n_emails=n_emails, seed=seed))
+    records = GmailClient(service=FakeGmailService(messages)).fetch_recent(max_results=n_emails, only_unread=False)
+    labels = {r.id: None for r in records}
+    for i, (k, subject, body) in enumerate(_incident_copies(rng, incidents, copies, sorted(set(" ".join(
+            r.body for r in records[:50]).split())))):
+        record = EmailRecord(id=f"dup-{i:06d}", sender="alerts@example.com", subject=subject, body=body,
+                             sent_date=datetime(2024, 1, 1))
+        records.insert(rng.randrange(len(records) + 1), record)
+        labels[record.id] = k
+    print(f"dedup: {len(records)} emails ({incidents} incidents x {copies} copies), threshold {near_duplicates.threshold}")
+
+    with _temp_db():
+        assignments = []
+        slices = 5
+        step = -(-len(records) // slices)
+        for s in range(0, len(records), step):
+            end = min(s + step, len(records))
+            start = time.perf_counter()
+            for i in range(s, end, batch):
+                # batches stop at the slice boundary, so every record is assigned exactly once, in order
+                assignments += near_duplicates.assign(records[i:min(i + batch, end)])
+            elapsed = time.perf_counter() - start
+            print(f"  emails {s:>7d}-{end:<7d} {elapsed / (end - s) * 1e6:8.1f} µs/email")
+
+    first = set()
+    true_dups = called = correct = 0
+    for r, a in zip(records, assignments):
+        label = labels[r.id]
+        if label is not None:
+            true_dups += label in first
+            first.add(label)
+        if a is not None and a.cluster_id != r.id:
+            called += 1
+            correct += label is not None and labels[a.cluster_id] == label
+    print(f"  duplicates called {called}, precision {correct / max(called, 1):.3f}, "
+          f"recall {correct / max(true_dups, 1):.3f}")
+
+_LEGACY_PHONE = re.compile(r"(?:\+?\d{1,3}[-.\s]?)?(?:\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}")
+_LEGACY_EMAIL = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+
+def _legacy_extract(body: str):
+    return set(_LEGACY_PHONE.findall(body)), set(_LEGACY_EMAIL.findall(body))
+
+def _extraction_bodies(n_chars: int):
+    """
+    Worst cases seen in real mail: pasted logs, HTML remnants, long digit runs, and
+    address-like tokens that never complete.
+    """
+    log_line = "2024-05-01 12:00:03.123 ERROR worker-7 id=4242424242 ip=10.0.0.12 user=ops@example.com retry=3\n"
+    html = '<td style="width:100px"><a href="mailto:sales@example.com">Call 555-010-1234</a></td>'
+    cases = {
+        "pasted log": log_line,
+        "html remnants": html,
+        "digit run": "1234567890",
+        "no-@ word run": "abcdefghij.klmnop-qrstu_",
+        "dangling @ domains": "a@b.c-d.e-f.",
+    }
+    return {name: (unit * (n_chars // len(unit) + 1))[:n_chars] for name, unit in cases.items()}
+
+def bench_extraction(mb: float, legacy_max_kb: int):
+    """
+    Throughput of contact/keyword extraction on multi-megabyte adversarial bodies.
+    The legacy patterns are only run up to legacy_max_kb, since some of them go quadratic.
+    """
+    n_chars = int(mb * 1_000_000)
+    legacy_chars = min(n_chars, legacy_max_kb * 1000)
+    print(f"extraction: {mb:g} MB bodies (legacy patterns on the first {legacy_chars // 1000} KB)")
+    for name, body in _extraction_bodies(n_chars).items():
+        start = time.perf_counter()
+        extractor.extract(body)
+        new_s = time.perf_counter() - start
+        start = time.perf_counter()
+        _legacy_extract(body[:legacy_chars])
+        legacy_s = time.perf_counter() - start
+        print(f"  {name:<20s} new {n_chars / 1e6 / new_s:8.1f} MB/s   legacy {legacy_chars / 1e6 / legacy_s:8.3f} MB/s")
+
+def bench_search(n_emails: int, body_words: int, seed: int):
+    """
+    /emails/search latency over a synthetic mailbox. Body words follow a Zipf-like distribution
+    over 5000 random words, so queries cover very common, mid-frequency and rare terms.
+    """
+    rng = random.Random(seed)
+    vocab = list(dict.fromkeys(
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 10))) for _ in range(5200)
+    ))[:5000]
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    cls = ClassificationResult(summary="Customer reports an issue", category="CUSTOMER_SUPPORT",
+                               sentiment="neutral", priority="not_urgent", urgency_score=5)
+    start_date = datetime(2024, 1, 1)
+    with _temp_db() as path:
+        start = time.perf_counter()
+        for base in range(0, n_emails, 2000):
+            items = []
+            for i in range(base, min(base + 2000, n_emails)):
+                words = rng.choices(vocab, weights, k=body_words)
+                record = EmailRecord(
+                    id=f"bench-{i}", sender=f"user{i % 5000}@example.com", subject=" ".join(words[:6]),
+                    body=" ".join(words), sent_date=start_date + timedelta(minutes=i), source="manual",
+                )
+                items.append(ProcessedEmail(record=record, classification=cls, draft=None))
+            db.save_processed(items)
+        elapsed = time.perf_counter() - start
+        print(f"search: {n_emails} emails, {body_words} words each, indexed in {elapsed:.1f} s "
+              f"({n_emails / elapsed:.0f} emails/s), db {path.stat().st_size / 1e6:.0f} MB")
+        queries = [
+            ("very common term", vocab[0]), ("mid-frequency term", vocab[50]), ("rare term", vocab[4999]),
+            ("two terms (AND)", f"{vocab[3]} {vocab[700]}"), ("prefix", vocab[300][:3] + "*"),
+            ("phrase", f'"{vocab[0]} {vocab[1]}"'), ("sender", "user42"),
+        ]
+        for label, q in queries:
+            db.search_emails(q, limit=20)  # warm the page cache
+            times = []
+            for _ in range(20):
+                t = time.perf_counter()
+                hits, _ = db.search_emails(q, limit=20)
+                times.append(time.perf_counter() - t)
+            times.sort()
+            print(f"  {label:<20s} {q!r:<18s} p50 {times[len(times) // 2] * 1000:7.2f} ms  "
+                  f"max {times[-1] * 1000:7.2f} ms  {len(hits)} hits on page")
+
+def bench_retention(n_emails: int, days: int, archive_after_days: float, body_chars: int, seed: int):
+    """
+    Database size and read latency before and after a retention run that archives the bodies of everything
+    older than archive_after_days. The sparse-filter listing walks most of the emails table, which is what
+    keeping old bodies out of it speeds up; reading an archived email pays for decompression instead.
+    """
+    rng = random.Random(seed)
+    keywords = ["invoice", "meeting", "outage", "refund", "contract", "deadline"]
+    cls = ClassificationResult(summary="Customer reports an issue", category="CUSTOMER_SUPPORT",
+                               sentiment="neutral", priority="not_urgent", urgency_score=5)
+    draft = ResponseDraft(subject="Re: issue", body=_synthetic_text(rng, 600, keywords, 0.05), tone="professional")
+    now = datetime.utcnow()
+    with _temp_db():
+        for base in range(0, n_emails, 2000):
+            items = []
+            for i in range(base, min(base + 2000, n_emails)):
+                record = EmailRecord(
+                    id=f"ret-{i}", sender=f"user{i % 500}@example.com", subject=f"Ticket {i}",
+                    body=_synthetic_text(rng, rng.randint(body_chars // 4, body_chars), keywords, 0.05),
+                    sent_date=now - timedelta(days=days * i / n_emails), is_unread=i % 1000 == 0, source="manual",
+                )
+                items.append(ProcessedEmail(record=record, classification=cls, draft=draft))
+            db.save_processed(items)
+        db.vacuum()
+        old_ids = [f"ret-{i}" for i in rng.sample(range(n_emails // 2, n_emails), 50)]
+
+        def measure(label: str):
+            usage = db.storage_usage()
+            timings = {}
+            for name, call in (
+                ("first page", lambda: db.list_summaries_page(limit=50)),
+                ("sparse filter", lambda: db.list_summaries_page(limit=50, filters=EmailFilters(unread=True))),
+                ("category counts", db.get_counts_by_category),
+                ("old email", lambda: [db.get_processed(eid) for eid in old_ids]),
+            ):
+                call()  # warm the page cache
+                times = []
+                for _ in range(10):
+                    t = time.perf_counter()
+                    call()
+                    times.append(time.perf_counter() - t)
+                times.sort()
+                timings[name] = times[len(times) // 2] / (len(old_ids) if name == "old email" else 1)
+            print(f"  {label:<7s} db {usage['file_bytes'] / 1e6:7.1f} MB  " + "  ".join(
+                f"{name} {t * 1000:6.2f} ms" for name, t in timings.items()))
+
+        print(f"retention: {n_emails} emails over {days} days, bodies up to {body_chars} chars, "
+              f"archiving those older than {archive_after_days:g} days")
+        measure("before")
+        start = time.perf_counter()
+        status = RetentionScheduler(interval_s=0, archive_after_days=archive_after_days, delete_after_days=0).run_once(
+            vacuum=True)
+        elapsed = time.perf_counter() - start
+        if status.last_error:
+            raise SystemExit(status.last_error)
+        print(f"  archived {status.archived} in {elapsed:.1f} s: {status.text_bytes / 1e6:.1f} MB of text stored in "
+              f"{status.compressed_bytes / 1e6:.1f} MB, {status.bytes_reclaimed / 1e6:.1f} MB reclaimed")
+        measure("after")
+
+class StubGmailClient:
+    """
+    Stands in for GmailClient: every fetch sleeps for a fixed latency and returns new synthetic mail.
+    """
+    latency_s = 0.5
+    batch = 20
+    _ids = itertools.count()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def fetch_recent(self, **kwargs) -> List[EmailRecord]:
+        time.sleep(self.latency_s)
+        return [
+            e.model_copy(update={"id": f"load-{next(self._ids)}"}) for e in _synthetic_emails(self.batch)
+        ]
+
+    def fetch_since(self, history_id, **kwargs):
+        return self.fetch_recent(**kwargs), "1"
+
+def bench_queue(sizes: List[int], ops: int, idle_hours: float, seed: int):
+    """
+    Queue latency at growing depths. At each depth, `ops` rounds of push one / claim one / ack one keep the
+    depth steady with a simulated clock; before them the clock jumps `idle_hours`, so the first claim also
+    catches up on the aging that came due meanwhile.
+    """
+    rng = random.Random(seed)
+    queue = PriorityEmailQueue()
+    now = time.time()
+    ids = itertools.count()
+
+    def fill(n: int):
+        items = []
+        for _ in range(n):
+            urgency = rng.randint(1, 10)
+            record = EmailRecord(
+                id=f"q-{next(ids)}", sender="user@example.com", subject="Queued", body="",
+                sent_date=datetime.utcfromtimestamp(now - rng.uniform(0, 6 * 3600)), source="manual",
+            )
+            cls = ClassificationResult(summary="s", category="CUSTOMER_SUPPORT", sentiment="neutral",
+                                       priority="urgent" if urgency >= 7 else "not_urgent", urgency_score=urgency)
+            items.append(ProcessedEmail(record=record, classification=cls, draft=None))
+        db.save_processed(items)
+        start = time.perf_counter()
+        db.queue_push([queue._entry(p, now) for p in items], now)
+        return time.perf_counter() - start
+
+    print(f"queue: {ops} push/claim/ack rounds per depth, clock jumps {idle_hours:g} h before each")
+    with _temp_db():
+        depth = 0
+        for size in sorted(sizes):
+            push_s = 0.0
+            while depth < size:
+                n = min(5000, size - depth)
+                push_s += fill(n)
+                depth += n
+            now += idle_hours * 3600
+            catch_up = time.perf_counter()
+            db.queue_age(now)
+            catch_up = time.perf_counter() - catch_up
+            claims = []
+            for i in range(ops):
+                now += 1.0
+                fill(1)
+                start = time.perf_counter()
+                email_id = db.queue_claim(f"t{i}", now, 300)
+                db.queue_ack(email_id, f"t{i}", now)
+                claims.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            top = db.queue_peek(20, now)
+            peek_s = time.perf_counter() - start
+            claims.sort()
+            print(f"  {size:>8d} pending  push {push_s / size * 1e6:6.1f} µs/email  "
+                  f"aging catch-up {catch_up * 1000:7.1f} ms  claim+ack p50 {_percentile(claims, 0.5) * 1000:6.2f} ms  "
+                  f"p99 {_percentile(claims, 0.99) * 1000:6.2f} ms  peek(20) {peek_s * 1000:6.2f} ms  "
+                  f"top urgency {top[0].effective_urgency if top else '-'}")
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def _load(seconds: float, fetchers: int, readers: int, endpoints: List[str]):
+    import httpx  # installed with the FastAPI test client; only this benchmark needs it
+
+    latencies = {path: [] for path in endpoints}
+    fetches: List[float] = []
+    deadline = time.perf_counter() + seconds
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def read_loop(i: int):
+            for path in itertools.islice(itertools.cycle(endpoints), i, None):
+                if time.perf_counter() >= deadline:
+                    return
+                start = time.perf_counter()
+                (await client.get(path)).raise_for_status()
+                latencies[path].append(time.perf_counter() - start)
+
+        async def fetch_loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                (await client.post("/emails/fetch", json={"max_results": StubGmailClient.batch})).raise_for_status()
+                fetches.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[read_loop(i) for i in range(readers)], *[fetch_loop() for _ in range(fetchers)])
+    return latencies, fetches
+
+def bench_load(seconds: float, fetchers: int, readers: int, gmail_latency_s: float, llm_latency_s: float):
+    """
+    p50/p99 latency of the read endpoints, first idle and then while `fetchers` clients keep
+    /emails/fetch busy against stubbed Gmail and LLM backends.
+    """
+    StubGmailClient.latency_s = gmail_latency_s
+    SlowStubModel.latency_s = llm_latency_s
+    saved = (gmail_clients.client, ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model,
+             classification_cache.enabled)
+    gmail_clients.client = lambda account: StubGmailClient()
+    ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model = "stub", SlowStubModel, None
+    classification_cache.enabled = False
+    near_duplicates.enabled = False  # every fetch must pay the model latency
+    endpoints = ["/health", "/emails/summaries?limit=50", "/emails?limit=20", "/stats"]
+    try:
+        with _temp_db():
+            db.save_processed(_processed(500))
+            print(f"load: {readers} readers, {seconds:g} s per phase, "
+                  f"stub Gmail {gmail_latency_s * 1000:.0f} ms, stub LLM {llm_latency_s * 1000:.0f} ms")
+            for n_fetchers in (0, fetchers):
+                latencies, fetches = asyncio.run(_load(seconds, n_fetchers, readers, endpoints))
+                print(f"  with {n_fetchers} concurrent /emails/fetch clients ({len(fetches)} fetches completed)")
+                for path, values in latencies.items():
+                    values.sort()
+                    print(f"    {path:<28s} {len(values):6d} req  p50 {_percentile(values, 0.5) * 1000:8.1f} ms  "
+                          f"p99 {_percentile(values, 0.99) * 1000:8.1f} ms")
+    finally:
+        (gmail_clients.client, ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model,
+         classification_cache.enabled) = saved
+        near_duplicates.enabled = DEDUP_ENABLED
+
+class StageResult(NamedTuple):
+    stage: str
+    items: int
+    seconds: float
+    peak_kb: Optional[float]
+
+def _run_stage(
+    name: str, items: int, run: Callable[[], object], setup: Callable[[], None] = lambda: None, memory: bool = True,
+    repeat: int = 3,
+) -> StageResult:
+    """
+    Best of `repeat` timed runs, then (with memory) one more under tracemalloc for its peak allocation,
+    so the timing is not inflated by tracing. setup() is untimed and precedes each run.
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        seconds = min(seconds, time.perf_counter() - start)
+    peak_kb = None
+    if memory:
+        setup()
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            run()
+            peak_kb = (tracemalloc.get_traced_memory()[1] - base) / 1024
+        finally:
+            tracemalloc.stop()
+    return StageResult(name, items, seconds, peak_kb)
+
+def bench_suite(shape: MailboxShape, memory: bool, repeat: int) -> List[StageResult]:
+    """
+    Every stage of the pipeline over one synthetic mailbox, driving the real code with a fake Gmail
+    service and an instant stub LLM.
+    """
+    messages = generate_mailbox(shape)
+    service = FakeGmailService(messages)
+    client = GmailClient(service=service)
+    payloads = [m["payload"] for m in messages]
+    n = len(messages)
+
+    saved = (ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model,
+             classification_cache.enabled, SlowStubModel.latency_s)
+    ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model = "stub", SlowStubModel, None
+    classification_cache.enabled = False
+    SlowStubModel.latency_s = 0.0
+    results: List[StageResult] = []
+    try:
+        # classify_all clusters near-duplicates in the database; every pass starts from an empty index
+        with _temp_db():
+            records = client.fetch_recent(max_results=n, only_unread=False)
+            classified = classify_all(records)
+            processed = [ProcessedEmail(record=r, classification=c, draft=d) for r, (c, d) in zip(records, classified)]
+
+            results.append(_run_stage("gmail fetch (list + get + parse)", n,
+                                      lambda: client.fetch_recent(max_results=n, only_unread=False), memory=memory, repeat=repeat))
+            results.append(_run_stage("GmailClient._extract_body", n,
+                                      lambda: [client._extract_body(p) for p in payloads], memory=memory, repeat=repeat))
+            results.append(_run_stage("_heuristic_priority", n,
+                                      lambda: [ai_classifier._heuristic_priority(r.subject, r.body) for r in records],
+                                      memory=memory, repeat=repeat))
+            results.append(_run_stage("_extract_contacts", n,
+                                      lambda: [ai_classifier._extract_contacts(r.body) for r in records], memory=memory, repeat=repeat))
+            results.append(_run_stage("classify_all (stub LLM)", n, lambda: classify_all(records),
+                                      setup=db.clear_near_duplicates, memory=memory, repeat=repeat))
+            results.append(_run_stage("generate_reply", n,
+                                      lambda: [ai_classifier.generate_reply(r, c) for r, (c, _) in zip(records, classified)],
+                                      memory=memory, repeat=repeat))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            saved_path = db.DB_PATH
+            passes = itertools.count()
+
+            def fresh_db():
+                db.DB_PATH = Path(tmp) / f"suite-{next(passes)}.db"
+                db.init_db()
+
+            def save_all():
+                for i in range(0, n, 500):
+                    db.save_processed(processed[i:i + 500])
+
+            def list_all():
+                cursor = None
+                while True:
+                    _, cursor = db.list_processed_page(limit=100, cursor=cursor)
+                    if cursor is None:
+                        return
+
+            def checkpoint():
+                # Read from the main file, not from however much of the last save is still in the WAL
+                with db._conn() as con:
+                    con.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+            queue = PriorityEmailQueue()
+
+            def empty_queue():
+                with db._conn() as con:
+                    con.execute("DELETE FROM email_queue;")
+
+            def push_and_drain():
+                queue.push_many(processed)
+                while True:
+                    claimed = queue.claim()
+                    if claimed is None:
+                        return
+                    queue.ack(claimed[1].record.id, claimed[0])
+
+            try:
+                results.append(_run_stage("database.save_processed", n, save_all, setup=fresh_db, memory=memory, repeat=repeat))
+                results.append(_run_stage("list_processed (all pages)", n, list_all, setup=checkpoint,
+                                          memory=memory, repeat=repeat))
+                results.append(_run_stage("PriorityEmailQueue push + drain", n, push_and_drain,
+                                          setup=empty_queue, memory=memory, repeat=repeat))
+            finally:
+                db.DB_PATH = saved_path
+    finally:
+        (ai_classifier.GEMINI_KEY, ai_classifier.GenerativeModel, ai_classifier._model,
+         classification_cache.enabled, SlowStubModel.latency_s) = saved
+    return results
+
+def _print_suite(shape: MailboxShape, results: List[StageResult], baseline: Dict[str, Dict], tolerance: float) -> bool:
+    """
+    Prints the report; returns False when any stage's throughput fell more than `tolerance` below baseline.
+    """
+    print(f"suite: {shape.n_emails} emails, threads of {shape.thread_length[0]}-{shape.thread_length[1]}, "
+          f"bodies {shape.body_chars[0]}-{shape.body_chars[1]} chars, {shape.html_ratio:.0%} HTML, "
+          f"{shape.urgent_ratio:.0%} urgent")
+    ok = True
+    for r in results:
+        rate = r.items / r.seconds if r.seconds else float("inf")
+        line = f"  {r.stage:<34s} {r.seconds:8.3f} s  {rate:10.0f} emails/s"
+        line += f"  peak {r.peak_kb / 1024:8.1f} MB" if r.peak_kb is not None else ""
+        before = baseline.get(r.stage)
+        if before:
+            change = rate / before["emails_per_s"] - 1
+            line += f"  {change:+6.1%} vs baseline"
+            if change < -tolerance:
+                line += "  REGRESSION"
+                ok = False
+        print(line)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("classify", help="concurrent classification pipeline")
+    p.add_argument("--emails", type=int, default=64)
+    p.add_argument("--latency", type=float, default=0.05, help="stub model latency in seconds")
+    p.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    p.add_argument("--batch-size", type=int, default=1, help="emails per prompt (1 disables batch prompting)")
+
+    p = sub.add_parser("db", help="SQLite upsert throughput")
+    p.add_argument("--emails", type=int, default=2000)
+    p.add_argument("--batch", type=int, default=100, help="emails per save_processed transaction")
+
+    p = sub.add_parser("heuristics", help="keyword fallback classifier")
+    p.add_argument("--emails", type=int, default=20000)
+    p.add_argument("--body-chars", type=int, default=2000)
+    p.add_argument("--seed", type=int, default=7)
+
+    p = sub.add_parser("local-model", help="local classifier: accuracy against labels and prediction cost")
+    p.add_argument("--emails", type=int, default=10000)
+    p.add_argument("--holdout", type=float, default=0.2)
+    p.add_argument("--seed", type=int, default=7)
+
+    p = sub.add_parser("dedup", help="near-duplicate clustering: precision, recall and cost as the index grows")
+    p.add_argument("--emails", type=int, default=20000)
+    p.add_argument("--incidents", type=int, default=50)
+    p.add_argument("--copies", type=int, default=40)
+    p.add_argument("--batch", type=int, default=100, help="emails per assign() call")
+    p.add_argument("--seed", type=int, default=7)
+
+    p = sub.add_parser("retention", help="database size and read latency before and after archiving old bodies")
+    p.add_argument("--emails", type=int, default=50000)
+    p.add_argument("--days", type=int, default=365, help="span of sent dates, newest now")
+    p.add_argument("--archive-after-days", type=float, default=30)
+    p.add_argument("--body-chars", type=int, default=4000)
+    p.add_argument("--seed", type=int, default=7)
+
+    p = sub.add_parser("extraction", help="contact and keyword extraction on large bodies")
+    p.add_argument("--mb", type=float, default=4.0)
+    p.add_argument("--legacy-max-kb", type=int, default=128)
+
+    p = sub.add_parser("search", help="full-text search latency")
+    p.add_argument("--emails", type=int, default=200000)
+    p.add_argument("--body-words", type=int, default=60)
+    p.add_argument("--seed", type=int, default=7)
+
+    p = sub.add_parser("load", help="read endpoint latency while fetches run")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--fetchers", type=int, default=48, help="concurrent /emails/fetch clients")
+    p.add_argument("--readers", type=int, default=16, help="concurrent clients on the read endpoints")
+    p.add_argument("--gmail-latency", type=float, default=0.5, help="stub Gmail latency per fetch, in seconds")
+    p.add_argument("--llm-latency", type=float, default=0.2, help="stub LLM latency per call, in seconds")
+
+    p = sub.add_parser("queue", help="claim, ack, push and peek latency as the queue grows")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 300000])
+    p.add_argument("--ops", type=int, default=500)
+    p.add_argument("--idle-hours", type=float, default=1.0)
+    p.add_argument("--seed", type=int, default=7)
+
+    p = sub.add_parser("suite", help="every pipeline stage over a synthetic mailbox: throughput and peak memory")
+    p.add_argument("--emails", type=int, default=5000)
+    p.add_argument("--thread-length", type=int, nargs=2, default=[1, 6], metavar=("MIN", "MAX"))
+    p.add_argument("--body-chars", type=int, nargs=2, default=[200, 4000], metavar=("MIN", "MAX"))
+    p.add_argument("--html-ratio", type=float, default=0.5)
+    p.add_argument("--urgent-ratio", type=float, default=0.2)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--repeat", type=int, default=3, help="timed runs per stage; the fastest is reported")
+    p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    p.add_argument("--json", help="write results to this file")
+    p.add_argument("--baseline", help="results file from an earlier run to compare against")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop before failing")
+
+    args = parser.parse_args()
+    if args.bench == "classify":
+        bench_classify(args.emails, args.latency, args.levels, args.batch_size)
+    elif args.bench == "db":
+        bench_db(args.emails, args.batch)
+    elif args.bench == "heuristics":
+        bench_heuristics(args.emails, args.body_chars, args.seed)
+    elif args.bench == "local-model":
+        bench_local_model(args.emails, args.holdout, args.seed)
+    elif args.bench == "dedup":
+        bench_dedup(args.emails, args.incidents, args.copies, args.batch, args.seed)
+    elif args.bench == "retention":
+        bench_retention(args.emails, args.days, args.archive_after_days, args.body_chars, args.seed)
+    elif args.bench == "extraction":
+        bench_extraction(args.mb, args.legacy_max_kb)
+    elif args.bench == "search":
+        bench_search(args.emails, args.body_words, args.seed)
+    elif args.bench == "load":
+        bench_load(args.seconds, args.fetchers, args.readers, args.gmail_latency, args.llm_latency)
+    elif args.bench == "queue":
+        bench_queue(args.sizes, args.ops, args.idle_hours, args.seed)
+    elif args.bench == "suite":
+        shape = MailboxShape(
+            n_emails=args.emails, thread_length=tuple(args.thread_length), body_chars=tuple(args.body_chars),
+            html_ratio=args.html_ratio, urgent_ratio=args.urgent_ratio, seed=args.seed,
+        )
+        results = bench_suite(shape, memory=not args.no_memory, repeat=args.repeat)
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = {r["stage"]: r for r in json.load(f)["stages"]}
+        ok = _print_suite(shape, results, baseline, args.tolerance)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"shape": shape._asdict(), "stages": [
+                    dict(r._asdict(), emails_per_s=r.items / r.seconds if r.seconds else None) for r in results
+                ]}, f, indent=2)
+        if not ok:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .models import EmailRecord, ClassificationResult
+from . import database as db
+
+CACHE_ENABLED = os.getenv("CLASSIFY_CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_MAX_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "5000"))
+CACHE_TTL_S = float(os.getenv("CLASSIFY_CACHE_TTL_S", str(7 * 24 * 3600)))
+
+_WS = re.compile(r"\s+")
+
+def _normalize(text: Optional[str]) -> str:
+    return _WS.sub(" ", (text or "").strip()).casefold()
+
+def cache_key(email: EmailRecord, model: str, prompt_version: str) -> str:
+    """
+    Content address: identical mail (modulo case/whitespace) classified by the same model+prompt shares a key,
+    regardless of message id.
+    """
+    h = hashlib.sha256()
+    for part in (model, prompt_version, _normalize(email.sender), _normalize(email.subject), _normalize(email.body)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+class ClassificationCache:
+    """
+    In-memory LRU (size + TTL bounded) in front of the classification_cache table.
+    Thread-safe; counters are cumulative since process start.
+    """
+    def __init__(self, max_size: int = CACHE_MAX_SIZE, ttl_s: float = CACHE_TTL_S, enabled: bool = CACHE_ENABLED) -> None:
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        self._lru: "OrderedDict[str, Tuple[float, ClassificationResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ClassificationResult]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_s:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._lru[key]
+
+        row = db.get_cached_classification(key, min_created_at=now - self.ttl_s)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            created_at, payload = row
+            cls = ClassificationResult.model_validate_json(payload)
+            if cls.source is None:
+                # only model output is cached; entries written before source was tracked lack it
+                cls = cls.model_copy(update={"source": "llm"})
+            self._remember(key, created_at, cls)
+            self.hits += 1
+            self.db_hits += 1
+            return cls
+
+    def put(self, key: str, cls: ClassificationResult):
+        if not self.enabled:
+            return
+        now = time.time()
+        db.put_cached_classification(key, cls.model_dump_json(), now)
+        with self._lock:
+            self._remember(key, now, cls)
+
+    def _remember(self, key: str, created_at: float, cls: ClassificationResult):
+        self._lru[key] = (created_at, cls)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._lru),
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+classification_cache = ClassificationCache()
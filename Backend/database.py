@@ -1,15 +1,48 @@
+import os
 import sqlite3
+import threading
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-from .models import EmailRecord, ClassificationResult, ResponseDraft, ProcessedEmail
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timezone
+from .models import (
+    EmailRecord, ClassificationResult, Extraction, ResponseDraft, ProcessedEmail, EmailFilters, EmailSummary,
+    SearchHit, QueueEntry,
+)
+from .metrics import db_span
+import re
 import uuid
+import json
+import zlib
+import base64
 
 DB_PATH = Path(__file__).resolve().parent.parent / "data" / "email_assistant.db"
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-def _conn():
-    return sqlite3.connect(DB_PATH)
+# WAL lets readers proceed during a write; NORMAL sync is durable across app crashes in WAL mode
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-20000;",  # ~20 MB page cache per connection
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA busy_timeout=5000;",
+]
+
+_local = threading.local()
+
+def _conn() -> sqlite3.Connection:
+    """
+    One connection per thread (and DB path), reused across calls.
+    `with _conn() as con:` still commits or rolls back per block; it does not close the connection.
+    """
+    con = getattr(_local, "con", None)
+    if con is None or _local.path != DB_PATH:
+        con = sqlite3.connect(DB_PATH, timeout=5.0)
+        for pragma in PRAGMAS:
+            con.execute(pragma)
+        con.create_function("cold_text", 2, cold_text, deterministic=True)
+        _local.con, _local.path = con, DB_PATH
+    return con
 
 def init_db():
     with _conn() as con:
@@ -37,8 +70,14 @@ def init_db():
             requires_response INTEGER,
             confidence REAL,
             extraction_json TEXT,
+            source TEXT,
             FOREIGN KEY(email_id) REFERENCES emails(id) ON DELETE CASCADE
         );""")
+        _add_column(cur, "classifications", "source", "TEXT")  # databases created before it existed
+        # rows stored before source existed: the heuristic fallbacks were the only writers of these confidences
+        cur.execute("""
+        UPDATE classifications SET source = CASE WHEN confidence IN (0.6, 0.55) THEN 'heuristic' ELSE 'llm' END
+        WHERE source IS NULL;""")
         cur.execute("""
         CREATE TABLE IF NOT EXISTS drafts (
             email_id TEXT PRIMARY KEY,
@@ -50,114 +89,1123 @@ def init_db():
             reasoning TEXT,
             FOREIGN KEY(email_id) REFERENCES emails(id) ON DELETE CASCADE
         );""")
+        # Listing order / keyset cursor, and the /emails filters
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_emails_sent_date ON emails(sent_date, id);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_emails_thread ON emails(thread_id, sent_date);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_classifications_category ON classifications(category);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_classifications_priority ON classifications(priority);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_classifications_urgency ON classifications(urgency_score);")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS classification_cache (
+            key TEXT PRIMARY KEY,
+            result_json TEXT,
+            created_at REAL
+        );""")
+        # Durable work queue: one row per email id; acked rows are kept so re-fetched mail is not re-queued
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS email_queue (
+            email_id TEXT PRIMARY KEY,
+            priority INTEGER NOT NULL,  -- effective priority (-urgency, raised by aging); lower pops first
+            enqueued_at REAL NOT NULL,
+            claim_token TEXT,
+            claimed_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            acked_at REAL,
+            cluster_id TEXT,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            base_priority INTEGER,  -- priority before aging
+            sent_at REAL,  -- the SLA clock starts here
+            sla_s REAL,
+            next_age_at REAL  -- when priority next goes up; NULL once it is at the top (or never ages)
+        );""")
+        _add_column(cur, "email_queue", "cluster_id", "TEXT")
+        _add_column(cur, "email_queue", "duplicates", "INTEGER NOT NULL DEFAULT 0")
+        for column in ("base_priority INTEGER", "sent_at REAL", "sla_s REAL", "next_age_at REAL"):
+            _add_column(cur, "email_queue", *column.split())
+        # entries queued before aging existed keep their priority and are ordered by enqueue time
+        cur.execute("UPDATE email_queue SET base_priority = priority, sent_at = enqueued_at WHERE sent_at IS NULL;")
+        cur.execute("DROP INDEX IF EXISTS idx_email_queue_pending;")
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_email_queue_schedule ON email_queue(priority, sent_at, enqueued_at)
+        WHERE acked_at IS NULL;""")
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_email_queue_aging ON email_queue(next_age_at)
+        WHERE acked_at IS NULL AND next_age_at IS NOT NULL;""")
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_email_queue_cluster ON email_queue(cluster_id)
+        WHERE acked_at IS NULL AND cluster_id IS NOT NULL;""")
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );""")
+        _init_stats(cur)
+        _normalize_sent_dates(cur)  # after stats: their triggers move the rewritten emails to UTC hour buckets
+        _init_cold_storage(cur)  # before search: its triggers look at cold_bodies
+        _init_search(cur)
+        _init_near_duplicates(cur)
         con.commit()
 
-def upsert_email(record: EmailRecord):
+def _add_column(cur: sqlite3.Cursor, table: str, column: str, decl: str):
+    if column not in {r[1] for r in cur.execute(f"PRAGMA table_info({table});")}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
+def _utc_iso(dt: datetime) -> str:
+    """
+    sent_date as stored and compared: naive UTC in ISO-8601, which sorts chronologically as text.
+    Naive datetimes are taken to be UTC already, like Gmail and importer records.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+def _normalize_sent_dates(cur: sqlite3.Cursor) -> int:
+    """
+    Rewrites sent_date values stored with a UTC offset (before writes normalized them). Returns how many.
+    """
+    rows = cur.execute("""
+    SELECT id, sent_date FROM emails
+    WHERE sent_date GLOB '*[+-][0-9][0-9]:[0-9][0-9]*' OR sent_date GLOB '*Z';""").fetchall()
+    fixed = []
+    for email_id, sent_date in rows:
+        try:
+            fixed.append((_utc_iso(datetime.fromisoformat(sent_date)), email_id))
+        except ValueError:
+            continue
+    cur.executemany("UPDATE emails SET sent_date = ? WHERE id = ?;", fixed)
+    return len(fixed)
+
+_EMAIL_UPSERT = """
+INSERT INTO emails (id, thread_id, sender, subject, body, sent_date, snippet, is_unread, source)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+  thread_id=excluded.thread_id,
+  sender=excluded.sender,
+  subject=excluded.subject,
+  body=excluded.body,
+  sent_date=excluded.sent_date,
+  snippet=excluded.snippet,
+  is_unread=excluded.is_unread,
+  source=excluded.source;
+"""
+
+_CLASSIFICATION_UPSERT = """
+INSERT INTO classifications (email_id, summary, category, sentiment, priority, urgency_score,
+    requires_response, confidence, extraction_json, source)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(email_id) DO UPDATE SET
+  summary=excluded.summary,
+  category=excluded.category,
+  sentiment=excluded.sentiment,
+  priority=excluded.priority,
+  urgency_score=excluded.urgency_score,
+  requires_response=excluded.requires_response,
+  confidence=excluded.confidence,
+  extraction_json=excluded.extraction_json,
+  source=excluded.source;
+"""
+
+_DRAFT_UPSERT = """
+INSERT INTO drafts (email_id, subject, body, tone, confidence, auto_send_recommended, reasoning)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(email_id) DO UPDATE SET
+  subject=excluded.subject,
+  body=excluded.body,
+  tone=excluded.tone,
+  confidence=excluded.confidence,
+  auto_send_recommended=excluded.auto_send_recommended,
+  reasoning=excluded.reasoning;
+"""
+
+def _email_row(record: EmailRecord) -> tuple:
     if not record.id:   #  auto-generate when missing
         record.id = str(uuid.uuid4())
+    return (
+        record.id, record.thread_id, record.sender, record.subject, record.body,
+        _utc_iso(record.sent_date), record.snippet, int(record.is_unread), record.source
+    )
+
+def _classification_row(email_id: str, cls: ClassificationResult) -> tuple:
+    return (
+        email_id, cls.summary, cls.category, cls.sentiment, cls.priority,
+        cls.urgency_score, int(cls.requires_response), cls.confidence,
+        json.dumps(cls.extraction.dict()), cls.source
+    )
+
+def _draft_row(email_id: str, draft: ResponseDraft) -> tuple:
+    return (
+        email_id, draft.subject, draft.body, draft.tone, draft.confidence,
+        int(draft.auto_send_recommended), draft.reasoning
+    )
+
+def upsert_email(record: EmailRecord):
     with _conn() as con:
-        con.execute("""
-        INSERT INTO emails (id, thread_id, sender, subject, body, sent_date, snippet, is_unread, source)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(id) DO UPDATE SET
-          thread_id=excluded.thread_id,
-          sender=excluded.sender,
-          subject=excluded.subject,
-          body=excluded.body,
-          sent_date=excluded.sent_date,
-          snippet=excluded.snippet,
-          is_unread=excluded.is_unread,
-          source=excluded.source;
-        """, (
-            record.id, record.thread_id, record.sender, record.subject, record.body,
-            record.sent_date.isoformat(), record.snippet, int(record.is_unread), record.source
-        ))
+        con.execute(_EMAIL_UPSERT, _email_row(record))
 
 def upsert_classification(email_id: str, cls: ClassificationResult):
-    import json
     with _conn() as con:
-        con.execute("""
-        INSERT INTO classifications (email_id, summary, category, sentiment, priority, urgency_score,
-            requires_response, confidence, extraction_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(email_id) DO UPDATE SET
-          summary=excluded.summary,
-          category=excluded.category,
-          sentiment=excluded.sentiment,
-          priority=excluded.priority,
-          urgency_score=excluded.urgency_score,
-          requires_response=excluded.requires_response,
-          confidence=excluded.confidence,
-          extraction_json=excluded.extraction_json;
-        """, (
-            email_id, cls.summary, cls.category, cls.sentiment, cls.priority,
-            cls.urgency_score, int(cls.requires_response), cls.confidence,
-            json.dumps(cls.extraction.dict())
-        ))
+        con.execute(_CLASSIFICATION_UPSERT, _classification_row(email_id, cls))
 
 def upsert_draft(email_id: str, draft: ResponseDraft):
+    with _conn() as con:
+        con.execute(_DRAFT_UPSERT, _draft_row(email_id, draft))
+
+def upsert_emails(records: List[EmailRecord]):
+    with _conn() as con:
+        con.executemany(_EMAIL_UPSERT, [_email_row(r) for r in records])
+
+def save_processed(items: List[ProcessedEmail]):
+    """
+    Bulk upsert of emails, classifications and drafts in a single transaction.
+    """
+    with db_span("save_processed"), _conn() as con:
+        with db_span("upsert_emails"):
+            con.executemany(_EMAIL_UPSERT, [_email_row(p.record) for p in items])
+        with db_span("upsert_classifications"):
+            con.executemany(_CLASSIFICATION_UPSERT, [
+                _classification_row(p.record.id, p.classification) for p in items if p.classification is not None
+            ])
+        with db_span("upsert_drafts"):
+            con.executemany(_DRAFT_UPSERT, [_draft_row(p.record.id, p.draft) for p in items if p.draft is not None])
+
+def get_cached_classification(key: str, min_created_at: float) -> Optional[Tuple[float, str]]:
+    with db_span("cache_get"), _conn() as con:
+        row = con.execute("""
+        SELECT created_at, result_json FROM classification_cache WHERE key = ? AND created_at >= ?;
+        """, (key, min_created_at)).fetchone()
+    return (row[0], row[1]) if row else None
+
+def put_cached_classification(key: str, result_json: str, created_at: float):
     with _conn() as con:
         con.execute("""
-        INSERT INTO drafts (email_id, subject, body, tone, confidence, auto_send_recommended, reasoning)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(email_id) DO UPDATE SET
-          subject=excluded.subject,
-          body=excluded.body,
-          tone=excluded.tone,
-          confidence=excluded.confidence,
-          auto_send_recommended=excluded.auto_send_recommended,
-          reasoning=excluded.reasoning;
-        """, (
-            email_id, draft.subject, draft.body, draft.tone, draft.confidence,
-            int(draft.auto_send_recommended), draft.reasoning
-        ))
+        INSERT INTO classification_cache (key, result_json, created_at) VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET result_json=excluded.result_json, created_at=excluded.created_at;
+        """, (key, result_json, created_at))
 
-def list_processed(limit: int = 100) -> List[ProcessedEmail]:
-    import json
+def purge_classification_cache(older_than: float) -> int:
     with _conn() as con:
-        rows = con.execute("""
-        SELECT e.id, e.thread_id, e.sender, e.subject, e.body, e.sent_date, e.snippet, e.is_unread, e.source,
-               c.summary, c.category, c.sentiment, c.priority, c.urgency_score, c.requires_response, c.confidence, c.extraction_json,
-               d.subject, d.body, d.tone, d.confidence, d.auto_send_recommended, d.reasoning
+        return con.execute("DELETE FROM classification_cache WHERE created_at < ?;", (older_than,)).rowcount
+
+def get_sync_state(key: str) -> Optional[str]:
+    with _conn() as con:
+        row = con.execute("SELECT value FROM sync_state WHERE key = ?;", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_sync_state(key: str, value: str):
+    with _conn() as con:
+        con.execute("""
+        INSERT INTO sync_state (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value;
+        """, (key, value))
+
+def encode_cursor(sent_date: str, email_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sent_date, email_id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        sent_date, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return _utc_iso(datetime.fromisoformat(sent_date)), str(email_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _listing_where(cursor: Optional[str], filters: Optional[EmailFilters]) -> Tuple[str, List[Any]]:
+    where: List[str] = []
+    params: List[Any] = []
+    if cursor:
+        where.append("(e.sent_date, e.id) < (?, ?)")
+        params += list(decode_cursor(cursor))
+    f = filters or EmailFilters()
+    for column, value in (("c.category", f.category), ("c.priority", f.priority), ("c.sentiment", f.sentiment)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if f.min_urgency is not None:
+        where.append("c.urgency_score >= ?")
+        params.append(f.min_urgency)
+    if f.unread is not None:
+        where.append("e.is_unread = ?")
+        params.append(int(f.unread))
+    if f.since is not None:
+        where.append("e.sent_date >= ?")
+        params.append(_utc_iso(f.since))
+    if f.until is not None:
+        where.append("e.sent_date < ?")
+        params.append(_utc_iso(f.until))
+    return ("WHERE " + " AND ".join(where) if where else ""), params
+
+def _next_page(rows: list, limit: int, date_col: int, id_col: int) -> Tuple[list, Optional[str]]:
+    # Queries fetch limit + 1 rows; the extra one only signals that another page exists
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][date_col], rows[-1][id_col])
+
+def list_processed_page(
+    limit: int = 100, cursor: Optional[str] = None, filters: Optional[EmailFilters] = None
+) -> Tuple[List[ProcessedEmail], Optional[str]]:
+    """
+    Newest-first page of processed emails plus the cursor for the next page (None on the last page).
+    Keyset pagination on (sent_date, id) walks idx_emails_sent_date, so deep pages cost the same as the first.
+    sent_date is stored as naive UTC ISO-8601 text, which sorts chronologically without wrapping it in datetime().
+    """
+    where, params = _listing_where(cursor, filters)
+    with db_span("list_processed"), _conn() as con:
+        rows = con.execute(f"""
+        SELECT e.id, e.thread_id, e.sender, e.subject, COALESCE(e.body, cold_text(k.codec, k.body)),
+               e.sent_date, e.snippet, e.is_unread, e.source,
+               c.summary, c.category, c.sentiment, c.priority, c.urgency_score, c.requires_response, c.confidence,
+               COALESCE(c.extraction_json, cold_text(k.codec, k.extraction)), c.source,
+               d.subject, COALESCE(d.body, cold_text(k.codec, k.draft_body)), d.tone, d.confidence,
+               d.auto_send_recommended, d.reasoning
+        FROM emails e
+        LEFT JOIN classifications c ON c.email_id = e.id
+        LEFT JOIN drafts d ON d.email_id = e.id
+        LEFT JOIN cold_bodies k ON k.email_id = e.id
+        {where}
+        ORDER BY e.sent_date DESC, e.id DESC
+        LIMIT ?;""", (*params, limit + 1)).fetchall()
+
+    rows, next_cursor = _next_page(rows, limit, 5, 0)
+    return [_row_to_processed(r) for r in rows], next_cursor
+
+def list_summaries_page(
+    limit: int = 100, cursor: Optional[str] = None, filters: Optional[EmailFilters] = None
+) -> Tuple[List[EmailSummary], Optional[str]]:
+    """
+    Same ordering and filters as list_processed_page, but never reads bodies, drafts or extraction JSON.
+    """
+    where, params = _listing_where(cursor, filters)
+    with db_span("list_summaries"), _conn() as con:
+        rows = con.execute(f"""
+        SELECT e.id, e.thread_id, e.sender, e.subject, e.snippet, e.sent_date, e.is_unread,
+               c.summary, c.category, c.sentiment, c.priority, c.urgency_score,
+               EXISTS(SELECT 1 FROM drafts d WHERE d.email_id = e.id)
+        FROM emails e
+        LEFT JOIN classifications c ON c.email_id = e.id
+        {where}
+        ORDER BY e.sent_date DESC, e.id DESC
+        LIMIT ?;""", (*params, limit + 1)).fetchall()
+
+    rows, next_cursor = _next_page(rows, limit, 5, 0)
+    return [_row_to_summary(r) for r in rows], next_cursor
+
+def _row_to_summary(r: tuple) -> EmailSummary:
+    eid, thr, snd, sub, snip, sdate, unread, csum, ccat, csent, cpri, curg, has_draft = r
+    return EmailSummary(
+        id=eid, thread_id=thr, sender=snd, subject=sub, snippet=snip,
+        sent_date=datetime.fromisoformat(sdate), is_unread=bool(unread),
+        summary=csum, category=ccat, sentiment=csent, priority=cpri, urgency_score=curg,
+        has_draft=bool(has_draft),
+    )
+
+def get_processed_many(email_ids: List[str]) -> Dict[str, ProcessedEmail]:
+    found: Dict[str, ProcessedEmail] = {}
+    with db_span("get_processed_many"), _conn() as con:
+        # stay under SQLite's bound-parameter limit
+        for start in range(0, len(email_ids), 500):
+            chunk = email_ids[start:start + 500]
+            rows = con.execute(f"""
+            SELECT e.id, e.thread_id, e.sender, e.subject, COALESCE(e.body, cold_text(k.codec, k.body)),
+                   e.sent_date, e.snippet, e.is_unread, e.source,
+                   c.summary, c.category, c.sentiment, c.priority, c.urgency_score, c.requires_response, c.confidence,
+                   COALESCE(c.extraction_json, cold_text(k.codec, k.extraction)), c.source,
+                   d.subject, COALESCE(d.body, cold_text(k.codec, k.draft_body)), d.tone, d.confidence,
+                   d.auto_send_recommended, d.reasoning
+            FROM emails e
+            LEFT JOIN classifications c ON c.email_id = e.id
+            LEFT JOIN drafts d ON d.email_id = e.id
+            LEFT JOIN cold_bodies k ON k.email_id = e.id
+            WHERE e.id IN ({",".join("?" * len(chunk))}) AND c.email_id IS NOT NULL;""", chunk).fetchall()
+            for r in rows:
+                found[r[0]] = _row_to_processed(r)
+    return found
+
+def get_thread_context(thread_id: str, exclude_ids: List[str], limit: int) -> List[Tuple[str, str, str, str]]:
+    """
+    Up to `limit` most recent stored messages of a thread as (id, sender, sent_date, text), oldest first.
+    text is the stored summary when the message was classified, else its snippet.
+    """
+    with _conn() as con:
+        rows = con.execute(f"""
+        SELECT e.id, e.sender, e.sent_date, COALESCE(c.summary, e.snippet, substr(e.body, 1, 200))
+        FROM emails e
+        LEFT JOIN classifications c ON c.email_id = e.id
+        WHERE e.thread_id = ? AND e.id NOT IN ({",".join("?" * len(exclude_ids))})
+        ORDER BY e.sent_date DESC
+        LIMIT ?;""", (thread_id, *exclude_ids, limit)).fetchall()
+    return [tuple(r) for r in reversed(rows)]
+
+def get_labelled_examples(limit: int, body_chars: int = 2000) -> List[tuple]:
+    """
+    Training data for the local model: the newest `limit` LLM-labelled emails as
+    (id, sender, subject, body, category, sentiment, priority, urgency_score, requires_response).
+    """
+    with _conn() as con:
+        return con.execute("""
+        SELECT e.id, e.sender, e.subject, substr(COALESCE(e.body, cold_text(k.codec, k.body)), 1, ?), c.category,
+               c.sentiment, c.priority, c.urgency_score, c.requires_response
+        FROM classifications c
+        JOIN emails e ON e.id = c.email_id
+        LEFT JOIN cold_bodies k ON k.email_id = e.id
+        WHERE c.source = 'llm'
+        ORDER BY e.sent_date DESC
+        LIMIT ?;""", (body_chars, limit)).fetchall()
+
+def get_processed(email_id: str) -> Optional[ProcessedEmail]:
+    with db_span("get_processed"), _conn() as con:
+        row = con.execute("""
+        SELECT e.id, e.thread_id, e.sender, e.subject, COALESCE(e.body, cold_text(k.codec, k.body)),
+               e.sent_date, e.snippet, e.is_unread, e.source,
+               c.summary, c.category, c.sentiment, c.priority, c.urgency_score, c.requires_response, c.confidence,
+               COALESCE(c.extraction_json, cold_text(k.codec, k.extraction)), c.source,
+               d.subject, COALESCE(d.body, cold_text(k.codec, k.draft_body)), d.tone, d.confidence,
+               d.auto_send_recommended, d.reasoning
         FROM emails e
         LEFT JOIN classifications c ON c.email_id = e.id
         LEFT JOIN drafts d ON d.email_id = e.id
-        ORDER BY datetime(e.sent_date) DESC
-        LIMIT ?;""", (limit,)).fetchall()
-
-    result: List[ProcessedEmail] = []
-    for r in rows:
-        (eid, thr, snd, sub, body, sdate, snip, unread, source,
-         csum, ccat, csent, cpri, curg, creq, cconf, cext,
-         dsubj, dbody, dtone, dconf, dauto, dreas) = r
-
-        record = EmailRecord(
-            id=eid, thread_id=thr, sender=snd, subject=sub, body=body,
-            sent_date=datetime.fromisoformat(sdate), snippet=snip, is_unread=bool(unread), source=source
+        LEFT JOIN cold_bodies k ON k.email_id = e.id
+        WHERE e.id = ?;""", (email_id,)).fetchone()
+    return _row_to_processed(row) if row else None
+
+def list_processed(limit: int = 100) -> List[ProcessedEmail]:
+    return list_processed_page(limit=limit)[0]
+
+def _row_to_processed(r: tuple) -> ProcessedEmail:
+    (eid, thr, snd, sub, body, sdate, snip, unread, source,
+     csum, ccat, csent, cpri, curg, creq, cconf, cext, csrc,
+     dsubj, dbody, dtone, dconf, dauto, dreas) = r
+
+    record = EmailRecord(
+        id=eid, thread_id=thr, sender=snd, subject=sub, body=body,
+        sent_date=datetime.fromisoformat(sdate), snippet=snip, is_unread=bool(unread), source=source
+    )
+    classification = None
+    if csum is not None:
+        extraction = Extraction(**(json.loads(cext) if cext else {}))
+        classification = ClassificationResult(
+            summary=csum, category=ccat, sentiment=csent,
+            priority=cpri, urgency_score=curg, requires_response=bool(creq),
+            confidence=cconf, extraction=extraction, source=csrc
         )
-        classification = None
-        if csum is not None:
-            from .models import Extraction, ClassificationResult
-            import json
-            extraction = Extraction(**(json.loads(cext) if cext else {}))
-            classification = ClassificationResult(
-                summary=csum, category=ccat, sentiment=csent,
-                priority=cpri, urgency_score=curg, requires_response=bool(creq),
-                confidence=cconf, extraction=extraction
-            )
-        draft = None
-        if dsubj is not None:
-            from .models import ResponseDraft
-            draft = ResponseDraft(
-                subject=dsubj, body=dbody, tone=dtone or "professional",
-                confidence=dconf or 0.7, auto_send_recommended=bool(dauto), reasoning=dreas
-            )
-        result.append(ProcessedEmail(record=record, classification=classification, draft=draft))
-    return result
+    draft = None
+    if dsubj is not None:
+        draft = ResponseDraft(
+            subject=dsubj, body=dbody, tone=dtone or "professional",
+            confidence=dconf or 0.7, auto_send_recommended=bool(dauto), reasoning=dreas
+        )
+    return ProcessedEmail(record=record, classification=classification, draft=draft)
+
+# Materialized counters for /stats, kept current by triggers inside the same transaction as the write.
+# metric: category | priority | sentiment | drafts; bucket: '' for all time, else the sent_date hour (YYYY-MM-DDTHH),
+# in UTC like sent_date itself.
+_NO_BUCKET = "0000-00-00T00"  # sorts before every real hour, so time windows skip it
+_STATS_BUCKET = "COALESCE((SELECT substr(sent_date, 1, 13) FROM emails WHERE id = {row}.email_id), '" + _NO_BUCKET + "')"
+
+def _stats_delta(row: str, sign: int) -> str:
+    bucket = _STATS_BUCKET.format(row=row)
+    values = ", ".join(
+        f"('{metric}', {row}.{metric}, '', {sign}), ('{metric}', {row}.{metric}, {bucket}, {sign})"
+        for metric in ("category", "priority", "sentiment")
+    )
+    return f"""
+        INSERT INTO stats_counters (metric, value, bucket, n) VALUES {values}
+        ON CONFLICT(metric, value, bucket) DO UPDATE SET n = n + excluded.n;"""
+
+def _drafts_delta(row: str, sign: int) -> str:
+    return f"""
+        INSERT INTO stats_counters (metric, value, bucket, n)
+        VALUES ('drafts', 'created', '', {sign}), ('drafts', 'created', {_STATS_BUCKET.format(row=row)}, {sign})
+        ON CONFLICT(metric, value, bucket) DO UPDATE SET n = n + excluded.n;"""
+
+def _stats_move(sign: int, sent_date: str) -> str:
+    # every counter of one email, added to or taken from the hour bucket of the given sent_date
+    bucket = f"COALESCE(substr({sent_date}, 1, 13), '{_NO_BUCKET}')"
+    statements = [f"""
+        INSERT INTO stats_counters (metric, value, bucket, n)
+        SELECT '{metric}', {metric}, {bucket}, {sign} FROM classifications WHERE email_id = NEW.id
+        ON CONFLICT(metric, value, bucket) DO UPDATE SET n = n + excluded.n;"""
+        for metric in ("category", "priority", "sentiment")
+    ]
+    statements.append(f"""
+        INSERT INTO stats_counters (metric, value, bucket, n)
+        SELECT 'drafts', 'created', {bucket}, {sign} FROM drafts WHERE email_id = NEW.id
+        ON CONFLICT(metric, value, bucket) DO UPDATE SET n = n + excluded.n;""")
+    return "".join(statements)
+
+def _init_stats(cur: sqlite3.Cursor):
+    exists = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters';").fetchone()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        metric TEXT NOT NULL,
+        value TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (metric, value, bucket)
+    ) WITHOUT ROWID;""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_stats_bucket ON stats_counters(bucket);")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_cls_insert AFTER INSERT ON classifications BEGIN
+        {_stats_delta("NEW", 1)}
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_cls_update AFTER UPDATE OF category, priority, sentiment ON classifications
+    WHEN OLD.category IS NOT NEW.category OR OLD.priority IS NOT NEW.priority OR OLD.sentiment IS NOT NEW.sentiment
+    BEGIN
+        {_stats_delta("OLD", -1)}
+        {_stats_delta("NEW", 1)}
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_cls_delete AFTER DELETE ON classifications BEGIN
+        {_stats_delta("OLD", -1)}
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_draft_insert AFTER INSERT ON drafts BEGIN
+        {_drafts_delta("NEW", 1)}
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_draft_delete AFTER DELETE ON drafts BEGIN
+        {_drafts_delta("OLD", -1)}
+    END;""")
+    # a re-fetched email whose sent_date moved to another hour takes its counters along
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_email_sent_date AFTER UPDATE OF sent_date ON emails
+    WHEN substr(OLD.sent_date, 1, 13) IS NOT substr(NEW.sent_date, 1, 13)
+    BEGIN
+        {_stats_move(-1, "OLD.sent_date")}
+        {_stats_move(1, "NEW.sent_date")}
+    END;""")
+    if not exists:
+        # First start on a database that predates the counters: backfill them
+        _rebuild_stats(cur)
+
+def _rebuild_stats(cur):
+    cur.execute("DELETE FROM stats_counters;")
+    for metric in ("category", "priority", "sentiment"):
+        for bucket in ("''", f"COALESCE(substr(e.sent_date, 1, 13), '{_NO_BUCKET}')"):
+            cur.execute(f"""
+            INSERT INTO stats_counters (metric, value, bucket, n)
+            SELECT '{metric}', c.{metric}, {bucket}, COUNT(*)
+            FROM classifications c LEFT JOIN emails e ON e.id = c.email_id
+            GROUP BY 2, 3;""")
+    for bucket in ("''", f"COALESCE(substr(e.sent_date, 1, 13), '{_NO_BUCKET}')"):
+        cur.execute(f"""
+        INSERT INTO stats_counters (metric, value, bucket, n)
+        SELECT 'drafts', 'created', {bucket}, COUNT(*)
+        FROM drafts d LEFT JOIN emails e ON e.id = d.email_id
+        GROUP BY 3;""")
+
+def rebuild_stats():
+    """
+    Recomputes every counter from the base tables (recovery after manual edits or a crash mid-migration).
+    """
+    con = _conn()
+    with con:
+        con.execute("BEGIN IMMEDIATE;")
+        _rebuild_stats(con.cursor())
+
+def get_stats(since_bucket: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    {metric: {value: count}} from the counters: all-time totals, or summed over hour buckets >= since_bucket.
+    """
+    with db_span("get_stats"), _conn() as con:
+        if since_bucket is None:
+            rows = con.execute("SELECT metric, value, n FROM stats_counters WHERE bucket = '' AND n != 0;").fetchall()
+        else:
+            rows = con.execute("""
+            SELECT metric, value, SUM(n) FROM stats_counters WHERE bucket != '' AND bucket >= ?
+            GROUP BY metric, value HAVING SUM(n) != 0;""", (since_bucket,)).fetchall()
+    out: Dict[str, Dict[str, int]] = {}
+    for metric, value, n in rows:
+        out.setdefault(metric, {})[value] = n
+    return out
+
+def get_hourly_counts(metric: str, since_bucket: str) -> Dict[str, Dict[str, int]]:
+    """
+    {hour bucket: {value: count}} for one metric, for dashboard timelines.
+    """
+    with _conn() as con:
+        rows = con.execute("""
+        SELECT bucket, value, n FROM stats_counters
+        WHERE metric = ? AND bucket != '' AND bucket >= ? AND n != 0 ORDER BY bucket;
+        """, (metric, since_bucket)).fetchall()
+    out: Dict[str, Dict[str, int]] = {}
+    for bucket, value, n in rows:
+        out.setdefault(bucket, {})[value] = n
+    return out
 
 def get_counts_by_category() -> Dict[str, int]:
+    return get_stats().get("category", {})
+
+# Full-text search over subject, sender, body and classification summary, kept current by triggers.
+# FTS rows are keyed by search_docs.docid rather than emails.rowid, which VACUUM may renumber.
+SEARCH_COLUMNS = ("subject", "sender", "body", "summary")
+SEARCH_RANK = "bm25(10.0, 4.0, 1.0, 3.0)"  # per-column weights, in SEARCH_COLUMNS order
+HIGHLIGHT_START, HIGHLIGHT_END = "<mark>", "</mark>"
+_SEARCH_DOCID = "(SELECT docid FROM search_docs WHERE email_id = {row})"
+_SEARCH_TERM = re.compile(r'"([^"]*)"|([^\s"]+)')
+_FTS_TOKEN = re.compile(r"\w+")
+
+def _init_search(cur: sqlite3.Cursor):
+    exists = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts';").fetchone()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS search_docs (
+        docid INTEGER PRIMARY KEY,
+        email_id TEXT NOT NULL UNIQUE
+    );""")
+    # prefix indexes turn short prefix terms ("in*", "inv*") into a single index lookup
+    cur.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+        {", ".join(SEARCH_COLUMNS)},
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    );""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_search_email_insert AFTER INSERT ON emails BEGIN
+        INSERT OR IGNORE INTO search_docs (email_id) VALUES (NEW.id);
+        INSERT INTO emails_fts (rowid, subject, sender, body, summary)
+        VALUES ({_SEARCH_DOCID.format(row="NEW.id")}, NEW.subject, NEW.sender, NEW.body,
+                (SELECT summary FROM classifications WHERE email_id = NEW.id));
+    END;""")
+    # Upserts of unchanged mail (every re-fetch) leave the index alone, and so does moving a body to
+    # cold storage: the index keeps its text
+    cur.execute("DROP TRIGGER IF EXISTS trg_search_email_update;")  # replaces the version without the cold check
+    cur.execute(f"""
+    CREATE TRIGGER trg_search_email_update AFTER UPDATE OF subject, sender, body ON emails
+    WHEN OLD.subject IS NOT NEW.subject OR OLD.sender IS NOT NEW.sender
+      OR (OLD.body IS NOT NEW.body AND NOT (NEW.body IS NULL AND {_COLD_EXISTS.format(row="NEW.id")}))
+    BEGIN
+        UPDATE emails_fts SET subject = NEW.subject, sender = NEW.sender,
+            body = CASE WHEN NEW.body IS NULL AND {_COLD_EXISTS.format(row="NEW.id")} THEN body ELSE NEW.body END
+        WHERE rowid = {_SEARCH_DOCID.format(row="NEW.id")};
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_search_email_delete AFTER DELETE ON emails BEGIN
+        DELETE FROM emails_fts WHERE rowid = {_SEARCH_DOCID.format(row="OLD.id")};
+        DELETE FROM search_docs WHERE email_id = OLD.id;
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_search_cls_insert AFTER INSERT ON classifications BEGIN
+        UPDATE emails_fts SET summary = NEW.summary WHERE rowid = {_SEARCH_DOCID.format(row="NEW.email_id")};
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_search_cls_update AFTER UPDATE OF summary ON classifications
+    WHEN OLD.summary IS NOT NEW.summary
+    BEGIN
+        UPDATE emails_fts SET summary = NEW.summary WHERE rowid = {_SEARCH_DOCID.format(row="NEW.email_id")};
+    END;""")
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_search_cls_delete AFTER DELETE ON classifications BEGIN
+        UPDATE emails_fts SET summary = NULL WHERE rowid = {_SEARCH_DOCID.format(row="OLD.email_id")};
+    END;""")
+    if not exists:
+        cur.execute("INSERT INTO emails_fts (emails_fts, rank) VALUES ('rank', ?);", (SEARCH_RANK,))
+        _rebuild_search(cur)
+
+def _rebuild_search(cur):
+    cur.execute("DELETE FROM emails_fts;")
+    cur.execute("DELETE FROM search_docs WHERE email_id NOT IN (SELECT id FROM emails);")
+    cur.execute("INSERT OR IGNORE INTO search_docs (email_id) SELECT id FROM emails;")
+    cur.execute("""
+    INSERT INTO emails_fts (rowid, subject, sender, body, summary)
+    SELECT s.docid, e.subject, e.sender, COALESCE(e.body, cold_text(k.codec, k.body)), c.summary
+    FROM emails e
+    JOIN search_docs s ON s.email_id = e.id
+    LEFT JOIN classifications c ON c.email_id = e.id
+    LEFT JOIN cold_bodies k ON k.email_id = e.id;""")
+
+def rebuild_search_index():
+    """
+    Re-indexes every stored email, then merges the index into as few b-trees as possible.
+    """
+    con = _conn()
+    with con:
+        con.execute("BEGIN IMMEDIATE;")
+        _rebuild_search(con.cursor())
+    with con:
+        con.execute("INSERT INTO emails_fts (emails_fts) VALUES ('optimize');")
+
+def fts_query(text: str) -> str:
+    """
+    Turns free text into a safe FTS5 query: every word must match, "quoted phrases" match as phrases,
+    and a word ending in * matches as a prefix (inv* → invoice, invoices). Raises ValueError when
+    nothing searchable is left.
+    Prefix terms are opt-in: they merge the postings of every matching word, which is the one query
+    shape whose cost grows with the mailbox.
+    """
+    terms: List[str] = []
+    for phrase, word in _SEARCH_TERM.findall(text or ""):
+        tokens = _FTS_TOKEN.findall(phrase or word)
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"' + ("*" if word.endswith("*") else ""))
+    if not terms:
+        raise ValueError("Empty search query")
+    return " ".join(terms)
+
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("ascii")
+
+def decode_search_cursor(cursor: str) -> int:
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+def search_emails(
+    query: str, limit: int = 20, cursor: Optional[str] = None, filters: Optional[EmailFilters] = None
+) -> Tuple[List[SearchHit], Optional[str]]:
+    """
+    Best-matching emails first (weighted BM25), with the matched terms wrapped in HIGHLIGHT_START/END
+    in the subject and in a short snippet of the best-matching column.
+
+    Every match is ranked, newest first among equal scores; SQLite keeps only the top offset + limit
+    while sorting, so memory stays bounded however common the term. Highlighting then runs only for the
+    rows on the page.
+    """
+    offset = decode_search_cursor(cursor) if cursor else 0
+    match = fts_query(query)
+    where, params = _listing_where(None, filters)
+    where = where.replace("WHERE ", "AND ", 1)
+    with db_span("search"), _conn() as con:
+        ranked = con.execute(f"""
+        SELECT f.rowid, f.rank
+        FROM emails_fts f
+        JOIN search_docs s ON s.docid = f.rowid
+        JOIN emails e ON e.id = s.email_id
+        LEFT JOIN classifications c ON c.email_id = e.id
+        WHERE emails_fts MATCH ? {where}
+        ORDER BY f.rank, e.sent_date DESC, e.id DESC
+        LIMIT ? OFFSET ?;
+        """, (match, *params, limit + 1, offset)).fetchall()
+        page = ranked[:limit]
+        rows = con.execute(f"""
+        SELECT f.rowid, e.id, e.thread_id, e.sender, e.subject, e.snippet, e.sent_date, e.is_unread,
+               c.summary, c.category, c.sentiment, c.priority, c.urgency_score,
+               EXISTS(SELECT 1 FROM drafts d WHERE d.email_id = e.id),
+               highlight(emails_fts, 0, ?, ?),
+               snippet(emails_fts, -1, ?, ?, '…', 24)
+        FROM emails_fts f
+        JOIN search_docs s ON s.docid = f.rowid
+        JOIN emails e ON e.id = s.email_id
+        LEFT JOIN classifications c ON c.email_id = e.id
+        WHERE emails_fts MATCH ? AND f.rowid IN ({",".join("?" * len(page))});""", (
+            HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, match, *(d for d, _ in page),
+        )).fetchall() if page else []
+
+    by_docid = {r[0]: r[1:] for r in rows}
+    hits = []
+    for docid, rank in page:
+        r = by_docid.get(docid)
+        if r is None:  # deleted between the two reads
+            continue
+        hits.append(SearchHit(
+            **_row_to_summary(r[:13]).model_dump(), score=-rank,
+            subject_highlight=r[13] or "", snippet_highlight=r[14] or "",
+        ))
+    more = len(ranked) > limit
+    return hits, encode_search_cursor(offset + limit) if more else None
+
+# ---- near-duplicate index (see dedup.py) ----
+
+def _init_near_duplicates(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS near_duplicates (
+        email_id TEXT PRIMARY KEY,
+        cluster_id TEXT NOT NULL,  -- the cluster's representative (its first email)
+        similarity REAL NOT NULL,  -- estimated similarity to the representative
+        signature BLOB             -- MinHash signature; stored for representatives only
+    );""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_near_duplicates_cluster ON near_duplicates(cluster_id);")
+    # LSH buckets of cluster representatives
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS minhash_bands (
+        band_key INTEGER NOT NULL,
+        email_id TEXT NOT NULL,
+        PRIMARY KEY (band_key, email_id)
+    ) WITHOUT ROWID;""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_minhash_bands_email ON minhash_bands(email_id);")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_near_duplicates_email_delete AFTER DELETE ON emails BEGIN
+        DELETE FROM minhash_bands WHERE email_id = OLD.id;
+        DELETE FROM near_duplicates WHERE email_id = OLD.id;
+    END;""")
+
+def get_near_duplicates(email_ids: List[str]) -> Dict[str, Tuple[str, float]]:
+    found: Dict[str, Tuple[str, float]] = {}
+    with _conn() as con:
+        for start in range(0, len(email_ids), 500):
+            chunk = email_ids[start:start + 500]
+            found.update((r[0], (r[1], r[2])) for r in con.execute(f"""
+            SELECT email_id, cluster_id, similarity FROM near_duplicates
+            WHERE email_id IN ({",".join("?" * len(chunk))});""", chunk))
+    return found
+
+def minhash_candidates(band_keys: List[int]) -> Dict[int, List[str]]:
+    buckets: Dict[int, List[str]] = {}
+    with db_span("minhash_candidates"), _conn() as con:
+        for start in range(0, len(band_keys), 500):
+            chunk = band_keys[start:start + 500]
+            for key, email_id in con.execute(f"""
+            SELECT band_key, email_id FROM minhash_bands
+            WHERE band_key IN ({",".join("?" * len(chunk))});""", chunk):
+                buckets.setdefault(key, []).append(email_id)
+    return buckets
+
+def get_minhash_signatures(email_ids: List[str]) -> Dict[str, bytes]:
+    found: Dict[str, bytes] = {}
+    with _conn() as con:
+        for start in range(0, len(email_ids), 500):
+            chunk = email_ids[start:start + 500]
+            found.update(con.execute(f"""
+            SELECT email_id, signature FROM near_duplicates
+            WHERE email_id IN ({",".join("?" * len(chunk))}) AND signature IS NOT NULL;""", chunk))
+    return found
+
+def save_near_duplicates(rows: List[Tuple[str, str, float, Optional[bytes]]], bands: List[Tuple[int, str]]):
+    """
+    rows are (email_id, cluster_id, similarity, signature); bands are (band_key, email_id) of new representatives.
+    """
+    with db_span("save_near_duplicates"), _conn() as con:
+        con.executemany("""
+        INSERT OR REPLACE INTO near_duplicates (email_id, cluster_id, similarity, signature) VALUES (?, ?, ?, ?);
+        """, rows)
+        con.executemany("INSERT OR IGNORE INTO minhash_bands (band_key, email_id) VALUES (?, ?);", bands)
+
+def clear_near_duplicates():
+    with _conn() as con:
+        con.execute("DELETE FROM minhash_bands;")
+        con.execute("DELETE FROM near_duplicates;")
+
+def iter_email_texts(batch_size: int):
+    """
+    Every stored email as (id, subject, body), oldest first, in lists of batch_size.
+    """
+    after = ("", "")
+    while True:
+        with _conn() as con:
+            rows = con.execute("""
+            SELECT e.sent_date, e.id, e.subject, COALESCE(e.body, cold_text(k.codec, k.body))
+            FROM emails e
+            LEFT JOIN cold_bodies k ON k.email_id = e.id
+            WHERE (e.sent_date, e.id) > (?, ?)
+            ORDER BY e.sent_date, e.id
+            LIMIT ?;""", (*after, batch_size)).fetchall()
+        if not rows:
+            return
+        after = rows[-1][:2]
+        yield [r[1:] for r in rows]
+
+def get_cluster_members(email_id: str, limit: int = 100) -> List[EmailSummary]:
+    """
+    The other emails in email_id's near-duplicate cluster, oldest first.
+    """
     with _conn() as con:
         rows = con.execute("""
-        SELECT category, COUNT(*) FROM classifications GROUP BY category;
-        """).fetchall()
-    return {k: v for k, v in rows}
+        SELECT e.id, e.thread_id, e.sender, e.subject, e.snippet, e.sent_date, e.is_unread,
+               c.summary, c.category, c.sentiment, c.priority, c.urgency_score,
+               EXISTS(SELECT 1 FROM drafts d WHERE d.email_id = e.id)
+        FROM near_duplicates n
+        JOIN emails e ON e.id = n.email_id
+        LEFT JOIN classifications c ON c.email_id = e.id
+        WHERE n.cluster_id = (SELECT cluster_id FROM near_duplicates WHERE email_id = ?) AND n.email_id != ?
+        ORDER BY e.sent_date, e.id
+        LIMIT ?;""", (email_id, email_id, limit)).fetchall()
+    return [_row_to_summary(r) for r in rows]
+
+# ---- cold storage (see retention.py) ----
+# Bodies, draft bodies and extraction JSON of old mail move to cold_bodies, zlib-compressed, and the hot
+# columns are set to NULL. The emails table then holds only short fields, so listings stop paging through
+# overflow pages of old bodies; reads that need the text pick it up through cold_text().
+
+COLD_CODEC = "zlib"
+_COLD_EXISTS = "EXISTS (SELECT 1 FROM cold_bodies WHERE email_id = {row})"
+
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode("utf-8"), 6) if text is not None else None
+
+def cold_text(codec: Optional[str], blob: Optional[bytes]) -> Optional[str]:
+    """
+    Registered as an SQL function on every connection.
+    """
+    if blob is None:
+        return None
+    if codec != COLD_CODEC:
+        raise ValueError(f"Unknown cold storage codec {codec!r}")
+    return zlib.decompress(blob).decode("utf-8")
+
+def _init_cold_storage(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS cold_bodies (
+        email_id TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        body BLOB,
+        draft_body BLOB,
+        extraction BLOB,
+        archived_at REAL NOT NULL
+    );""")
+    # archiving walks this index, which shrinks as bodies move out
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_emails_hot ON emails(sent_date) WHERE body IS NOT NULL;")
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_cold_bodies_email_delete AFTER DELETE ON emails BEGIN
+        DELETE FROM cold_bodies WHERE email_id = OLD.id;
+    END;""")
+
+def archive_bodies(before: str, limit: int, now: float) -> Tuple[int, int, int]:
+    """
+    Moves the text of up to `limit` emails sent before `before` (ISO date) into cold_bodies.
+    Returns (emails archived, text bytes moved, compressed bytes written); 0 archived means nothing is left.
+    """
+    con = _conn()
+    with db_span("archive_bodies"), con:
+        con.execute("BEGIN IMMEDIATE;")
+        rows = con.execute("""
+        SELECT e.id, e.body, d.body, c.extraction_json, k.draft_body, k.extraction
+        FROM emails e
+        LEFT JOIN drafts d ON d.email_id = e.id
+        LEFT JOIN classifications c ON c.email_id = e.id
+        LEFT JOIN cold_bodies k ON k.email_id = e.id
+        WHERE e.body IS NOT NULL AND e.sent_date < ?
+        ORDER BY e.sent_date
+        LIMIT ?;""", (before, limit)).fetchall()
+        if not rows:
+            return 0, 0, 0
+        cold, moved, written = [], 0, 0
+        for eid, body, draft_body, extraction, cold_draft, cold_extraction in rows:
+            packed = (_compress(body), _compress(draft_body), _compress(extraction))
+            moved += sum(len(t.encode("utf-8")) for t in (body, draft_body, extraction) if t is not None)
+            written += sum(len(b) for b in packed if b is not None)
+            # a re-processed email may already have its draft and extraction in cold storage
+            cold.append((eid, COLD_CODEC, packed[0], packed[1] or cold_draft, packed[2] or cold_extraction, now))
+        ids = [(r[0],) for r in rows]
+        con.executemany("""
+        INSERT OR REPLACE INTO cold_bodies (email_id, codec, body, draft_body, extraction, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?);""", cold)
+        con.executemany("UPDATE emails SET body = NULL WHERE id = ?;", ids)
+        con.executemany("UPDATE drafts SET body = NULL WHERE email_id = ?;", ids)
+        con.executemany("UPDATE classifications SET extraction_json = NULL WHERE email_id = ?;", ids)
+    return len(rows), moved, written
+
+def delete_emails_before(before: str, limit: int) -> int:
+    """
+    Deletes up to `limit` emails sent before `before` (ISO date), with everything stored about them.
+    """
+    con = _conn()
+    with db_span("delete_emails"), con:
+        con.execute("BEGIN IMMEDIATE;")
+        ids = [(r[0],) for r in con.execute(
+            "SELECT id FROM emails WHERE sent_date < ? ORDER BY sent_date LIMIT ?;", (before, limit))]
+        # foreign keys are not enforced, so the dependent rows go explicitly; triggers handle search,
+        # near-duplicates, cold storage and the /stats counters
+        for table in ("classifications", "drafts", "email_queue"):
+            con.executemany(f"DELETE FROM {table} WHERE email_id = ?;", ids)
+        con.executemany("DELETE FROM emails WHERE id = ?;", ids)
+    return len(ids)
+
+def storage_usage() -> Dict[str, int]:
+    """
+    Bytes on disk (database plus WAL), bytes the database occupies once checkpointed, and bytes in its
+    free pages, which only a VACUUM gives back.
+    """
+    with _conn() as con:
+        page_size = con.execute("PRAGMA page_size;").fetchone()[0]
+        pages = con.execute("PRAGMA page_count;").fetchone()[0]
+        free = con.execute("PRAGMA freelist_count;").fetchone()[0]
+    wal = Path(str(DB_PATH) + "-wal")
+    return {
+        "file_bytes": DB_PATH.stat().st_size + (wal.stat().st_size if wal.exists() else 0),
+        "database_bytes": pages * page_size,
+        "free_bytes": free * page_size,
+    }
+
+def vacuum():
+    """
+    Rewrites the database without its free pages, then empties the WAL. Blocks writers while it runs.
+    search_docs keeps docids stable, so the search index survives the rowid renumbering.
+    """
+    con = _conn()
+    with db_span("vacuum"):
+        con.execute("VACUUM;")
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+def analyze():
+    """
+    Refreshes the planner's statistics, sampling at most a thousand rows per index.
+    """
+    with db_span("analyze"), _conn() as con:
+        con.execute("PRAGMA analysis_limit = 1000;")
+        con.execute("ANALYZE;")
+
+# ---- work queue ----
+
+# Aging: an entry's priority climbs one urgency level at a time from base_priority to the top (urgency 10),
+# evenly spread over its SLA counted from sent_at. Each step is applied lazily when next_age_at comes due,
+# so an entry is rewritten at most ten times however long it waits, and ordering stays a plain index scan.
+_TOP_PRIORITY = -10
+_AGE_STEPS = f"(base_priority - ({_TOP_PRIORITY}))"
+_AGE_TAKEN = f"MIN({_AGE_STEPS}, MAX(0, CAST((:now - sent_at) * {_AGE_STEPS} / sla_s AS INTEGER)))"
+
+def _age(con: sqlite3.Connection, now: float):
+    con.execute(f"""
+    UPDATE email_queue SET
+        priority = MIN(priority, base_priority - {_AGE_TAKEN}),
+        next_age_at = CASE WHEN {_AGE_TAKEN} >= {_AGE_STEPS} THEN NULL
+                      ELSE sent_at + sla_s * ({_AGE_TAKEN} + 1) / {_AGE_STEPS} END
+    WHERE acked_at IS NULL AND next_age_at <= :now;""", {"now": now})
+
+def queue_age(now: float):
+    """
+    Applies the aging steps due by `now`. claim does this itself and peek works it out without writing;
+    it only needs calling directly to keep the work off claim latency.
+    """
+    with db_span("queue_age"), _conn() as con:
+        _age(con, now)
+
+def queue_push(entries: List[Tuple[str, int, float, float]], now: float):
+    """
+    Enqueues (email_id, priority, sent_at, sla_s) entries; lower priority values pop first, then older mail.
+    Priority then rises with age so that it reaches the top when the SLA runs out.
+    Re-pushing a pending id updates it in place; re-pushing an acked id is a no-op.
+    A new email whose near-duplicate cluster already has a pending entry is folded into that entry
+    (its duplicates count goes up; priority, SLA and sent time take the more urgent of the two) and
+    stored as acked, so the queue holds one entry per incident.
+    """
+    with db_span("queue_push"), _conn() as con:
+        ids = [e[0] for e in entries]
+        clusters: Dict[str, str] = {}
+        queued = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            clusters.update(con.execute(f"""
+            SELECT email_id, cluster_id FROM near_duplicates WHERE email_id IN ({marks});""", chunk))
+            queued.update(r[0] for r in con.execute(
+                f"SELECT email_id FROM email_queue WHERE email_id IN ({marks});", chunk))
+        plain = []
+        for email_id, priority, sent_at, sla_s in entries:
+            # next_age_at = now: the first _age() works out how far an already old email has aged
+            row = (email_id, priority, priority, sent_at, sla_s, now if priority > _TOP_PRIORITY else None, now)
+            cluster_id = clusters.get(email_id)
+            if cluster_id is None or email_id in queued:
+                plain.append((*row, cluster_id))
+                continue
+            head = con.execute("""
+            SELECT email_id FROM email_queue WHERE cluster_id = ? AND acked_at IS NULL
+            ORDER BY enqueued_at LIMIT 1;""", (cluster_id,)).fetchone()
+            if head is None:
+                con.execute("""
+                INSERT INTO email_queue (email_id, priority, base_priority, sent_at, sla_s, next_age_at, enqueued_at,
+                                         cluster_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?);""", (*row, cluster_id))
+            else:
+                con.execute("""
+                UPDATE email_queue SET duplicates = duplicates + 1, priority = MIN(priority, :p),
+                    base_priority = MIN(base_priority, :p), sent_at = MIN(sent_at, :sent), sla_s = MIN(sla_s, :sla),
+                    next_age_at = CASE WHEN MIN(priority, :p) > :top THEN :now END
+                WHERE email_id = :id;""", {
+                    "p": priority, "sent": sent_at, "sla": sla_s, "now": now, "top": _TOP_PRIORITY, "id": head[0]})
+                con.execute("""
+                INSERT INTO email_queue (email_id, priority, base_priority, sent_at, sla_s, next_age_at, enqueued_at,
+                                         acked_at, cluster_id)
+                VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?);""", (*row[:5], now, now, cluster_id))
+            queued.add(email_id)
+        con.executemany("""
+        INSERT INTO email_queue (email_id, priority, base_priority, sent_at, sla_s, next_age_at, enqueued_at, cluster_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(email_id) DO UPDATE SET
+          priority = CASE WHEN email_queue.duplicates > 0 THEN MIN(email_queue.priority, excluded.priority)
+                     ELSE excluded.priority END,
+          base_priority = CASE WHEN email_queue.duplicates > 0 THEN MIN(email_queue.base_priority, excluded.priority)
+                          ELSE excluded.priority END,
+          sent_at = MIN(email_queue.sent_at, excluded.sent_at),
+          sla_s = excluded.sla_s,
+          next_age_at = excluded.next_age_at
+        WHERE email_queue.acked_at IS NULL;
+        """, plain)
+
+def queue_supersede_threads(heads: List[Tuple[str, str]], now: float):
+    """
+    For each (thread_id, email_id), retires every other pending entry of that thread,
+    so the queue holds one entry per conversation.
+    """
+    with _conn() as con:
+        con.executemany("""
+        UPDATE email_queue SET acked_at = ?, claim_token = NULL
+        WHERE acked_at IS NULL AND email_id != ?
+          AND email_id IN (SELECT id FROM emails WHERE thread_id = ?);
+        """, [(now, email_id, thread_id) for thread_id, email_id in heads])
+
+def queue_claim(token: str, now: float, visibility_s: float) -> Optional[str]:
+    """
+    Claims the highest-priority pending email that is not currently claimed, hiding it from other
+    claimers for visibility_s seconds. Returns its id, or None when nothing is available.
+    """
+    con = _conn()
+    with db_span("queue_claim"), con:
+        # IMMEDIATE takes the write lock up front so two claimers can never pick the same row
+        con.execute("BEGIN IMMEDIATE;")
+        _age(con, now)
+        row = con.execute("""
+        SELECT email_id FROM email_queue
+        WHERE acked_at IS NULL AND claimed_until <= ?
+        ORDER BY priority, sent_at, enqueued_at
+        LIMIT 1;""", (now,)).fetchone()
+        if row is None:
+            return None
+        con.execute("""
+        UPDATE email_queue SET claim_token = ?, claimed_until = ?, attempts = attempts + 1
+        WHERE email_id = ?;""", (token, now + visibility_s, row[0]))
+    return row[0]
+
+def queue_peek(n: int, now: float) -> List[QueueEntry]:
+    """
+    The next n entries claim() would hand out, without claiming them. A plain read: aging still due is
+    applied in the query rather than written, so peeking never waits for or blocks the write lock.
+    """
+    with db_span("queue_peek"), _conn() as con:
+        rows = con.execute(f"""
+        WITH pending AS (
+            SELECT email_id, sent_at, enqueued_at, sent_at + sla_s AS due_at, duplicates,
+                   CASE WHEN next_age_at <= :now THEN MIN(priority, base_priority - {_AGE_TAKEN})
+                        ELSE priority END AS priority
+            FROM email_queue
+            WHERE acked_at IS NULL AND claimed_until <= :now
+        )
+        SELECT e.id, e.thread_id, e.sender, e.subject, e.snippet, e.sent_date, e.is_unread,
+               c.summary, c.category, c.sentiment, c.priority, c.urgency_score,
+               EXISTS(SELECT 1 FROM drafts d WHERE d.email_id = e.id),
+               q.priority, q.due_at, q.duplicates
+        FROM pending q
+        JOIN emails e ON e.id = q.email_id
+        LEFT JOIN classifications c ON c.email_id = e.id
+        ORDER BY q.priority, q.sent_at, q.enqueued_at
+        LIMIT :n;""", {"now": now, "n": n}).fetchall()
+    return [
+        QueueEntry(
+            **_row_to_summary(r[:13]).model_dump(), effective_urgency=-r[13],
+            due_at=datetime.utcfromtimestamp(r[14]) if r[14] is not None else None, duplicates=r[15],
+        )
+        for r in rows
+    ]
+
+def queue_ack(email_id: str, token: str, now: float) -> bool:
+    with _conn() as con:
+        return con.execute("""
+        UPDATE email_queue SET acked_at = ?, claim_token = NULL
+        WHERE email_id = ? AND claim_token = ? AND acked_at IS NULL;
+        """, (now, email_id, token)).rowcount == 1
+
+def queue_release(email_id: str, token: str) -> bool:
+    with _conn() as con:
+        return con.execute("""
+        UPDATE email_queue SET claim_token = NULL, claimed_until = 0
+        WHERE email_id = ? AND claim_token = ? AND acked_at IS NULL;
+        """, (email_id, token)).rowcount == 1
+
+def queue_depth(now: float) -> Dict[str, int]:
+    with _conn() as con:
+        pending, claimed = con.execute("""
+        SELECT COUNT(*), COALESCE(SUM(claimed_until > ?), 0) FROM email_queue WHERE acked_at IS NULL;
+        """, (now,)).fetchone()
+    return {"pending": pending, "claimed": claimed}
@@ -0,0 +1,171 @@
+import os
+import zlib
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import EmailRecord, ClassificationResult, ResponseDraft
+from .ai_classifier import relabel, generate_reply
+from .text_utils import word_tokens
+from .metrics import span, CLASSIFICATIONS
+from . import database as db
+
+# Near-duplicate detection for floods of almost identical mail (outage reports, monitoring alerts).
+# Each email's word 3-grams are summarised by a MinHash signature; locality-sensitive hashing splits the
+# signature into bands, and emails sharing any band are candidates. Only the first email of each cluster
+# (its representative) is indexed, so a lookup reads a few small buckets however large the mailbox grows.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))  # estimated Jaccard similarity of the shingle sets
+DEDUP_MIN_SHINGLES = int(os.getenv("DEDUP_MIN_SHINGLES", "8"))  # shorter mail is too generic to cluster
+DEDUP_BODY_CHARS = 2000  # alerts say what they are about early; the tail is mostly signatures and footers
+
+N_PERMUTATIONS = 64
+BANDS, ROWS = 16, 4  # pairs at 0.8 similarity share a band 99.98% of the time, at 0.4 34%
+_rng = np.random.default_rng(0xD5DE)
+_A = _rng.integers(0, 1 << 64, N_PERMUTATIONS, dtype=np.uint64, endpoint=False) | np.uint64(1)
+_B = _rng.integers(0, 1 << 64, N_PERMUTATIONS, dtype=np.uint64, endpoint=False)
+_SHINGLE_MUL = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F))
+
+class Assignment(NamedTuple):
+    cluster_id: str  # id of the cluster's representative; the email's own id when it starts a cluster
+    similarity: float  # estimated similarity to the representative
+
+def _text(subject: Optional[str], body: Optional[str]) -> str:
+    # quoted history differs between copies of the same alert and says nothing about this message
+    lines = [l for l in (body or "")[:DEDUP_BODY_CHARS].splitlines() if not l.lstrip().startswith(">")]
+    return (subject or "") + "\n" + "\n".join(lines)
+
+def signature(subject: Optional[str], body: Optional[str]) -> Optional[np.ndarray]:
+    """
+    MinHash signature (N_PERMUTATIONS uint32) of the word 3-grams, or None when there are fewer than
+    DEDUP_MIN_SHINGLES of them. Digits are folded to "0" (see text_utils), so alerts that
+    differ only in ids and timestamps still match.
+    """
+    tokens = word_tokens(_text(subject, body), DEDUP_BODY_CHARS + 500)
+    if len(tokens) - 2 < DEDUP_MIN_SHINGLES:
+        return None
+    h = np.fromiter(map(zlib.crc32, tokens), dtype=np.uint64, count=len(tokens))
+    # repeated shingles cannot change a minimum, so there is no need to deduplicate them first
+    shingles = h[:-2] * _SHINGLE_MUL[0] + h[1:-1] * _SHINGLE_MUL[1] + h[2:]
+    # multiply-shift hashing: the high 32 bits of a*x + b (mod 2^64) for each of the permutations
+    hashed = (shingles[:, None] * _A + _B) >> np.uint64(32)
+    return hashed.min(axis=0).astype(np.uint32)
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    return [(band << 32) | zlib.crc32(sig[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / N_PERMUTATIONS
+
+class NearDuplicateIndex:
+    """
+    Assigns emails to near-duplicate clusters and persists the assignment (near_duplicates, minhash_bands).
+    Assignment is serialised within the process so concurrent batches cannot both found the same cluster.
+    """
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, enabled: bool = DEDUP_ENABLED) -> None:
+        self.threshold = threshold
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def assign(self, records: Sequence[EmailRecord]) -> List[Optional[Assignment]]:
+        """
+        One entry per record: its cluster, or None when it has too little text (or dedup is disabled).
+        Records already in the index keep their earlier assignment.
+        """
+        if not self.enabled or not records:
+            return [None] * len(records)
+        with span("dedup.assign"):
+            return self._assign([(r.id, r.subject, r.body) for r in records])
+
+    def _assign(self, items: Sequence[Tuple[str, Optional[str], Optional[str]]]) -> List[Optional[Assignment]]:
+        sigs = [signature(subject, body) for _, subject, body in items]
+        with self._lock:
+            known = db.get_near_duplicates([eid for eid, _, _ in items])
+            out: List[Optional[Assignment]] = [None] * len(items)
+            new = []
+            for i, (eid, _, _) in enumerate(items):
+                if eid in known:
+                    out[i] = Assignment(*known[eid])
+                elif sigs[i] is not None:
+                    new.append((i, band_keys(sigs[i])))
+            if not new:
+                return out
+
+            buckets = db.minhash_candidates(sorted({k for _, keys in new for k in keys}))
+            rep_sigs = {
+                eid: np.frombuffer(blob, dtype=np.uint32)
+                for eid, blob in db.get_minhash_signatures(sorted({e for ids in buckets.values() for e in ids})).items()
+            }
+            rows: List[Tuple[str, str, float, Optional[bytes]]] = []
+            bands: List[Tuple[int, str]] = []
+            for i, keys in new:
+                eid, sig = items[i][0], sigs[i]
+                best, best_sim = None, 0.0
+                for cand in sorted({c for k in keys for c in buckets.get(k, ())}):
+                    sim = similarity(sig, rep_sigs[cand]) if cand in rep_sigs else 0.0
+                    if sim > best_sim:
+                        best, best_sim = cand, sim
+                if best is not None and best_sim >= self.threshold:
+                    out[i] = Assignment(best, best_sim)
+                    rows.append((eid, best, best_sim, None))
+                    continue
+                # a new cluster: later emails in this batch can join it too
+                out[i] = Assignment(eid, 1.0)
+                rows.append((eid, eid, 1.0, sig.tobytes()))
+                rep_sigs[eid] = sig
+                for k in keys:
+                    buckets.setdefault(k, []).append(eid)
+                    bands.append((k, eid))
+            db.save_near_duplicates(rows, bands)
+        return out
+
+    def rebuild(self, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Re-clusters every stored email, oldest first. Needed after changing the threshold or shingling.
+        """
+        db.clear_near_duplicates()
+        indexed = clusters = 0
+        with span("dedup.rebuild"):
+            for batch in db.iter_email_texts(batch_size):
+                for (eid, _, _), a in zip(batch, self._assign(batch)):
+                    if a is not None:
+                        indexed += 1
+                        clusters += a.cluster_id == eid
+        return {"indexed": indexed, "clusters": clusters}
+
+near_duplicates = NearDuplicateIndex()
+
+def _reuse(record: EmailRecord, cls: ClassificationResult) -> Tuple[ClassificationResult, ResponseDraft]:
+    # only the labels carry over: ids, phone numbers and amounts are folded away before matching, so the
+    # representative's summary, contacts and draft may describe another customer
+    own = relabel(record, cls, "duplicate")
+    return own, generate_reply(record, own)
+
+def classify_unique(
+    records: List[EmailRecord],
+    classify: Callable[[List[EmailRecord]], Iterable[Tuple[ClassificationResult, Optional[ResponseDraft]]]],
+) -> List[Tuple[ClassificationResult, Optional[ResponseDraft]]]:
+    """
+    Runs `classify` only on records that are not near-duplicates of an already classified email; the others
+    reuse their cluster representative's labels, with a summary, contacts and draft built from their own text.
+    `classify` returns one (classification, draft or None) per record, in order.
+    """
+    assignments = near_duplicates.assign(records)
+    positions = {r.id: i for i, r in enumerate(records)}
+    dup = [i for i, a in enumerate(assignments) if a is not None and a.cluster_id != records[i].id]
+    stored = db.get_processed_many(sorted({assignments[i].cluster_id for i in dup} - positions.keys())) if dup else {}
+
+    # duplicates whose representative was never classified (or is gone) are classified like anything else
+    reusable = {i for i in dup if assignments[i].cluster_id in positions or assignments[i].cluster_id in stored}
+    todo = [i for i in range(len(records)) if i not in reusable]
+    results: List[Optional[Tuple[ClassificationResult, Optional[ResponseDraft]]]] = [None] * len(records)
+    for i, result in zip(todo, classify([records[i] for i in todo]) if todo else ()):
+        results[i] = result
+    for i in sorted(reusable):
+        rep = assignments[i].cluster_id
+        cls = results[positions[rep]][0] if rep in positions else stored[rep].classification
+        results[i] = _reuse(records[i], cls)
+    if reusable:
+        CLASSIFICATIONS.inc(len(reusable), source="duplicate")
+    return results
@@ -0,0 +1,91 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional
+
+from .models import Extraction
+from .heuristics import trie_pattern
+
+# Every pattern below is bounded so each start position does O(1) work: scanning stays linear
+# even on multi-megabyte pasted logs or HTML remnants.
+
+# A phone candidate is a digit, up to 20 digits/separators, then a digit, not glued to other word characters.
+# The digit count check in _normalize_phone does the real validation.
+_PHONE = re.compile(r"(?<![\w+])\+?\d[\d \t().-]{5,20}\d(?![\w])")
+# RFC 5321 length limits (64-char local part, 253-char domain) cap backtracking per match attempt
+_EMAIL = re.compile(
+    r"(?<![A-Za-z0-9._%+-])[A-Za-z0-9._%+-]{1,64}@(?:[A-Za-z0-9-]{1,63}\.){1,8}[A-Za-z]{2,24}(?![A-Za-z0-9-])"
+)
+_NON_DIGIT = re.compile(r"\D")
+# Digit runs that look like phones but are dates (2024-01-31, 31/01/2024) or IPv4 addresses
+_NOT_PHONE = re.compile(r"\d{1,4}([-./])\d{1,2}\1\d{1,4}|\d{1,3}(?:\.\d{1,3}){3}")
+
+MIN_PHONE_DIGITS = 7
+MAX_PHONE_DIGITS = 15  # E.164 limit
+
+DEFAULT_DICTIONARY: Dict[str, List[str]] = {
+    "products": [],
+    "keywords": [
+        "refund", "invoice", "billing", "password", "login", "outage", "downtime", "bug", "crash",
+        "cancel", "upgrade", "integration", "api", "security", "data loss",
+    ],
+}
+
+def _normalize_phone(raw: str) -> Optional[str]:
+    digits = _NON_DIGIT.sub("", raw)
+    if not MIN_PHONE_DIGITS <= len(digits) <= MAX_PHONE_DIGITS:
+        return None
+    if _NOT_PHONE.fullmatch(raw.strip()):
+        return None
+    return ("+" if raw.lstrip().startswith("+") else "") + digits
+
+def _normalize_email(raw: str) -> str:
+    local, _, domain = raw.rpartition("@")
+    return f"{local.strip('.')}@{domain.lower()}"
+
+class Extractor:
+    """
+    Phone numbers, email addresses, product mentions and keywords from an email body.
+    Products and keywords are matched as whole words against a compiled dictionary.
+    """
+    def __init__(self, dictionary: Dict[str, List[str]]) -> None:
+        self.dictionary = dictionary
+        self._terms = {name: self._compile(dictionary.get(name, [])) for name in ("products", "keywords")}
+
+    @staticmethod
+    def _compile(terms: List[str]):
+        lowered = {t.lower(): t for t in terms if t.strip()}
+        if not lowered:
+            return None
+        return re.compile(r"(?<!\w)(?:" + trie_pattern(list(lowered)) + r")(?!\w)"), lowered
+
+    def _find_terms(self, name: str, lowered_text: str) -> List[str]:
+        compiled = self._terms[name]
+        if compiled is None:
+            return []
+        pattern, canonical = compiled
+        return list(dict.fromkeys(canonical[m.group(0)] for m in pattern.finditer(lowered_text)))
+
+    def extract(self, body: str) -> Extraction:
+        body = body or ""
+        phones = (_normalize_phone(m.group(0)) for m in _PHONE.finditer(body))
+        emails = (_normalize_email(m.group(0)) for m in _EMAIL.finditer(body))
+        lowered = body.lower()
+        return Extraction(
+            phone_numbers=list(dict.fromkeys(p for p in phones if p)),
+            emails=list(dict.fromkeys(emails)),
+            product_mentions=self._find_terms("products", lowered),
+            keywords=self._find_terms("keywords", lowered),
+        )
+
+def load_dictionary(path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    {"products": [...], "keywords": [...]} from EXTRACTION_DICTIONARY_PATH, else DEFAULT_DICTIONARY.
+    """
+    path = path or os.getenv("EXTRACTION_DICTIONARY_PATH", "")
+    if not path:
+        return DEFAULT_DICTIONARY
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+extractor = Extractor(load_dictionary())
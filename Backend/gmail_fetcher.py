@@ -1,15 +1,26 @@
 import os
 import base64
+import json
 import re
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Tuple
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+from googleapiclient.errors import HttpError
 
 from .models import EmailRecord
+from .metrics import span
 
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
@@ -17,49 +28,278 @@ SCOPES = [
     "https://www.googleapis.com/auth/gmail.send",
 ]
 
+# Gmail allows up to 100 calls per batch, but recommends <= 50 to avoid rate limiting
+BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+LIST_PAGE_SIZE = 500  # hard cap on messages.list / history.list page size
+
+# The classifier reads 4000 chars; keep some headroom for summaries and the dashboard
+BODY_MAX_CHARS = int(os.getenv("GMAIL_BODY_MAX_CHARS", "16000"))
+PART_MAX_BYTES = int(os.getenv("GMAIL_PART_MAX_BYTES", str(256 * 1024)))  # decoded bytes per MIME part
+GMAIL_REFRESH_MARGIN_S = float(os.getenv("GMAIL_REFRESH_MARGIN_S", "300"))  # refresh tokens this long before expiry
+GMAIL_REFRESH_CHECK_S = float(os.getenv("GMAIL_REFRESH_CHECK_S", "60"))
+DEFAULT_ACCOUNT = "default"
+_ACCOUNT_KEY = re.compile(r"[A-Za-z0-9_-]{1,64}")  # account keys become part of a token file name
+
+_CHARSET = re.compile(r"charset=\"?([\w.:-]+)", re.IGNORECASE)
+
+def _decode_part(part: Dict[str, Any], max_bytes: int) -> str:
+    """
+    base64url-decodes at most max_bytes of a part, in the charset its Content-Type declares.
+    """
+    data = part["body"]["data"]
+    # 4 encoded chars → 3 bytes: slice before decoding rather than decoding megabytes and discarding them
+    limit = (max_bytes + 2) // 3 * 4
+    if len(data) > limit:
+        data = data[:limit]
+    data += "=" * (-len(data) % 4)
+    charset = "utf-8"
+    for h in part.get("headers", []) or []:
+        if h.get("name", "").lower() == "content-type":
+            m = _CHARSET.search(h.get("value", ""))
+            if m:
+                charset = m.group(1)
+    raw = base64.urlsafe_b64decode(data.encode("ascii"))[:max_bytes]
+    try:
+        return raw.decode(charset, errors="ignore")
+    except LookupError:
+        return raw.decode("utf-8", errors="ignore")
+
+class _HTMLText(HTMLParser):
+    """
+    HTML → plain text: drops script/style/head, decodes entities, turns block elements into line breaks.
+    """
+    SKIP = {"script", "style", "head", "title", "noscript", "template", "svg"}
+    BLOCK = {"p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+             "blockquote", "pre", "hr", "section", "article", "header", "footer"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self.size = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip_depth += 1
+        elif tag in self.BLOCK:
+            self.chunks.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCK:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.chunks.append(data)
+            self.size += len(data)
+
+_SPACES = re.compile(r"[ \t\r\f\v\xa0]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+def _html_to_text(html: str, max_chars: int, feed_size: int = 16384) -> str:
+    """
+    Feeds the document in slices and stops once max_chars of visible text exist.
+    """
+    parser = _HTMLText()
+    for start in range(0, len(html), feed_size):
+        parser.feed(html[start:start + feed_size])
+        if parser.size >= max_chars:
+            break
+    parser.close()
+    text = _BLANK_LINES.sub("\n\n", _SPACES.sub(" ", "".join(parser.chunks)))
+    return "\n".join(line.strip() for line in text.split("\n")).strip()[:max_chars]
+
+@lru_cache(maxsize=1)
+def _gmail_discovery() -> Dict[str, Any]:
+    # The discovery document bundled with google-api-python-client, parsed once per process
+    return json.loads(discovery_cache.get_static_doc("gmail", "v1"))
+
+def _build_service(creds: Credentials):
+    """
+    Gmail service over its own keep-alive HTTP connection. httplib2 is not thread-safe, so a service
+    must not be shared between threads; the credentials can be. build_http() carries the client library's
+    default socket timeout, so a hung request fails instead of blocking its worker forever.
+    """
+    return build_from_document(_gmail_discovery(), http=AuthorizedHttp(creds, http=build_http()))
+
+def load_credentials(credentials_file: str, token_file: str) -> Credentials:
+    """
+    Stored OAuth token, refreshed if expired; runs the browser consent flow when there is none yet.
+    """
+    creds = None
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            if not os.path.exists(credentials_file):
+                raise FileNotFoundError(
+                    f"Missing {credentials_file}. Download OAuth client credentials from Google Cloud."
+                )
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+            creds = flow.run_local_server(port=0)
+        with open(token_file, "w") as token:
+            token.write(creds.to_json())
+    return creds
+
+def history_state_key(account: str = DEFAULT_ACCOUNT) -> str:
+    """
+    sync_state key holding an account's last stored Gmail historyId.
+    """
+    return "gmail_history_id" if account == DEFAULT_ACCOUNT else f"gmail_history_id:{account}"
+
 class GmailClient:
-    def __init__(self, credentials_file: str = "credentials.json", token_file: str = "token.json"):
+    def __init__(self, credentials_file: str = "credentials.json", token_file: str = "token.json", service=None):
         self.credentials_file = credentials_file
         self.token_file = token_file
-        self.service = None
+        # An already-built service (or a fake one in tests) skips the OAuth flow
+        self.service = service
 
     def _ensure_auth(self):
-        creds = None
-        if os.path.exists(self.token_file):
-            creds = Credentials.from_authorized_user_file(self.token_file, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
+        self.service = _build_service(load_credentials(self.credentials_file, self.token_file))
+
+    def _extract_body(self, payload: Dict[str, Any], max_chars: Optional[int] = None) -> str:
+        """
+        Walks the MIME tree depth-first (nested multipart/alternative, multipart/related, ...) and returns
+        up to max_chars of text. text/plain parts win; HTML is only converted when there is no plain text.
+        Parts are decoded lazily and the walk stops as soon as enough text has been collected.
+        """
+        max_chars = max_chars or BODY_MAX_CHARS
+        plain: List[Dict[str, Any]] = []
+        html: List[Dict[str, Any]] = []
+        stack = [payload]
+        while stack:
+            part = stack.pop()
+            mime = (part.get("mimeType") or "").lower()
+            if mime.startswith("multipart/"):
+                stack.extend(reversed(part.get("parts") or []))
+            elif part.get("filename") or not part.get("body", {}).get("data"):
+                continue  # attachments, or parts whose content lives behind an attachmentId
+            elif mime == "text/html":
+                html.append(part)
+            elif mime in ("text/plain", ""):
+                plain.append(part)
+
+        chunks: List[str] = []
+        size = 0
+        is_html = not plain
+        for part in plain or html:
+            remaining = max_chars - size
+            if remaining <= 0:
+                break
+            text = _decode_part(part, PART_MAX_BYTES)
+            text = _html_to_text(text, remaining) if is_html else text[:remaining]
+            chunks.append(text)
+            size += len(text)
+        return "\n".join(chunks).strip()[:max_chars]  # the separators count too
+
+    def _to_record(self, msg: Dict[str, Any]) -> EmailRecord:
+        headers = {h["name"].lower(): h["value"] for h in msg.get("payload", {}).get("headers", [])}
+        subject = headers.get("subject", "")
+        sender = headers.get("from", "")
+        date_str = headers.get("date", "")
+        try:
+            # RFC 2822 date with its UTC offset; a "-0000" (unknown zone) date comes back naive and is taken as UTC
+            timestamp = parsedate_to_datetime(date_str)
+        except (TypeError, ValueError):
+            try:
+                timestamp = datetime.fromtimestamp(int(msg.get("internalDate", "0")) / 1000.0, timezone.utc)
+            except (TypeError, ValueError, OverflowError, OSError):
+                timestamp = datetime.utcnow()
+        if timestamp.tzinfo is not None:
+            # records carry naive UTC, as they are stored (database._utc_iso) and as the importer produces them
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+        snippet = msg.get("snippet", "")
+        # metadata-format messages carry no body parts; the snippet stands in for the body
+        with span("gmail.extract_body"):
+            body = self._extract_body(msg.get("payload", {})) or snippet
+        labels = msg.get("labelIds", [])
+        is_unread = "UNREAD" in labels
+
+        return EmailRecord(
+            id=msg["id"],
+            thread_id=msg.get("threadId"),
+            sender=sender,
+            subject=subject,
+            body=body,
+            sent_date=timestamp,
+            snippet=snippet,
+            is_unread=is_unread,
+            source="gmail",
+        )
+
+    def _list_ids(self, query: str, max_results: int) -> List[str]:
+        """
+        Follows nextPageToken until max_results ids are collected or the listing is exhausted.
+        """
+        ids: List[str] = []
+        page_token = None
+        while len(ids) < max_results:
+            with span("gmail.list"):
+                resp = self.service.users().messages().list(
+                    userId="me", q=query, maxResults=min(max_results - len(ids), LIST_PAGE_SIZE), pageToken=page_token
+                ).execute()
+            ids += [m["id"] for m in resp.get("messages", [])]
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                break
+        return ids[:max_results]
+
+    def _get_request(self, mid: str, include_body: bool):
+        if include_body:
+            return self.service.users().messages().get(userId="me", id=mid, format="full")
+        # headers + snippet only: a fraction of the payload for large or attachment-heavy mail
+        return self.service.users().messages().get(
+            userId="me", id=mid, format="metadata", metadataHeaders=["Subject", "From", "Date"]
+        )
+
+    def _get_messages(self, ids: List[str], include_body: bool = True) -> List[Dict[str, Any]]:
+        """
+        Fetches messages in Gmail batch requests of BATCH_SIZE calls each.
+        Calls that fail inside a batch (e.g. per-user rate limits) are retried one by one;
+        messages deleted in the meantime (404) are skipped. Input order is preserved.
+        """
+        found: Dict[str, Dict[str, Any]] = {}
+        failed: List[str] = []
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                failed.append(request_id)
             else:
-                if not os.path.exists(self.credentials_file):
-                    raise FileNotFoundError(
-                        f"Missing {self.credentials_file}. Download OAuth client credentials from Google Cloud."
-                    )
-                flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, SCOPES)
-                creds = flow.run_local_server(port=0)
-            with open(self.token_file, "w") as token:
-                token.write(creds.to_json())
-        self.service = build("gmail", "v1", credentials=creds)
-
-    def _extract_body(self, payload: Dict[str, Any]) -> str:
-        def decode(b64: str) -> str:
-            return base64.urlsafe_b64decode(b64.encode("utf-8")).decode("utf-8", errors="ignore")
-
-        if payload.get("body", {}).get("data"):
-            return decode(payload["body"]["data"])
-        parts = payload.get("parts", []) or []
-        text = ""
-        for p in parts:
-            mime = p.get("mimeType", "")
-            if mime == "text/plain" and p.get("body", {}).get("data"):
-                text += decode(p["body"]["data"])
-            elif mime == "text/html" and p.get("body", {}).get("data") and not text:
-                html = decode(p["body"]["data"])
-                text = re.sub("<[^<]+?>", "", html)
-        return text.strip()
+                found[request_id] = response
+
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for mid in ids[start:start + BATCH_SIZE]:
+                batch.add(self._get_request(mid, include_body), request_id=mid)
+            with span("gmail.get_batch"):
+                batch.execute()
+
+        for mid in failed:
+            try:
+                with span("gmail.get"):
+                    found[mid] = self._get_request(mid, include_body).execute()
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+        return [found[mid] for mid in ids if mid in found]
+
+    def current_history_id(self) -> str:
+        if self.service is None:
+            self._ensure_auth()
+        return str(self.service.users().getProfile(userId="me").execute()["historyId"])
 
     def fetch_recent(
-        self, max_results: int = 10, hours_lookback: int = 48, only_unread: bool = True, query_terms: Optional[str] = None
+        self, max_results: int = 10, hours_lookback: int = 48, only_unread: bool = True, query_terms: Optional[str] = None,
+        include_body: bool = True,
     ) -> List[EmailRecord]:
         if self.service is None:
             self._ensure_auth()
@@ -71,41 +311,178 @@ class GmailClient:
         if query_terms:
             query += f" {query_terms}"
 
-        resp = self.service.users().messages().list(userId="me", q=query, maxResults=max_results).execute()
-        messages = resp.get("messages", [])
-        results: List[EmailRecord] = []
+        ids = self._list_ids(query, max_results)
+        return [self._to_record(msg) for msg in self._get_messages(ids, include_body)]
+
+    def fetch_since(
+        self, history_id: Optional[str], max_results: int = 10, hours_lookback: int = 48,
+        only_unread: bool = True, query_terms: Optional[str] = None, include_body: bool = True,
+    ) -> Tuple[List[EmailRecord], str]:
+        """
+        Incremental sync: returns inbox messages added since history_id plus the new history id to store.
+        Without a stored id, or when Gmail has expired it (404), falls back to a fetch_recent window.
+        max_results and query_terms only apply to that fallback: the history API has no search filter,
+        and capping a delta would drop messages once the new history id is stored.
+        """
+        if self.service is None:
+            self._ensure_auth()
 
-        for m in messages:
-            msg = self.service.users().messages().get(userId="me", id=m["id"], format="full").execute()
-            headers = {h["name"].lower(): h["value"] for h in msg.get("payload", {}).get("headers", [])}
-            subject = headers.get("subject", "")
-            sender = headers.get("from", "")
-            date_str = headers.get("date", "")
+        if history_id:
             try:
-                # Robust parse: take the RFC date upto seconds if TZ parsing fails
-                timestamp = datetime.strptime(date_str[:25], "%a, %d %b %Y %H:%M:%S")
-            except Exception:
+                ids: Dict[str, None] = {}  # ordered set
+                page_token = None
+                latest = history_id
+                while True:
+                    with span("gmail.history"):
+                        resp = self.service.users().history().list(
+                            userId="me", startHistoryId=history_id, historyTypes=["messageAdded"],
+                            labelId="INBOX", maxResults=LIST_PAGE_SIZE, pageToken=page_token
+                        ).execute()
+                    for h in resp.get("history", []):
+                        for added in h.get("messagesAdded", []):
+                            ids[added["message"]["id"]] = None
+                    latest = str(resp.get("historyId", latest))
+                    page_token = resp.get("nextPageToken")
+                    if not page_token:
+                        break
+                # history is oldest first; return newest first like messages.list
+                records = [self._to_record(msg) for msg in self._get_messages(list(reversed(ids)), include_body)]
+                if only_unread:
+                    records = [r for r in records if r.is_unread]
+                return records, latest
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+
+        latest = self.current_history_id()
+        records = self.fetch_recent(
+            max_results=max_results, hours_lookback=hours_lookback, only_unread=only_unread, query_terms=query_terms,
+            include_body=include_body,
+        )
+        return records, latest
+
+class GmailClientManager:
+    """
+    Process-wide Gmail access for one or more mailboxes, keyed by account. Credentials are loaded once
+    per account and refreshed in the background before they expire, so fetches never wait on a token
+    refresh. Each thread gets one service per account, built from the cached discovery document and
+    reused across calls to keep its HTTPS connection open.
+    Account "default" uses token.json; any other account uses token.<account>.json in the same directory.
+    """
+    def __init__(
+        self,
+        credentials_file: str = "credentials.json",
+        token_dir: str = ".",
+        refresh_margin_s: float = GMAIL_REFRESH_MARGIN_S,
+        check_interval_s: float = GMAIL_REFRESH_CHECK_S,
+    ) -> None:
+        self.credentials_file = credentials_file
+        self.token_dir = Path(token_dir)
+        self.refresh_margin_s = refresh_margin_s
+        self.check_interval_s = check_interval_s
+        self._creds: Dict[str, Credentials] = {}
+        self._errors: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def token_file(self, account: str = DEFAULT_ACCOUNT) -> str:
+        if not _ACCOUNT_KEY.fullmatch(account):
+            raise ValueError(f"Invalid Gmail account key: {account!r}")
+        name = "token.json" if account == DEFAULT_ACCOUNT else f"token.{account}.json"
+        return str(self.token_dir / name)
+
+    def _lock(self, account: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(account, threading.Lock())
+
+    def _expiring(self, creds: Credentials) -> bool:
+        if not creds.valid:
+            return True
+        # google-auth keeps expiry as naive UTC
+        return creds.expiry is not None and creds.expiry - datetime.utcnow() < timedelta(seconds=self.refresh_margin_s)
+
+    def _refresh(self, account: str, creds: Credentials):
+        creds.refresh(Request())
+        with open(self.token_file(account), "w") as token:
+            token.write(creds.to_json())
+
+    def credentials(self, account: str = DEFAULT_ACCOUNT) -> Credentials:
+        with self._lock(account):
+            creds = self._creds.get(account)
+            if creds is None:
+                creds = self._creds[account] = load_credentials(self.credentials_file, self.token_file(account))
+            elif self._expiring(creds) and creds.refresh_token:
+                # Only reached if the background refresh is not running or has been failing
+                self._refresh(account, creds)
+            return creds
+
+    def service(self, account: str = DEFAULT_ACCOUNT):
+        creds = self.credentials(account)
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+        cached = services.get(account)
+        if cached is None or cached[0] is not creds:
+            cached = services[account] = (creds, _build_service(creds))
+        return cached[1]
+
+    def client(self, account: str = DEFAULT_ACCOUNT) -> GmailClient:
+        return GmailClient(self.credentials_file, self.token_file(account), service=self.service(account))
+
+    def refresh_due(self):
+        """
+        Refreshes every loaded account whose token expires within refresh_margin_s.
+        """
+        for account in list(self._creds):
+            with self._lock(account):
+                creds = self._creds[account]
+                if not (self._expiring(creds) and creds.refresh_token):
+                    continue
                 try:
-                    timestamp = datetime.fromtimestamp(int(msg.get("internalDate", "0")) / 1000.0)
-                except Exception:
-                    timestamp = datetime.utcnow()
-
-            body = self._extract_body(msg.get("payload", {}))
-            snippet = msg.get("snippet", "")
-            labels = msg.get("labelIds", [])
-            is_unread = "UNREAD" in labels
-
-            results.append(
-                EmailRecord(
-                    id=msg["id"],
-                    thread_id=msg.get("threadId"),
-                    sender=sender,
-                    subject=subject,
-                    body=body,
-                    sent_date=timestamp,
-                    snippet=snippet,
-                    is_unread=is_unread,
-                    source="gmail",
-                )
-            )
-        return results
+                    self._refresh(account, creds)
+                    self._errors.pop(account, None)
+                except Exception as e:
+                    self._errors[account] = repr(e)
+
+    def forget(self, account: str):
+        """
+        Drops an account's cached credentials, e.g. after its token file was replaced.
+        """
+        with self._lock(account):
+            self._creds.pop(account, None)
+            self._errors.pop(account, None)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="gmail-token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.check_interval_s):
+            self.refresh_due()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        accounts = set(self._creds) | {DEFAULT_ACCOUNT}
+        out: Dict[str, Dict[str, Any]] = {}
+        for account in sorted(accounts):
+            creds = self._creds.get(account)
+            out[account] = {
+                "token_exists": os.path.exists(self.token_file(account)),
+                "loaded": creds is not None,
+                "expires_at": creds.expiry.isoformat() + "Z" if creds is not None and creds.expiry else None,
+                "last_refresh_error": self._errors.get(account),
+            }
+        return out
+
+gmail_clients = GmailClientManager()
@@ -0,0 +1,127 @@
+import os
+import re
+import json
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Used whenever the LLM is unavailable, so every email may go through here.
+# Rules: each one adds `weight` to `label` within its dimension when any of its keywords appears
+# (case-insensitive substring match, counted once per rule). Keywords are looked for in the subject and
+# body, or in the body alone for rules with "scope": "body".
+DEFAULT_RULES: List[Dict] = [
+    {"dimension": "urgency", "label": "urgent", "weight": 4, "keywords": [
+        "urgent", "immediately", "asap", "critical", "cannot access", "down", "blocked", "error", "failed",
+    ]},
+    {"dimension": "sentiment", "label": "negative", "weight": 2, "scope": "body", "keywords": [
+        "cannot", "unable", "error", "issue", "down",
+    ]},
+    {"dimension": "category", "label": "BILLING", "weight": 1, "keywords": [
+        "invoice", "refund", "billing", "payment", "charged", "subscription",
+    ]},
+    {"dimension": "category", "label": "SALES", "weight": 1, "keywords": [
+        "pricing", "quote", "demo", "purchase", "enterprise plan",
+    ]},
+]
+
+BASE_URGENCY = 5
+URGENT_THRESHOLD = 8
+DEFAULT_CATEGORY = "CUSTOMER_SUPPORT"
+
+class HeuristicResult(NamedTuple):
+    priority: str
+    urgency_score: int
+    sentiment: str
+    category: str
+    matched: List[str]
+
+def trie_pattern(words: List[str]) -> str:
+    """
+    Regex source for a prefix trie of words, e.g. ["down", "downtime"] → "down(?:time)?".
+    Shared prefixes are tested once instead of once per alternative.
+    """
+    trie: Dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class RuleEngine:
+    """
+    Scores urgency, sentiment and category from all rules together, over text lowercased once.
+    Every keyword is compiled into one trie-shaped regex inside a lookahead, so a single pass tries each
+    position and overlapping keywords are all found ("undone" matches both "undo" and "done"). At each
+    position the longest keyword wins and also credits any keyword contained in it ("cannot access"
+    counts for "cannot").
+    """
+    def __init__(self, rules: List[Dict]) -> None:
+        self.rules = rules
+        self._rules_for: Dict[str, Set[int]] = {}
+        for i, rule in enumerate(rules):
+            for kw in rule["keywords"]:
+                self._rules_for.setdefault(kw.lower(), set()).add(i)
+        keywords = list(self._rules_for)
+        for kw in keywords:
+            for other in keywords:
+                if other != kw and other in kw:
+                    self._rules_for[kw] |= self._rules_for[other]
+        self._body_only = {i for i, rule in enumerate(rules) if rule.get("scope", "all") == "body"}
+        self._pattern = re.compile(f"(?=({trie_pattern(keywords)}))") if keywords else None
+
+    def _fire(self, text: str, body_start: int) -> Tuple[Set[int], List[str]]:
+        fired: Set[int] = set()
+        matched: Dict[str, None] = {}
+        for m in self._pattern.finditer(text):
+            kw = m.group(1)
+            rules = self._rules_for[kw]
+            # a match starting in the subject does not count for body-only rules
+            fired |= rules if m.start() >= body_start else rules - self._body_only
+            matched[kw] = None
+        return fired, list(matched)
+
+    def score(self, subject: str, body: str) -> HeuristicResult:
+        subject, body = subject or "", body or ""
+        fired, matched = set(), []
+        if self._pattern is not None and (subject or body):
+            fired, matched = self._fire(f"{subject} {body}".lower(), len(subject) + 1)
+
+        totals: Dict[str, Dict[str, float]] = {"urgency": {}, "sentiment": {}, "category": {}}
+        for i in fired:
+            rule = self.rules[i]
+            dim = totals.setdefault(rule["dimension"], {})
+            dim[rule["label"]] = dim.get(rule["label"], 0) + float(rule.get("weight", 1))
+
+        urgency = int(round(BASE_URGENCY + sum(totals["urgency"].values())))
+        urgency = max(1, min(10, urgency))
+        # ties go to negative: for triage, a complaint outranks a polite sign-off
+        sentiment = max(("negative", "positive"), key=lambda s: totals["sentiment"].get(s, 0))
+        if totals["sentiment"].get(sentiment, 0) <= 0:
+            sentiment = "neutral"
+        category = max(totals["category"], key=totals["category"].get) if totals["category"] else DEFAULT_CATEGORY
+        return HeuristicResult(
+            priority="urgent" if urgency >= URGENT_THRESHOLD else "not_urgent",
+            urgency_score=urgency,
+            sentiment=sentiment,
+            category=category,
+            matched=matched,
+        )
+
+def load_rules(path: Optional[str] = None) -> List[Dict]:
+    """
+    Rules from a JSON file (a list shaped like DEFAULT_RULES) if HEURISTIC_RULES_PATH is set.
+    """
+    path = path or os.getenv("HEURISTIC_RULES_PATH", "")
+    if not path:
+        return DEFAULT_RULES
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+engine = RuleEngine(load_rules())
@@ -0,0 +1,366 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dateutil import parser as dateparser
+
+from .models import EmailRecord, ProcessedEmail, ImportFormat, ImportOptions, ImportStatus
+from .gmail_fetcher import BODY_MAX_CHARS, _html_to_text
+from .pipeline import classify_all
+from .priority_queue import email_queue
+from .metrics import span, EMAILS
+from . import database as db
+
+# Bulk backfill from mail archives. Every reader streams its file (one message or one chunk of rows in
+# memory at a time) and yields (position after this entry, record or None if unparseable), so a run
+# can stop anywhere and resume from the last position written to sync_state.
+IMPORT_DIR = Path(os.getenv("IMPORT_DIR", str(db.DB_PATH.parent / "imports")))  # POST /import only reads here
+
+Entry = Tuple[int, Optional[EmailRecord]]
+
+def _import_id(*parts: str) -> str:
+    # Stable ids make re-importing the same archive (or overlapping exports) an upsert, not a duplicate
+    return "import-" + hashlib.sha1("\x1f".join(parts).encode("utf-8", "replace")).hexdigest()[:24]
+
+def _parse_date(value: Any) -> datetime:
+    """
+    Naive UTC, like Gmail records. Falls back to now when the value is missing or unreadable.
+    """
+    try:
+        if isinstance(value, datetime):
+            dt = value
+        elif isinstance(value, str) and value.strip():
+            try:
+                dt = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                dt = dateparser.parse(value)
+        else:
+            return datetime.utcnow()
+    except (TypeError, ValueError, OverflowError):
+        return datetime.utcnow()
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+# ---- RFC 822 messages (mbox, .eml) ----
+
+def _message_body(msg: EmailMessage) -> str:
+    part = msg.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        text = part.get_content()
+    except (LookupError, ValueError, AssertionError):
+        # unknown charset or broken transfer encoding
+        text = (part.get_payload(decode=True) or b"").decode("utf-8", "replace")
+    if part.get_content_type() == "text/html":
+        return _html_to_text(text, BODY_MAX_CHARS)
+    return text.strip()[:BODY_MAX_CHARS]
+
+def _message_record(msg: EmailMessage) -> EmailRecord:
+    message_id = str(msg.get("Message-ID") or "").strip()
+    sender = str(msg.get("From") or "")
+    subject = str(msg.get("Subject") or "")
+    date = str(msg.get("Date") or "")
+    body = _message_body(msg)
+    gm_id, gm_thread = msg.get("X-GM-MSGID"), msg.get("X-GM-THRID")
+    if gm_id and str(gm_id).isdigit():
+        # Google Takeout: these are the Gmail API ids in decimal, so imported mail lines up with fetched mail
+        email_id = format(int(str(gm_id)), "x")
+        thread_id = format(int(str(gm_thread)), "x") if gm_thread and str(gm_thread).isdigit() else None
+    else:
+        email_id = _import_id(message_id or "\x1f".join((sender, date, subject, body[:512])))
+        references = str(msg.get("References") or msg.get("In-Reply-To") or "").split()
+        root = references[0] if references else message_id
+        thread_id = _import_id("thread", root) if root else None
+    labels = str(msg.get("X-Gmail-Labels") or "").lower()
+    return EmailRecord(
+        id=email_id,
+        thread_id=thread_id,
+        sender=sender,
+        subject=subject,
+        body=body,
+        sent_date=_parse_date(date),
+        snippet=" ".join(body.split())[:140],
+        is_unread="unread" in labels.split(","),
+        source="import",
+    )
+
+def _parse_message(raw: bytes) -> Optional[EmailRecord]:
+    try:
+        return _message_record(BytesParser(policy=policy.default).parsebytes(raw))
+    except Exception:
+        return None
+
+def iter_mbox(path: Path, start: int = 0) -> Iterator[Entry]:
+    """
+    Positions are byte offsets of the next message's "From " line. Unlike mailbox.mbox, this never
+    builds a table of contents, so memory is bounded by the largest single message.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        lines: List[bytes] = []
+        offset = start
+        previous_blank = True
+        for line in f:
+            if line.startswith(b"From ") and previous_blank:
+                if lines:
+                    yield offset, _parse_message(b"".join(lines))
+                    lines = []
+            elif line.startswith(b">") and line.lstrip(b">").startswith(b"From "):
+                lines.append(line[1:])  # mboxrd quoting
+            else:
+                lines.append(line)
+            offset += len(line)
+            previous_blank = line in (b"\n", b"\r\n")
+        if lines:
+            yield offset, _parse_message(b"".join(lines))
+
+def iter_eml(path: Path, start: int = 0) -> Iterator[Entry]:
+    """
+    A single .eml file or a directory tree of them, in sorted order; positions count files.
+    """
+    files = [path] if path.is_file() else sorted(p for p in path.rglob("*.eml") if p.is_file())
+    for i, file in enumerate(files[start:], start + 1):
+        yield i, _parse_message(file.read_bytes())
+
+# ---- tabular exports (csv, xlsx) ----
+
+_COLUMNS = {
+    "sender": ("sender", "from", "from_email", "email"),
+    "subject": ("subject", "title"),
+    "body": ("body", "content", "text", "message"),
+    "sent_date": ("sent_date", "date", "sent", "timestamp", "received"),
+    "id": ("id", "message_id", "message-id"),
+    "thread_id": ("thread_id", "thread"),
+}
+
+def _column_map(header: List[Any]) -> Dict[str, int]:
+    names = [str(h or "").strip().lower() for h in header]
+    found: Dict[str, int] = {}
+    for field, aliases in _COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                found[field] = names.index(alias)
+                break
+    if "body" not in found and "subject" not in found:
+        raise ValueError(f"no body or subject column among {names}")
+    return found
+
+def _row_record(columns: Dict[str, int], row: Tuple[Any, ...]) -> Optional[EmailRecord]:
+    def get(field: str) -> str:
+        i = columns.get(field)
+        value = row[i] if i is not None and i < len(row) else None
+        return "" if value is None else str(value).strip()
+    try:
+        sender, subject, body = get("sender"), get("subject"), get("body")[:BODY_MAX_CHARS]
+        if not (subject or body):
+            return None
+        raw_date = row[columns["sent_date"]] if "sent_date" in columns and columns["sent_date"] < len(row) else None
+        thread = get("thread_id")
+        return EmailRecord(
+            id=_import_id(get("id") or "\x1f".join((sender, str(raw_date), subject, body[:512]))),
+            thread_id=_import_id("thread", thread) if thread else None,
+            sender=sender,
+            subject=subject,
+            body=body,
+            sent_date=_parse_date(raw_date),
+            snippet=" ".join(body.split())[:140],
+            is_unread=False,
+            source="import",
+        )
+    except Exception:
+        return None
+
+def iter_csv(path: Path, start: int = 0, chunk_rows: int = 1000) -> Iterator[Entry]:
+    """
+    Positions count data rows. Read in pandas chunks, so quoted multi-line bodies are handled.
+    """
+    import pandas as pd
+    row_no = 0
+    columns: Optional[Dict[str, int]] = None
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        if columns is None:
+            columns = _column_map(list(chunk.columns))
+        if row_no + len(chunk) <= start:
+            row_no += len(chunk)
+            continue
+        for row in chunk.itertuples(index=False, name=None):
+            row_no += 1
+            if row_no > start:
+                yield row_no, _row_record(columns, row)
+
+def iter_xlsx(path: Path, start: int = 0) -> Iterator[Entry]:
+    """
+    First worksheet, header in row 1; positions count data rows. Opened read-only, which streams rows.
+    """
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _column_map(list(header))
+        for row_no, row in enumerate(rows, 1):
+            if row_no > start:
+                yield row_no, _row_record(columns, row)
+    finally:
+        workbook.close()
+
+READERS: Dict[str, Callable[[Path, int], Iterator[Entry]]] = {
+    "mbox": iter_mbox, "eml": iter_eml, "csv": iter_csv, "xlsx": iter_xlsx,
+}
+
+def detect_format(path: Path) -> ImportFormat:
+    if path.is_dir():
+        return "eml"
+    suffix = path.suffix.lower()
+    if suffix in (".mbox", ".mbx", ""):
+        return "mbox"
+    if suffix == ".eml":
+        return "eml"
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".xlsx", ".xlsm"):
+        return "xlsx"
+    raise ValueError(f"Cannot tell the format of {path.name}; pass format explicitly")
+
+def resolve_import_path(relative: str) -> Path:
+    """
+    Resolves a client-supplied path inside IMPORT_DIR, refusing anything that escapes it.
+    """
+    root = IMPORT_DIR.resolve()
+    path = (root / relative).resolve()
+    if path != root and root not in path.parents:
+        raise ValueError("Path must be inside the import directory")
+    if not path.exists():
+        raise ValueError(f"{relative} does not exist in the import directory")
+    return path
+
+def _progress_key(fmt: str, path: Path) -> str:
+    return f"import:{fmt}:{path.resolve()}"
+
+def _batches(entries: Iterator[Entry], size: int) -> Iterator[Tuple[int, List[EmailRecord], int]]:
+    """
+    Yields (position after the batch, parsed records, unparseable count) per `size` records.
+    """
+    records: List[EmailRecord] = []
+    skipped = 0
+    position = None
+    for position, record in entries:
+        if record is None:
+            skipped += 1
+        else:
+            records.append(record)
+        if len(records) >= size:
+            yield position, records, skipped
+            records, skipped = [], 0
+    if position is not None and (records or skipped):
+        yield position, records, skipped
+
+class BulkImporter:
+    """
+    Streams an archive through classify → draft → persist (→ enqueue) one batch at a time. Progress is
+    saved after every batch is stored; since stores are upserts, a crash between the two only repeats
+    that batch on resume.
+    """
+    def __init__(self) -> None:
+        self.status = ImportStatus()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self, path: Path, options: ImportOptions) -> bool:
+        """
+        Runs in a background thread. False if an import is already in progress.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            entries, key = self._begin(path, options)
+        except BaseException:
+            self._lock.release()
+            raise
+        threading.Thread(target=self._finish, args=(entries, key, options, None), name="bulk-import", daemon=True).start()
+        return True
+
+    def stop(self):
+        """
+        Stops the current run after its batch; the next run with the same file resumes there.
+        """
+        self._stop.set()
+
+    def run(
+        self, path: Path, options: ImportOptions, on_batch: Optional[Callable[[ImportStatus], None]] = None
+    ) -> ImportStatus:
+        """
+        Imports in the calling thread, reporting after each stored batch.
+        """
+        if not self._lock.acquire(blocking=False):
+            return self.status
+        try:
+            entries, key = self._begin(path, options)
+        except BaseException:
+            self._lock.release()
+            raise
+        self._finish(entries, key, options, on_batch)
+        return self.status
+
+    def _begin(self, path: Path, options: ImportOptions) -> Tuple[Iterator[Entry], str]:
+        # Status is set up before start() returns, so a poll right after POST /import sees the new run
+        self._stop.clear()
+        fmt = options.format or detect_format(path)
+        key = _progress_key(fmt, path)
+        saved = None if options.restart else db.get_sync_state(key)
+        progress = json.loads(saved) if saved else {"position": 0, "imported": 0}
+        self.status = ImportStatus(
+            path=str(path), format=fmt, running=True, started=datetime.utcnow(),
+            resumed_from=progress["position"], position=progress["position"], imported_total=progress["imported"],
+        )
+        return READERS[fmt](path, progress["position"]), key
+
+    def _finish(
+        self, entries: Iterator[Entry], key: str, options: ImportOptions,
+        on_batch: Optional[Callable[[ImportStatus], None]],
+    ):
+        try:
+            self._run(entries, key, options, on_batch)
+        except Exception as e:
+            self.status.error = repr(e)
+        finally:
+            self.status.running = False
+            self.status.finished = datetime.utcnow()
+            self._lock.release()
+
+    def _run(
+        self, entries: Iterator[Entry], key: str, options: ImportOptions,
+        on_batch: Optional[Callable[[ImportStatus], None]],
+    ):
+        for position, records, skipped in _batches(entries, options.batch_size):
+            with span("import.batch"):
+                # the last copy wins, as it would in the upsert
+                records = list({r.id: r for r in records}.values())
+                results = classify_all(records, concurrency=options.concurrency)
+                items = [ProcessedEmail(record=r, classification=c, draft=d) for r, (c, d) in zip(records, results)]
+                db.save_processed(items)
+                if options.enqueue:
+                    email_queue.push_many(items)
+            s = self.status
+            s.position, s.imported, s.imported_total, s.skipped = (
+                position, s.imported + len(items), s.imported_total + len(items), s.skipped + skipped)
+            db.set_sync_state(key, json.dumps({"position": position, "imported": s.imported_total}))
+            EMAILS.inc(len(items), path="import")
+            if on_batch is not None:
+                on_batch(s)
+            if self._stop.is_set():
+                break
+
+bulk_importer = BulkImporter()
@@ -0,0 +1,222 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from .models import EmailRecord, ProcessedEmail, FetchOptions, IngestionStatus
+from .gmail_fetcher import GmailClient, gmail_clients, history_state_key
+from .ai_classifier import classify_batch, generate_reply, pack_batches
+from .pipeline import CLASSIFY_CONCURRENCY
+from .dedup import classify_unique
+from .priority_queue import email_queue
+from .metrics import span, EMAILS
+from . import database as db
+
+INGEST_INTERVAL_S = float(os.getenv("INGEST_INTERVAL_S", "0"))  # 0 disables polling; runs are then manual only
+STAGE_QUEUE_SIZE = int(os.getenv("INGEST_STAGE_QUEUE_SIZE", "4"))  # batches buffered between stages
+
+_DONE = object()
+
+class IngestionScheduler:
+    """
+    Polls Gmail on an interval (or on trigger) and streams new mail through
+    fetch → classify → draft → persist → enqueue stages. Stages run on their own threads and pass
+    batches over bounded queues, so a slow stage blocks the ones feeding it instead of buffering everything.
+    Fetches always run on the same long-lived thread, so the Gmail service gmail_clients keeps per thread
+    (and its open HTTPS connection) is reused from one run to the next.
+    """
+    def __init__(
+        self,
+        interval_s: float = INGEST_INTERVAL_S,
+        options: Optional[FetchOptions] = None,
+        client_factory: Callable[[str], GmailClient] = gmail_clients.client,
+    ) -> None:
+        self.interval_s = interval_s
+        self.options = options or FetchOptions(incremental=True)
+        self.client_factory = client_factory
+        self.status = IngestionStatus(interval_s=interval_s)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._fetcher: Optional[ThreadPoolExecutor] = None
+        self._fetcher_guard = threading.Lock()
+        self._error: Optional[BaseException] = None
+
+    # ---- scheduling ----
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ingestion-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._fetcher_guard:
+            if self._fetcher is not None:
+                self._fetcher.shutdown(wait=False)
+                self._fetcher = None
+
+    def trigger(self) -> bool:
+        """
+        Requests a run as soon as possible. False if one is already in progress.
+        """
+        if self.status.running:
+            return False
+        if self._thread is None:
+            threading.Thread(target=self.run_once, name="ingestion-run", daemon=True).start()
+        else:
+            self._wake.set()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            # interval 0 → wait for an explicit trigger
+            self._wake.wait(self.interval_s or None)
+            self._wake.clear()
+
+    def _fetch_worker(self) -> ThreadPoolExecutor:
+        with self._fetcher_guard:
+            if self._fetcher is None:
+                self._fetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-fetch")
+            return self._fetcher
+
+    # ---- one run ----
+
+    def run_once(self) -> IngestionStatus:
+        if not self._lock.acquire(blocking=False):
+            return self.status
+        try:
+            self._error = None
+            self.status.running = True
+            self.status.last_started = datetime.utcnow()
+            self.status.last_fetched = 0
+            self.status.last_processed = 0
+            self._run_pipeline()
+            self.status.last_error = repr(self._error) if self._error else None
+        finally:
+            self.status.running = False
+            self.status.last_finished = datetime.utcnow()
+            self.status.runs += 1
+            self._lock.release()
+        return self.status
+
+    def _run_pipeline(self):
+        workers = max(1, self.options.concurrency or CLASSIFY_CONCURRENCY)
+        fetched: queue.Queue = queue.Queue(STAGE_QUEUE_SIZE)
+        classified: queue.Queue = queue.Queue(STAGE_QUEUE_SIZE)
+        drafted: queue.Queue = queue.Queue(STAGE_QUEUE_SIZE)
+        persisted: queue.Queue = queue.Queue(STAGE_QUEUE_SIZE)
+        history_id: List[str] = []
+
+        def fetch() -> None:
+            try:
+                with span("gmail.fetch"):
+                    records = self._fetch(history_id)
+                self.status.last_fetched = len(records)
+                for batch in pack_batches(records):
+                    fetched.put(batch)
+            except Exception as e:
+                self._fail(e)
+            finally:
+                for _ in range(workers):
+                    fetched.put(_DONE)
+
+        def classify(batch: List[EmailRecord]):
+            # near-duplicates of classified mail come back with that email's draft already attached
+            results = classify_unique(batch, lambda unique: [(c, None) for c in classify_batch(unique)])
+            yield [(r, c, d) for r, (c, d) in zip(batch, results)]
+
+        def draft(triples):
+            with span("draft"):
+                drafted_items = [
+                    ProcessedEmail(record=r, classification=c, draft=d or generate_reply(r, c)) for r, c, d in triples
+                ]
+            yield drafted_items
+
+        def persist(items: List[ProcessedEmail]):
+            db.save_processed(items)
+            yield items
+
+        def enqueue(items: List[ProcessedEmail]):
+            email_queue.push_many(items)
+            self.status.last_processed += len(items)
+            EMAILS.inc(len(items), path="ingest")
+            return ()
+
+        fetching = self._fetch_worker().submit(fetch)
+        threads = [
+            threading.Thread(target=self._stage, args=(classify, fetched, classified, 1, 1), name=f"ingest-classify-{i}")
+            for i in range(workers)
+        ]
+        threads += [
+            threading.Thread(target=self._stage, args=(draft, classified, drafted, workers, 1), name="ingest-draft"),
+            threading.Thread(target=self._stage, args=(persist, drafted, persisted, 1, 1), name="ingest-persist"),
+            threading.Thread(target=self._stage, args=(enqueue, persisted, None, 1, 0), name="ingest-enqueue"),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        fetching.result()
+
+        if self._error is None and history_id:
+            # Only advance the cursor once everything up to it has been stored
+            db.set_sync_state(history_state_key(self.options.account), history_id[0])
+
+    def _fetch(self, history_id: List[str]) -> List[EmailRecord]:
+        o = self.options
+        client = self.client_factory(o.account)
+        if o.incremental:
+            records, latest = client.fetch_since(
+                db.get_sync_state(history_state_key(o.account)), max_results=o.max_results,
+                hours_lookback=o.hours_lookback, only_unread=o.only_unread, query_terms=o.query_terms,
+                include_body=o.include_body,
+            )
+            history_id.append(latest)
+            return records
+        return client.fetch_recent(
+            max_results=o.max_results, hours_lookback=o.hours_lookback,
+            only_unread=o.only_unread, query_terms=o.query_terms, include_body=o.include_body,
+        )
+
+    def _stage(
+        self, work: Callable[[object], Iterable], inq: queue.Queue, outq: Optional[queue.Queue],
+        upstream: int, downstream: int,
+    ):
+        """
+        Applies work to every item until `upstream` producers have finished, then signals `downstream`
+        consumers. After a failure anywhere, items are drained and dropped so no producer stays blocked.
+        """
+        remaining = upstream
+        try:
+            while remaining:
+                item = inq.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                if self._error is not None:
+                    continue
+                try:
+                    for out in work(item):
+                        outq.put(out)
+                except Exception as e:
+                    self._fail(e)
+        finally:
+            for _ in range(downstream):
+                outq.put(_DONE)
+
+    def _fail(self, e: BaseException):
+        if self._error is None:
+            self._error = e
+
+ingestion = IngestionScheduler()
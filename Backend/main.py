@@ -1,83 +1,328 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
 from datetime import datetime, timedelta
 import os
+import time
 
 from .models import (
     EmailIn, EmailRecord, ClassificationResult, ResponseDraft,
-    ProcessedEmail, FetchOptions, Stats
+    ProcessedEmail, FetchOptions, Stats, EmailSummary, EmailFilters, QueueClaim, IngestionStatus,
+    SearchHit, ImportOptions, ImportStatus, QueueEntry, CompactionStatus,
 )
-from .gmail_fetcher import GmailClient
-from .ai_classifier import classify_with_gemini, generate_reply
+from .gmail_fetcher import gmail_clients, history_state_key
+from .classification_cache import classification_cache
+from .local_model import local_classifier
+from .pipeline import classify_all
+from .threads import process_threads
 from .priority_queue import email_queue
+from .ingestion import ingestion
+from .importer import bulk_importer, resolve_import_path, detect_format
+from .retention import retention
+from .aio import run_db, run_blocking
+from . import metrics
+from .metrics import span, EMAILS
 from . import database as db
 
 app = FastAPI(title="AI Email Assistant Backend", version="1.0.0")
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Backend is working!"}
 
 # Allow local dev frontends
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+def _cache_lookups():
+    s = classification_cache.stats()
+    return {("hit",): s["hits"], ("db_hit",): s["db_hits"], ("miss",): s["misses"]}
+
+metrics.registry.gauge(
+    "email_assistant_queue_depth", "Queue entries by state.", ("state",),
+    lambda: {(state,): n for state, n in email_queue.depth().items()},
+)
+metrics.registry.gauge(
+    "email_assistant_classification_cache_lookups_total", "Classification cache lookups (db_hit is a subset of hit).",
+    ("result",), _cache_lookups, kind="counter",
+)
+metrics.registry.gauge(
+    "email_assistant_classification_cache_entries", "Entries in the in-memory classification cache.", (),
+    lambda: {(): classification_cache.stats()["size"]},
+)
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """
+    Request latency by route template; with "X-Profile: 1", a Server-Timing header with per-stage totals.
+    """
+    profile = None
+    if metrics.PROFILE_HEADER_ENABLED and request.headers.get(metrics.PROFILE_HEADER) == "1":
+        profile = metrics.Profile()
+        metrics.current_profile.set(profile)
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(
+        elapsed, method=request.method, route=getattr(route, "path", "unmatched"), status=str(response.status_code)
+    )
+    if profile is not None:
+        profile.add("total", elapsed)
+        response.headers["Server-Timing"] = profile.server_timing()
+    return response
+
 # Initialize DB on startup
 @app.on_event("startup")
 def on_startup():
     db.init_db()
+    db.purge_classification_cache(older_than=time.time() - classification_cache.ttl_s)
+    gmail_clients.start()
+    if ingestion.interval_s > 0:
+        ingestion.start()
+    if retention.interval_s > 0:
+        retention.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    ingestion.stop()
+    retention.stop()
+    bulk_importer.stop()
+    gmail_clients.stop()
 
 @app.get("/health")
-def health():
+async def health():
     return {
         "status": "ok",
         "gmail_credentials_json_exists": os.path.exists("credentials.json"),
         "token_exists": os.path.exists("token.json"),
+        "gmail_accounts": gmail_clients.status(),
         "gemini_key_present": bool(os.getenv("GEMINI_API_KEY", "")),
+        "classification_cache": classification_cache.stats(),
+        "local_model": await run_db(local_classifier.status),
+        "queue": await run_db(email_queue.depth),
         "time": datetime.utcnow().isoformat() + "Z",
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus text format. Counters are per process.
+    """
+    return PlainTextResponse(await run_db(metrics.registry.render), media_type="text/plain; version=0.0.4")
+
+@app.post("/ingest/run", response_model=IngestionStatus, status_code=202)
+async def trigger_ingestion():
+    """
+    Starts a background fetch → classify → draft → persist → enqueue run and returns immediately.
+    """
+    if not ingestion.trigger():
+        raise HTTPException(status_code=409, detail="Ingestion run already in progress")
+    return ingestion.status
+
+@app.get("/ingest/status", response_model=IngestionStatus)
+async def ingestion_status():
+    return ingestion.status
+
+@app.post("/import", response_model=ImportStatus, status_code=202)
+async def start_import(options: ImportOptions):
+    """
+    Backfills an mbox, .eml directory, CSV or XLSX export from IMPORT_DIR in the background.
+    Re-posting the same file resumes where the last run stopped unless restart is set.
+    """
+    try:
+        path = resolve_import_path(options.path)
+        options.format = options.format or detect_format(path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not bulk_importer.start(path, options):
+        raise HTTPException(status_code=409, detail="Import already in progress")
+    return bulk_importer.status
+
+@app.get("/import/status", response_model=ImportStatus)
+async def import_status():
+    return bulk_importer.status
+
+@app.post("/maintenance/compact", response_model=CompactionStatus, status_code=202)
+async def trigger_compaction():
+    """
+    Starts a background retention run: delete expired mail, archive old bodies, VACUUM if worthwhile, ANALYZE.
+    """
+    if not retention.trigger():
+        raise HTTPException(status_code=409, detail="Compaction already in progress")
+    return retention.status
+
+@app.get("/maintenance/status", response_model=CompactionStatus)
+async def compaction_status():
+    return retention.status
+
 @app.post("/emails/fetch", response_model=List[ProcessedEmail])
-def fetch_and_process(options: FetchOptions):
+async def fetch_and_process(options: FetchOptions):
     """
     Fetch recent Gmail emails, classify & prioritize them, store in DB, return the processed list.
+    Responds when the whole run is done; /ingest/run does the same work in the background.
     """
-    client = GmailClient()
-    emails = client.fetch_recent(
-        max_results=options.max_results,
-        hours_lookback=options.hours_lookback,
-        only_unread=options.only_unread,
-        query_terms=options.query_terms,
-    )
+    return await run_blocking(_fetch_and_process, options)
 
-    processed: List[ProcessedEmail] = []
-    for rec in emails:
-        db.upsert_email(rec)
-        cls: ClassificationResult = classify_with_gemini(rec)
-        draft: ResponseDraft = generate_reply(rec, cls)
+def _fetch_and_process(options: FetchOptions) -> List[ProcessedEmail]:
+    with span("fetch_and_process"):
+        processed = _fetch_and_process_timed(options)
+    EMAILS.inc(len(processed), path="fetch")
+    return processed
 
-        db.upsert_classification(rec.id, cls)
-        db.upsert_draft(rec.id, draft)
+def _fetch_and_process_timed(options: FetchOptions) -> List[ProcessedEmail]:
+    client = gmail_clients.client(options.account)
+    if options.incremental:
+        emails, history_id = client.fetch_since(
+            db.get_sync_state(history_state_key(options.account)),
+            max_results=options.max_results,
+            hours_lookback=options.hours_lookback,
+            only_unread=options.only_unread,
+            query_terms=options.query_terms,
+            include_body=options.include_body,
+        )
+    else:
+        emails = client.fetch_recent(
+            max_results=options.max_results,
+            hours_lookback=options.hours_lookback,
+            only_unread=options.only_unread,
+            query_terms=options.query_terms,
+            include_body=options.include_body,
+        )
 
-        p = ProcessedEmail(record=rec, classification=cls, draft=draft)
-        processed.append(p)
-        email_queue.push(p)
+    if options.thread_mode:
+        processed, heads = process_threads(emails, concurrency=options.concurrency)
+        db.save_processed(processed)
+        email_queue.push_many(heads, one_per_thread=True)
+    else:
+        results = classify_all(emails, concurrency=options.concurrency)
+        processed = [
+            ProcessedEmail(record=rec, classification=cls, draft=draft)
+            for rec, (cls, draft) in zip(emails, results)
+        ]
+        db.save_processed(processed)
+        email_queue.push_many(processed)
 
+    if options.incremental:
+        # Only advance the cursor once everything up to it has been stored
+        db.set_sync_state(history_state_key(options.account), history_id)
     return processed
 
 @app.get("/emails", response_model=List[ProcessedEmail])
-def list_emails(limit: int = 100):
-    return db.list_processed(limit=limit)
+async def list_emails(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    filters: EmailFilters = Depends(),
+):
+    """
+    Newest first. When more results exist, the X-Next-Cursor header holds the cursor for the next page.
+    """
+    try:
+        items, next_cursor = await run_db(db.list_processed_page, limit=limit, cursor=cursor, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+@app.get("/emails/summaries", response_model=List[EmailSummary])
+async def list_email_summaries(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    filters: EmailFilters = Depends(),
+):
+    """
+    Lightweight listing for the dashboard; fetch /emails/{email_id} for the body and draft.
+    """
+    try:
+        items, next_cursor = await run_db(db.list_summaries_page, limit=limit, cursor=cursor, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+@app.get("/emails/search", response_model=List[SearchHit])
+async def search_emails(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    filters: EmailFilters = Depends(),
+):
+    """
+    Ranked full-text search over subject, sender, body and summary. Matched terms are wrapped in
+    <mark></mark> in subject_highlight and snippet_highlight.
+    """
+    try:
+        hits, next_cursor = await run_db(db.search_emails, q, limit=limit, cursor=cursor, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return hits
 
 @app.get("/emails/queue/next", response_model=ProcessedEmail | None)
-def next_email():
-    return email_queue.pop()
+async def next_email():
+    """
+    Pops (claims and immediately acks) the most urgent email.
+    """
+    return await run_db(email_queue.pop)
+
+@app.get("/emails/queue/peek", response_model=List[QueueEntry])
+async def peek_queue(n: int = Query(10, ge=1, le=500)):
+    """
+    The next n emails a claim would return, in order, with their aged urgency and SLA deadline.
+    """
+    return await run_db(email_queue.peek, n)
+
+@app.post("/emails/queue/claim", response_model=QueueClaim | None)
+async def claim_email(visibility_timeout_s: Optional[float] = Query(None, gt=0)):
+    """
+    Claims the most urgent email for processing. Ack it with the returned token before the
+    visibility timeout expires, or it becomes available to other agents again.
+    """
+    timeout = visibility_timeout_s or email_queue.visibility_timeout_s
+    claimed = await run_db(email_queue.claim, timeout)
+    if claimed is None:
+        return None
+    token, pemail = claimed
+    return QueueClaim(token=token, visibility_timeout_s=timeout, email=pemail)
+
+@app.post("/emails/queue/{email_id}/ack")
+async def ack_email(email_id: str, token: str):
+    if not await run_db(email_queue.ack, email_id, token):
+        raise HTTPException(status_code=409, detail="Claim expired or token does not match")
+    return {"acked": email_id}
+
+@app.post("/emails/queue/{email_id}/release")
+async def release_email(email_id: str, token: str):
+    if not await run_db(email_queue.release, email_id, token):
+        raise HTTPException(status_code=409, detail="Claim expired or token does not match")
+    return {"released": email_id}
+
+@app.get("/emails/{email_id}", response_model=ProcessedEmail)
+async def get_email(email_id: str):
+    p = await run_db(db.get_processed, email_id)
+    if p is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return p
+
+@app.get("/emails/{email_id}/duplicates", response_model=List[EmailSummary])
+async def get_duplicates(email_id: str, limit: int = Query(100, ge=1, le=1000)):
+    """
+    The other emails in this email's near-duplicate cluster, oldest first.
+    """
+    return await run_db(db.get_cluster_members, email_id, limit)
 
 @app.post("/process", response_model=ProcessedEmail)
-def process_manual(email: EmailIn):
+async def process_manual(email: EmailIn):
     """
     Accept a raw email (e.g., from CSV or webhook), classify and enqueue.
     """
@@ -92,24 +337,33 @@ def process_manual(email: EmailIn):
         is_unread=True,
         source="manual",
     )
-    db.upsert_email(record)
-    cls = classify_with_gemini(record)
-    draft = generate_reply(record, cls)
-    db.upsert_classification(record.id, cls)
-    db.upsert_draft(record.id, draft)
-    p = ProcessedEmail(record=record, classification=cls, draft=draft)
-    email_queue.push(p)
+    with span("process_manual"):
+        # classify_all so a near-duplicate of a classified email reuses its result
+        (cls, draft), = await run_blocking(classify_all, [record])
+        p = ProcessedEmail(record=record, classification=cls, draft=draft)
+        await run_db(db.save_processed, [p])
+        await run_db(email_queue.push, p)
+    EMAILS.inc(path="manual")
     return p
 
 @app.get("/stats", response_model=Stats)
-def stats():
-    cats = db.get_counts_by_category()
-    # simple derived stats
-    processed = sum(cats.values())
+async def stats(window_hours: Optional[int] = Query(None, ge=1, le=24 * 366)):
+    """
+    Served from materialized counters. With window_hours, counts cover mail sent in the last N hours
+    and include an hourly category breakdown.
+    """
+    since = None
+    if window_hours:
+        since = (datetime.utcnow() - timedelta(hours=window_hours)).strftime("%Y-%m-%dT%H")
+    counts = await run_db(db.get_stats, since_bucket=since)
+    cats = counts.get("category", {})
     return Stats(
-        total_processed=processed,
-        drafts_created=processed,  # 1:1 with processed in this design
-        emails_sent=0,             # wire up later to send email
+        total_processed=sum(cats.values()),
+        drafts_created=counts.get("drafts", {}).get("created", 0),
         categories=cats,
+        priorities=counts.get("priority", {}),
+        sentiments=counts.get("sentiment", {}),
+        window_hours=window_hours,
+        hourly=await run_db(db.get_hourly_counts, "category", since) if since else None,
         last_run=datetime.utcnow().isoformat() + "Z",
     )
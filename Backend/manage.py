@@ -0,0 +1,109 @@
+"""
+Maintenance commands.
+
+    python -m Backend.manage rebuild-stats
+    python -m Backend.manage rebuild-search
+    python -m Backend.manage rebuild-near-duplicates
+    python -m Backend.manage import PATH [--format mbox|eml|csv|xlsx] [--batch-size 200] [--enqueue] [--restart]
+    python -m Backend.manage train-local-model [--limit 200000] [--holdout 0.2]
+    python -m Backend.manage evaluate-local-model [--holdout 0.2]
+    python -m Backend.manage compact [--archive-after-days 30] [--delete-after-days 0] [--vacuum | --no-vacuum]
+"""
+import argparse
+from pathlib import Path
+
+from .models import ImportOptions
+from . import database as db
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild-stats", help="recompute /stats counters from the emails/classifications/drafts tables")
+    sub.add_parser("rebuild-search", help="re-index every stored email for /emails/search and optimize the index")
+    sub.add_parser("rebuild-near-duplicates", help="re-cluster every stored email (after changing DEDUP_* settings)")
+
+    p = sub.add_parser("import", help="backfill an mbox, .eml directory, CSV or XLSX export; resumes if interrupted")
+    p.add_argument("path")
+    p.add_argument("--format", choices=["mbox", "eml", "csv", "xlsx"])
+    p.add_argument("--batch-size", type=int, default=200)
+    p.add_argument("--concurrency", type=int)
+    p.add_argument("--enqueue", action="store_true", help="also push imported mail onto the work queue")
+    p.add_argument("--restart", action="store_true", help="ignore saved progress")
+
+    p = sub.add_parser("train-local-model", help="train the local classifier on stored LLM labels and report accuracy")
+    p.add_argument("--limit", type=int, default=200000, help="newest labelled emails to use")
+    p.add_argument("--holdout", type=float, default=0.2, help="share of emails kept out of training for the report")
+    p.add_argument("--epochs", type=int, default=8)
+    p.add_argument("--min-examples", type=int, default=200)
+    p = sub.add_parser("evaluate-local-model", help="report the saved local classifier's agreement with the LLM labels")
+    p.add_argument("--limit", type=int, default=200000)
+    p.add_argument("--holdout", type=float, default=0.2)
+    p = sub.add_parser("compact", help="delete expired mail, archive old bodies compressed, VACUUM and ANALYZE")
+    p.add_argument("--archive-after-days", type=float, help="default RETENTION_ARCHIVE_AFTER_DAYS; 0 archives nothing")
+    p.add_argument("--delete-after-days", type=float, help="default RETENTION_DELETE_AFTER_DAYS; 0 deletes nothing")
+    p.add_argument("--vacuum", action=argparse.BooleanOptionalAction, help="default: only when enough space is free")
+
+    args = parser.parse_args()
+    db.init_db()
+    if args.command == "rebuild-stats":
+        db.rebuild_stats()
+        print("stats counters rebuilt:", db.get_stats())
+    elif args.command == "rebuild-search":
+        db.rebuild_search_index()
+        print("search index rebuilt")
+    elif args.command == "rebuild-near-duplicates":
+        from .dedup import near_duplicates
+        counts = near_duplicates.rebuild()
+        print(f"{counts['indexed']} emails indexed in {counts['clusters']} clusters")
+    elif args.command == "import":
+        from .importer import bulk_importer
+        options = ImportOptions(
+            path=args.path, format=args.format, batch_size=args.batch_size, concurrency=args.concurrency,
+            enqueue=args.enqueue, restart=args.restart,
+        )
+        try:
+            status = bulk_importer.run(Path(args.path), options, on_batch=lambda s: print(
+                f"  position {s.position}: {s.imported} imported, {s.skipped} skipped", flush=True))
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"cannot import {args.path}: {e}")
+        if status.resumed_from:
+            print(f"resumed from position {status.resumed_from}")
+        print(f"{status.imported} imported ({status.imported_total} in total), {status.skipped} skipped")
+        if status.error:
+            raise SystemExit(f"import stopped: {status.error}")
+    elif args.command == "train-local-model":
+        from . import local_model
+        train, test = local_model.split(local_model.load_examples(args.limit), args.holdout)
+        if len(train) < args.min_examples:
+            raise SystemExit(f"only {len(train)} LLM-labelled emails to train on (need {args.min_examples})")
+        model = local_model.train(train, epochs=args.epochs)
+        if test:
+            model.meta["evaluation"] = local_model.evaluate(model, test)
+            print(local_model.format_report(model.meta["evaluation"]))
+        model.save(local_model.LOCAL_MODEL_PATH)
+        print(f"trained on {len(train)} emails, saved to {local_model.LOCAL_MODEL_PATH}")
+    elif args.command == "evaluate-local-model":
+        from . import local_model
+        _, test = local_model.split(local_model.load_examples(args.limit), args.holdout)
+        if not local_model.LOCAL_MODEL_PATH.exists():
+            raise SystemExit(f"no model at {local_model.LOCAL_MODEL_PATH}; run train-local-model first")
+        model = local_model.LocalModel.load(local_model.LOCAL_MODEL_PATH)
+        print(local_model.format_report(local_model.evaluate(model, test)))
+    elif args.command == "compact":
+        from . import retention
+        scheduler = retention.RetentionScheduler(
+            interval_s=0,
+            archive_after_days=retention.ARCHIVE_AFTER_DAYS if args.archive_after_days is None else args.archive_after_days,
+            delete_after_days=retention.DELETE_AFTER_DAYS if args.delete_after_days is None else args.delete_after_days,
+        )
+        status = scheduler.run_once(vacuum=args.vacuum)
+        if status.last_error:
+            raise SystemExit(f"compaction failed: {status.last_error}")
+        ratio = status.compressed_bytes / status.text_bytes if status.text_bytes else 0.0
+        print(f"{status.deleted} emails deleted, {status.archived} bodies archived "
+              f"({status.text_bytes} bytes of text stored in {status.compressed_bytes}, {ratio:.0%})")
+        print(f"database {status.file_bytes_before} -> {status.file_bytes_after} bytes, "
+              f"{status.bytes_reclaimed} reclaimed" + (" (vacuumed)" if status.vacuumed else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Minimal Prometheus text-format metrics (no client library needed) plus per-request profiles.
+# Everything is process-local; scrape every worker process separately.
+
+PROFILE_HEADER = "X-Profile"  # send "X-Profile: 1" to get a Server-Timing breakdown of that request
+PROFILE_HEADER_ENABLED = os.getenv("METRICS_PROFILE_HEADER", "1") == "1"
+
+# Seconds; covers SQLite calls (sub-ms) through batched LLM prompts (tens of seconds)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[n]) for n in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+        return lines
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        self._series: Dict[LabelValues, List[float]] = {}  # per-bucket counts, then sum, then count
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels: str):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(cumulative)}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(series[-1])}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {repr(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(series[-1])}")
+        return lines
+
+class Gauge:
+    """
+    Read at scrape time from a callback returning {label values: value}, so nothing has to keep it current.
+    kind="counter" exposes totals that another component already keeps.
+    """
+    def __init__(
+        self, name: str, help: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[LabelValues, float]],
+        kind: str = "gauge",
+    ) -> None:
+        self.name, self.help, self.labelnames, self.collect, self.kind = name, help, labelnames, collect, kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(self.collect().items())]
+        return lines
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        return self._add(Histogram(name, help, labelnames))
+
+    def gauge(
+        self, name: str, help: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[LabelValues, float]],
+        kind: str = "gauge",
+    ) -> Gauge:
+        return self._add(Gauge(name, help, labelnames, collect, kind))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4). Gauge callbacks may hit the database.
+        """
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "email_assistant_stage_seconds", "Time spent per pipeline stage.", ("stage",))
+DB_SECONDS = registry.histogram(
+    "email_assistant_db_seconds", "SQLite statement/transaction latency.", ("op",))
+HTTP_SECONDS = registry.histogram(
+    "email_assistant_http_request_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+LLM_CALLS = registry.counter(
+    "email_assistant_llm_calls_total", "generate_content attempts by outcome (ok, rate_limited, error).", ("outcome",))
+CLASSIFICATIONS = registry.counter(
+    "email_assistant_classifications_total",
+    "Emails classified, by where the result came from (cache, local, llm, llm_batch, heuristic, duplicate).",
+    ("source",))
+LLM_FALLBACKS = registry.counter(
+    "email_assistant_llm_fallbacks_total",
+    "Emails whose LLM path failed, by reason: no_api_key and llm_error fall back to heuristics; "
+    "batch_error (the whole multi-email prompt failed) and batch_item (missing from its answer) "
+    "are retried as single-email prompts.", ("reason",))
+EMAILS = registry.counter(
+    "email_assistant_emails_total", "Emails processed by entry point.", ("path",))
+
+class Profile:
+    """
+    Per-request stage totals, filled in from whichever threads do the request's work.
+    """
+    def __init__(self) -> None:
+        self._stages: Dict[str, List[float]] = {}  # stage → [total seconds, count]
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self) -> str:
+        with self._lock:
+            items = sorted(self._stages.items(), key=lambda kv: -kv[1][0])
+        return ", ".join(f'{stage};dur={total * 1000:.2f};desc="x{count}"' for stage, (total, count) in items)
+
+current_profile: ContextVar[Optional[Profile]] = ContextVar("current_profile", default=None)
+
+def _record(histogram: Histogram, label: str, profile_name: str, seconds: float):
+    histogram.observe(seconds, **{histogram.labelnames[0]: label})
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add(profile_name, seconds)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Times a pipeline stage into STAGE_SECONDS and the current request's profile, if any.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(STAGE_SECONDS, stage, stage, time.perf_counter() - start)
+
+@contextmanager
+def db_span(op: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(DB_SECONDS, op, f"db.{op}", time.perf_counter() - start)
@@ -21,7 +21,7 @@ class EmailRecord(BaseModel):
     sent_date: datetime
     snippet: Optional[str] = None
     is_unread: bool = True
-    source: Literal["gmail", "manual"] = "gmail"
+    source: Literal["gmail", "manual", "import"] = "gmail"
 
 class Extraction(BaseModel):
     phone_numbers: List[str] = []
@@ -38,6 +38,7 @@ class ClassificationResult(BaseModel):
     requires_response: bool = True
     confidence: float = Field(ge=0.0, le=1.0, default=0.7)
     extraction: Extraction = Field(default_factory=Extraction)
+    source: Optional[Literal["llm", "heuristic", "local", "duplicate"]] = None  # what produced it; None if stored before tracking
 
 class ResponseDraft(BaseModel):
     subject: str
@@ -52,15 +53,125 @@ class ProcessedEmail(BaseModel):
     classification: ClassificationResult
     draft: Optional[ResponseDraft] = None
 
+class QueueClaim(BaseModel):
+    token: str
+    visibility_timeout_s: float
+    email: ProcessedEmail
+
+class EmailSummary(BaseModel):
+    """
+    Listing projection: what a dashboard card shows, without bodies, drafts or extraction.
+    """
+    id: str
+    thread_id: Optional[str] = None
+    sender: str
+    subject: str
+    snippet: Optional[str] = None
+    sent_date: datetime
+    is_unread: bool = True
+    summary: Optional[str] = None
+    category: Optional[str] = None
+    sentiment: Optional[Sentiment] = None
+    priority: Optional[PriorityTag] = None
+    urgency_score: Optional[int] = None
+    has_draft: bool = False
+
+class SearchHit(EmailSummary):
+    """
+    A search result: the listing projection plus its relevance and highlighted text.
+    """
+    score: float  # higher is more relevant; only comparable within one query
+    subject_highlight: str = ""
+    snippet_highlight: str = ""
+
+class QueueEntry(EmailSummary):
+    """
+    A pending queue entry, in the order claim() would hand it out.
+    """
+    effective_urgency: int  # urgency_score raised by aging; reaches 10 when the SLA runs out
+    due_at: Optional[datetime] = None  # SLA deadline (UTC), counted from sent_date
+    duplicates: int = 0  # near-duplicates folded into this entry
+
+class EmailFilters(BaseModel):
+    category: Optional[str] = None
+    priority: Optional[PriorityTag] = None
+    sentiment: Optional[Sentiment] = None
+    min_urgency: Optional[int] = Field(default=None, ge=1, le=10)
+    unread: Optional[bool] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
 class FetchOptions(BaseModel):
     max_results: int = 10
     hours_lookback: int = 48
     only_unread: bool = True
     query_terms: Optional[str] = None
+    incremental: bool = False  # only fetch mail added since the last stored Gmail historyId
+    concurrency: Optional[int] = None  # parallel LLM calls; defaults to CLASSIFY_CONCURRENCY
+    include_body: bool = True  # False fetches headers + snippet only (Gmail format=metadata)
+    thread_mode: bool = False  # classify/draft/enqueue once per conversation instead of once per message
+    account: str = Field("default", pattern=r"^[A-Za-z0-9_-]{1,64}$")  # mailbox key, see GmailClientManager
+
+class IngestionStatus(BaseModel):
+    interval_s: float = 0.0
+    running: bool = False
+    runs: int = 0
+    last_started: Optional[datetime] = None
+    last_finished: Optional[datetime] = None
+    last_fetched: int = 0
+    last_processed: int = 0
+    last_error: Optional[str] = None
+
+class CompactionStatus(BaseModel):
+    """
+    The latest retention run: what it archived or deleted and how much disk it gave back.
+    """
+    interval_s: float = 0.0
+    running: bool = False
+    runs: int = 0
+    last_started: Optional[datetime] = None
+    last_finished: Optional[datetime] = None
+    archived: int = 0  # emails whose bodies moved to cold storage
+    deleted: int = 0  # emails past the retention limit
+    text_bytes: int = 0  # bodies, drafts and extraction JSON moved to cold storage
+    compressed_bytes: int = 0  # what they take there
+    file_bytes_before: int = 0  # database plus WAL
+    file_bytes_after: int = 0
+    bytes_reclaimed: int = 0
+    vacuumed: bool = False
+    analyzed: bool = False
+    last_error: Optional[str] = None
+
+ImportFormat = Literal["mbox", "eml", "csv", "xlsx"]
+
+class ImportOptions(BaseModel):
+    path: str  # for POST /import, relative to IMPORT_DIR
+    format: Optional[ImportFormat] = None  # guessed from the extension (a directory means .eml files)
+    batch_size: int = Field(200, ge=1, le=5000)  # emails classified and written per transaction
+    concurrency: Optional[int] = None  # parallel LLM calls; defaults to CLASSIFY_CONCURRENCY
+    enqueue: bool = False  # also push imported mail onto the work queue
+    restart: bool = False  # ignore saved progress and start from the beginning
+
+class ImportStatus(BaseModel):
+    path: Optional[str] = None
+    format: Optional[ImportFormat] = None
+    running: bool = False
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+    resumed_from: int = 0  # position (byte offset, file or row number) the run started at
+    position: int = 0
+    imported: int = 0  # this run
+    imported_total: int = 0  # across resumed runs of the same file
+    skipped: int = 0  # entries that could not be parsed
+    error: Optional[str] = None
 
 class Stats(BaseModel):
     total_processed: int = 0
     drafts_created: int = 0
-    emails_sent: int = 0
+    emails_sent: int = Field(0, deprecated="Unsupported: there is no send path yet, so this is always 0.")
     categories: Dict[str, int] = {}
+    priorities: Dict[str, int] = {}
+    sentiments: Dict[str, int] = {}
+    window_hours: Optional[int] = None  # set when counts are limited to the last N hours (by sent_date)
+    hourly: Optional[Dict[str, Dict[str, int]]] = None  # hour bucket → category counts, within the window
     last_run: Optional[str] = None
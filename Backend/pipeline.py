@@ -0,0 +1,41 @@
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from .models import EmailRecord, ClassificationResult, ResponseDraft
+from .ai_classifier import classify_batch, generate_reply, pack_batches
+from .dedup import classify_unique
+from .metrics import span
+
+# Max LLM requests in flight; each one classifies a packed batch of emails
+CLASSIFY_CONCURRENCY = int(os.getenv("CLASSIFY_CONCURRENCY", "8"))
+
+def _classify_and_draft(records: List[EmailRecord]) -> List[Tuple[ClassificationResult, ResponseDraft]]:
+    classified = classify_batch(records)
+    with span("draft"):
+        return [(cls, generate_reply(r, cls)) for r, cls in zip(records, classified)]
+
+def classify_all(
+    records: List[EmailRecord], concurrency: Optional[int] = None
+) -> List[Tuple[ClassificationResult, ResponseDraft]]:
+    """
+    Packs records into multi-email prompts, then classifies and drafts replies on a bounded thread pool.
+    Near-duplicates of already classified mail reuse that result instead (see dedup.py).
+    Results come back in input order; persisting them is left to the caller.
+    """
+    return classify_unique(records, lambda unique: _classify_all(unique, concurrency))
+
+def _classify_all(
+    records: List[EmailRecord], concurrency: Optional[int]
+) -> List[Tuple[ClassificationResult, ResponseDraft]]:
+    batches = pack_batches(records)
+    workers = max(1, min(concurrency or CLASSIFY_CONCURRENCY, len(batches)))
+    if workers == 1:
+        chunks = [_classify_and_draft(b) for b in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="classify") as pool:
+            # each task gets its own copy of the caller's context (a Context can only be entered once at a time)
+            futures = [pool.submit(contextvars.copy_context().run, _classify_and_draft, b) for b in batches]
+            chunks = [f.result() for f in futures]
+    return [pair for chunk in chunks for pair in chunk]
@@ -1,27 +1,127 @@
-import heapq
+import os
+import json
 import time
-from typing import Tuple, Optional
-from .models import ProcessedEmail
+import uuid
+from datetime import timezone
+from typing import Dict, List, Optional, Tuple
+from .models import ProcessedEmail, QueueEntry
+from .metrics import span
+from . import database as db
+
+VISIBILITY_TIMEOUT_S = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT_S", "300"))
+
+# Response-time targets in hours, by category and then priority tag; "*" is the fallback at either level.
+# An entry's effective urgency climbs to 10 as its SLA runs out, so nothing waits forever behind urgent mail.
+DEFAULT_SLA_HOURS: Dict[str, Dict[str, float]] = {
+    "*": {"urgent": 4, "not_urgent": 48},
+}
+
+def load_sla(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    SLA table from a JSON file shaped like DEFAULT_SLA_HOURS if QUEUE_SLA_PATH is set; its entries override the defaults.
+    """
+    path = path or os.getenv("QUEUE_SLA_PATH", "")
+    if not path:
+        return DEFAULT_SLA_HOURS
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    table = {category: dict(hours) for category, hours in DEFAULT_SLA_HOURS.items()}
+    for category, hours in overrides.items():
+        if any(h <= 0 for h in hours.values()):
+            raise ValueError(f"SLA hours for {category} must be positive")
+        table.setdefault(category, {}).update(hours)
+    return table
 
 class PriorityEmailQueue:
     """
-    Min-heap based on (-urgency_score, timestamp) so higher urgency pops first.
+    SQLite-backed queue ordered by effective urgency, then sent date. Effective urgency starts at the
+    email's urgency_score and rises as the email ages toward its SLA (see load_sla), reaching 10 when
+    the SLA runs out; the rise is applied lazily, a step at a time, as entries come due.
+    One entry per email id; survives restarts and is safe to share across threads and processes.
+    Agents claim() an email, then ack() it when done; unacked claims become visible again after the timeout.
     """
-    def __init__(self) -> None:
-        self._heap: list[Tuple[int, float, str, ProcessedEmail]] = []
+    def __init__(
+        self, visibility_timeout_s: float = VISIBILITY_TIMEOUT_S, sla_hours: Optional[Dict[str, Dict[str, float]]] = None
+    ) -> None:
+        self.visibility_timeout_s = visibility_timeout_s
+        self.sla_hours = sla_hours or load_sla()
 
-    def push(self, pemail: ProcessedEmail):
+    @staticmethod
+    def _priority(pemail: ProcessedEmail) -> int:
         # higher urgency → smaller negative value → pops first
-        priority_key = -int(pemail.classification.urgency_score if pemail.classification else 5)
-        heapq.heappush(self._heap, (priority_key, time.time(), pemail.record.id, pemail))
+        return -int(pemail.classification.urgency_score if pemail.classification else 5)
+
+    def sla_s(self, category: Optional[str], priority: Optional[str]) -> float:
+        default = self.sla_hours["*"]
+        hours = self.sla_hours.get(category or "", default)
+        return 3600.0 * hours.get(priority or "", default.get(priority or "", default["not_urgent"]))
+
+    def _entry(self, pemail: ProcessedEmail, now: float) -> Tuple[str, int, float, float]:
+        cls = pemail.classification
+        sent = pemail.record.sent_date
+        if sent.tzinfo is None:
+            sent = sent.replace(tzinfo=timezone.utc)  # stored dates are naive UTC
+        return (
+            pemail.record.id, self._priority(pemail), min(sent.timestamp(), now),
+            self.sla_s(cls.category if cls else None, cls.priority if cls else None),
+        )
+
+    def push(self, pemail: ProcessedEmail):
+        self.push_many([pemail])
+
+    def push_many(self, pemails: List[ProcessedEmail], one_per_thread: bool = False):
+        """
+        With one_per_thread, each pushed email replaces any pending entries from the same thread.
+        """
+        now = time.time()
+        with span("queue.push"):
+            db.queue_push([self._entry(p, now) for p in pemails], now)
+            if one_per_thread:
+                db.queue_supersede_threads([(p.record.thread_id, p.record.id) for p in pemails if p.record.thread_id], now)
+
+    def claim(self, visibility_timeout_s: Optional[float] = None) -> Optional[Tuple[str, ProcessedEmail]]:
+        """
+        Returns (claim_token, email) for the next available email, or None.
+        """
+        timeout = visibility_timeout_s if visibility_timeout_s is not None else self.visibility_timeout_s
+        while True:
+            token = uuid.uuid4().hex
+            email_id = db.queue_claim(token, time.time(), timeout)
+            if email_id is None:
+                return None
+            pemail = db.get_processed(email_id)
+            if pemail is not None:
+                return token, pemail
+            # The email row is gone; drop the orphaned entry and try the next one
+            db.queue_ack(email_id, token, time.time())
+
+    def ack(self, email_id: str, token: str) -> bool:
+        """
+        False if the claim expired and was taken over (or acked) by someone else.
+        """
+        return db.queue_ack(email_id, token, time.time())
+
+    def release(self, email_id: str, token: str) -> bool:
+        return db.queue_release(email_id, token)
 
     def pop(self) -> Optional[ProcessedEmail]:
-        if not self._heap:
+        claimed = self.claim()
+        if claimed is None:
             return None
-        _, _, _, item = heapq.heappop(self._heap)
+        token, item = claimed
+        self.ack(item.record.id, token)
         return item
 
+    def peek(self, n: int = 10) -> List[QueueEntry]:
+        """
+        The next n emails claim() would return, most urgent first, without claiming them.
+        """
+        return db.queue_peek(n, time.time())
+
+    def depth(self) -> Dict[str, int]:
+        return db.queue_depth(time.time())
+
     def __len__(self):
-        return len(self._heap)
+        return self.depth()["pending"]
 
 email_queue = PriorityEmailQueue()
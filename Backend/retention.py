@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .models import CompactionStatus
+from .classification_cache import classification_cache
+from .metrics import span
+from . import database as db
+
+# Off until a deployment opts in: archiving rewrites every old row, and the file only shrinks once a VACUUM runs.
+# Enable the schedule with e.g. RETENTION_INTERVAL_S=86400, or run it by hand with `python -m Backend.manage
+# compact` (or POST /maintenance/compact); the thresholds below apply to both.
+RETENTION_INTERVAL_S = float(os.getenv("RETENTION_INTERVAL_S", "0"))  # 0 disables the schedule; runs are manual only
+ARCHIVE_AFTER_DAYS = float(os.getenv("RETENTION_ARCHIVE_AFTER_DAYS", "30"))  # by sent date; 0 keeps every body hot
+DELETE_AFTER_DAYS = float(os.getenv("RETENTION_DELETE_AFTER_DAYS", "0"))  # 0 keeps mail forever
+VACUUM_MIN_FREE = float(os.getenv("RETENTION_VACUUM_MIN_FREE", "0.2"))  # VACUUM once free pages reach this share
+BATCH_SIZE = 500  # emails per transaction, so other writers wait milliseconds rather than the whole run
+
+class RetentionScheduler:
+    """
+    Keeps the database compact: deletes mail past DELETE_AFTER_DAYS, moves the bodies of mail older than
+    ARCHIVE_AFTER_DAYS to compressed cold storage, VACUUMs when enough of the file is free pages, and
+    refreshes planner statistics. Runs every interval_s, or on trigger.
+    """
+    def __init__(
+        self,
+        interval_s: float = RETENTION_INTERVAL_S,
+        archive_after_days: float = ARCHIVE_AFTER_DAYS,
+        delete_after_days: float = DELETE_AFTER_DAYS,
+        vacuum_min_free: float = VACUUM_MIN_FREE,
+    ) -> None:
+        self.interval_s = interval_s
+        self.archive_after_days = archive_after_days
+        self.delete_after_days = delete_after_days
+        self.vacuum_min_free = vacuum_min_free
+        self.status = CompactionStatus(interval_s=interval_s)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- scheduling ----
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="retention-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self) -> bool:
+        """
+        Requests a run as soon as possible. False if one is already in progress.
+        """
+        if self.status.running:
+            return False
+        if self._thread is None:
+            threading.Thread(target=self.run_once, name="retention-run", daemon=True).start()
+        else:
+            self._wake.set()
+        return True
+
+    def _loop(self):
+        # the first run waits a full interval, so restarts do not each start with a VACUUM
+        while not self._stop.is_set():
+            self._wake.wait(self.interval_s)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.run_once()
+
+    # ---- one run ----
+
+    def run_once(self, vacuum: Optional[bool] = None) -> CompactionStatus:
+        """
+        vacuum=None VACUUMs only when free pages reach vacuum_min_free of the file; True or False forces it.
+        """
+        if not self._lock.acquire(blocking=False):
+            return self.status
+        status = CompactionStatus(
+            interval_s=self.interval_s, running=True, runs=self.status.runs, last_started=datetime.utcnow()
+        )
+        self.status = status
+        try:
+            with span("retention"):
+                self._run(status, vacuum)
+        except Exception as e:
+            status.last_error = repr(e)
+        finally:
+            status.running = False
+            status.last_finished = datetime.utcnow()
+            status.runs += 1
+            self._lock.release()
+        return status
+
+    def _run(self, status: CompactionStatus, vacuum: Optional[bool]):
+        status.file_bytes_before = db.storage_usage()["file_bytes"]
+        now = datetime.utcnow()
+        if self.delete_after_days > 0:
+            cutoff = (now - timedelta(days=self.delete_after_days)).isoformat()
+            while not self._stop.is_set():
+                n = db.delete_emails_before(cutoff, BATCH_SIZE)
+                status.deleted += n
+                if n < BATCH_SIZE:
+                    break
+        if self.archive_after_days > 0:
+            cutoff = (now - timedelta(days=self.archive_after_days)).isoformat()
+            while not self._stop.is_set():
+                n, moved, written = db.archive_bodies(cutoff, BATCH_SIZE, time.time())
+                status.archived += n
+                status.text_bytes += moved
+                status.compressed_bytes += written
+                if n < BATCH_SIZE:
+                    break
+        db.purge_classification_cache(older_than=time.time() - classification_cache.ttl_s)
+
+        usage = db.storage_usage()
+        if vacuum or (vacuum is None and usage["free_bytes"] >= self.vacuum_min_free * usage["database_bytes"]):
+            db.vacuum()
+            status.vacuumed = True
+        db.analyze()
+        status.analyzed = True
+        status.file_bytes_after = db.storage_usage()["file_bytes"]
+        status.bytes_reclaimed = max(0, status.file_bytes_before - status.file_bytes_after)
+
+retention = RetentionScheduler()
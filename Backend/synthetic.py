@@ -0,0 +1,163 @@
+"""
+Synthetic Gmail mailboxes for benchmarks: Gmail API message resources (headers, MIME trees, labels,
+threads) and a fake Gmail service that serves them to the real GmailClient.
+"""
+import base64
+import random
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from . import heuristics
+
+class MailboxShape(NamedTuple):
+    n_emails: int = 1000
+    thread_length: Tuple[int, int] = (1, 6)  # messages per thread, inclusive range
+    body_chars: Tuple[int, int] = (200, 4000)  # visible text per message, inclusive range
+    html_ratio: float = 0.5  # share of messages sent as HTML (half of those also carry a text/plain part)
+    urgent_ratio: float = 0.2  # share of messages containing urgency keywords
+    contact_ratio: float = 0.3  # share of messages with a phone number and an email address in the body
+    unread_ratio: float = 0.7
+    seed: int = 7
+
+_WORDS = ("the a we our your team account please update on for with this that report access server login page "
+          "customer order ticket meeting schedule week today invoice dashboard export settings user admin").split()
+_URGENT = [kw for rule in heuristics.DEFAULT_RULES if rule["label"] == "urgent" for kw in rule["keywords"]]
+_OTHER_KEYWORDS = [kw for rule in heuristics.DEFAULT_RULES if rule["label"] != "urgent" for kw in rule["keywords"]]
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+def _text(rng: random.Random, n_chars: int, urgent: bool, contact: bool) -> str:
+    words: List[str] = []
+    size = 0
+    while size < n_chars:
+        r = rng.random()
+        w = rng.choice(_OTHER_KEYWORDS) if r < 0.01 else rng.choice(_WORDS)
+        words.append(w)
+        size += len(w) + 1
+    if urgent:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(_URGENT))
+    if contact:
+        words.insert(rng.randrange(len(words) + 1), f"call +1 555 {rng.randint(100, 999)} {rng.randint(1000, 9999)}")
+        words.insert(rng.randrange(len(words) + 1), f"or write to ops{rng.randint(1, 99)}@example.com")
+    return " ".join(words)
+
+def _html(text: str) -> str:
+    paragraphs = [text[i:i + 400] for i in range(0, len(text), 400)]
+    body = "".join(f'<tr><td style="font-family:Arial;padding:4px"><p>{p}</p></td></tr>' for p in paragraphs)
+    return (
+        "<html><head><style>td{color:#333}</style><title>Mail</title></head><body>"
+        f'<table width="100%" cellpadding="0">{body}</table>'
+        '<div style="display:none">tracking</div><script>var t=1;</script></body></html>'
+    )
+
+def _payload(rng: random.Random, shape: MailboxShape, headers: List[Dict[str, str]], text: str) -> Dict[str, Any]:
+    if rng.random() >= shape.html_ratio:
+        return {"mimeType": "text/plain", "headers": headers, "body": {"data": _b64(text)}}
+    html_part = {"mimeType": "text/html", "headers": [{"name": "Content-Type", "value": "text/html; charset=utf-8"}],
+                 "body": {"data": _b64(_html(text))}}
+    if rng.random() < 0.5:
+        return {"mimeType": "text/html", "headers": headers, "body": html_part["body"]}
+    plain_part = {"mimeType": "text/plain", "headers": [], "body": {"data": _b64(text)}}
+    alternative = {"mimeType": "multipart/alternative", "headers": [], "body": {}, "parts": [plain_part, html_part]}
+    attachment = {"mimeType": "application/pdf", "filename": "invoice.pdf", "headers": [], "body": {"attachmentId": "a1"}}
+    return {"mimeType": "multipart/mixed", "headers": headers, "body": {}, "parts": [alternative, attachment]}
+
+def generate_mailbox(shape: MailboxShape) -> List[Dict[str, Any]]:
+    """
+    Gmail message resources (format=full), newest first like messages.list.
+    """
+    rng = random.Random(shape.seed)
+    messages: List[Dict[str, Any]] = []
+    start = datetime(2024, 1, 1, 8, 0)
+    thread_no = 0
+    while len(messages) < shape.n_emails:
+        thread_no += 1
+        length = min(rng.randint(*shape.thread_length), shape.n_emails - len(messages))
+        topic = f"{rng.choice(_WORDS).title()} {rng.choice(_WORDS)} issue #{thread_no}"
+        sent = start + timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+        for position in range(length):
+            i = len(messages)
+            sent += timedelta(minutes=rng.randint(5, 600))
+            text = _text(rng, rng.randint(*shape.body_chars), rng.random() < shape.urgent_ratio,
+                         rng.random() < shape.contact_ratio)
+            headers = [
+                {"name": "Subject", "value": ("Re: " if position else "") + topic},
+                {"name": "From", "value": f"User {i % 500} <user{i % 500}@example.com>"},
+                {"name": "Date", "value": format_datetime(sent)},
+            ]
+            labels = ["INBOX"] + (["UNREAD"] if rng.random() < shape.unread_ratio else [])
+            messages.append({
+                "id": f"syn-{i:07d}",
+                "threadId": f"thread-{thread_no:06d}",
+                "snippet": text[:140],
+                "labelIds": labels,
+                "internalDate": str(int(sent.timestamp() * 1000)),
+                "payload": _payload(rng, shape, headers, text),
+            })
+    messages.sort(key=lambda m: int(m["internalDate"]), reverse=True)
+    return messages
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, **kwargs):
+        return self._fn()
+
+class _Batch:
+    def __init__(self, callback):
+        self._callback = callback
+        self._requests: List[Tuple[str, _Request]] = []
+
+    def add(self, request: _Request, callback=None, request_id: str = None):
+        self._requests.append((request_id, request))
+
+    def execute(self, **kwargs):
+        for request_id, request in self._requests:
+            self._callback(request_id, request.execute(), None)
+
+class FakeGmailService:
+    """
+    The subset of the Gmail API GmailClient uses (messages.list/get, history.list, getProfile,
+    batch requests), served from memory. Queries are ignored: every message matches.
+    """
+    def __init__(self, messages: List[Dict[str, Any]]) -> None:
+        self._messages = messages
+        self._by_id = {m["id"]: m for m in messages}
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return self
+
+    def list(self, userId: str, maxResults: int = 100, pageToken: str = None, startHistoryId: str = None, **kwargs):
+        start = int(pageToken or 0)
+        end = start + maxResults
+        page_ids = [m["id"] for m in self._messages[start:end]]
+        if startHistoryId is not None:
+            resp = {"history": [{"messagesAdded": [{"message": {"id": mid}}]} for mid in reversed(page_ids)],
+                    "historyId": str(len(self._messages))}
+        else:
+            resp = {"messages": [{"id": mid} for mid in page_ids]}
+        if end < len(self._messages):
+            resp["nextPageToken"] = str(end)
+        return _Request(lambda: resp)
+
+    def get(self, userId: str, id: str, format: str = "full", **kwargs):
+        msg = self._by_id[id]
+        if format == "metadata":
+            meta = dict(msg, payload={"headers": msg["payload"]["headers"]})
+            return _Request(lambda: meta)
+        return _Request(lambda: msg)
+
+    def getProfile(self, userId: str):
+        return _Request(lambda: {"historyId": str(len(self._messages))})
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(callback)
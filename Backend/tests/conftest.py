@@ -0,0 +1,20 @@
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from Backend import database as db
+
+@pytest.fixture
+def temp_db():
+    """
+    Points database.py at a throwaway SQLite file for the duration of the test.
+    """
+    saved = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "test.db"
+        try:
+            db.init_db()
+            yield db.DB_PATH
+        finally:
+            db.DB_PATH = saved
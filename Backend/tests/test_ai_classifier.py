@@ -0,0 +1,126 @@
+import json
+from datetime import datetime
+
+from google.api_core.exceptions import ResourceExhausted
+
+from Backend import ai_classifier
+from Backend.classification_cache import ClassificationCache
+from Backend.metrics import LLM_CALLS
+from Backend.models import EmailRecord
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+class UnparseableModel:
+    """
+    Answers every prompt with text that is not JSON, so batches and single calls both fall back.
+    """
+    calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        UnparseableModel.calls += 1
+        return _Response("sorry, I cannot help with that")
+
+def _emails(n: int):
+    return [
+        EmailRecord(id=f"e{i}", sender=f"user{i}@example.com", subject=f"Invoice {i} overdue",
+                    body=f"Please pay invoice {i} urgently.", sent_date=datetime(2024, 5, 1))
+        for i in range(n)
+    ]
+
+def test_batch_fallback_does_not_repeat_cache_lookups(temp_db, monkeypatch):
+    cache = ClassificationCache(enabled=True)
+    monkeypatch.setattr(ai_classifier, "classification_cache", cache)
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "stub")
+    monkeypatch.setattr(ai_classifier, "_model", UnparseableModel())
+    monkeypatch.setattr(ai_classifier.local_classifier, "predict", lambda emails: [None] * len(emails))
+    UnparseableModel.calls = 0
+
+    results = ai_classifier.classify_batch(_emails(3))
+
+    assert len(results) == 3
+    assert UnparseableModel.calls == 4  # the batch, then one call per email
+    assert cache.stats()["misses"] == 3
+    assert cache.stats()["hits"] == 0
+
+class RateLimitedModel:
+    """
+    Answers 429 for the first `failures` calls, then a valid classification.
+    """
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ResourceExhausted("quota exceeded")
+        return _Response(json.dumps({
+            "summary": "stub", "category": "BILLING", "sentiment": "neutral", "priority": "urgent",
+            "urgency_score": 8, "requires_response": True, "confidence": 0.9, "extraction": {},
+        }))
+
+def _llm_only(monkeypatch, model):
+    monkeypatch.setattr(ai_classifier, "classification_cache", ClassificationCache(enabled=False))
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "stub")
+    monkeypatch.setattr(ai_classifier, "_model", model)
+    monkeypatch.setattr(ai_classifier, "LLM_BACKOFF_BASE_S", 0.001)
+    monkeypatch.setattr(ai_classifier, "_rate_limited_until", 0.0)
+    monkeypatch.setattr(ai_classifier.local_classifier, "predict", lambda emails: [None] * len(emails))
+
+def test_rate_limited_calls_are_retried_with_backoff(temp_db, monkeypatch):
+    model = RateLimitedModel(failures=2)
+    _llm_only(monkeypatch, model)
+    rate_limited = LLM_CALLS.value(outcome="rate_limited")
+
+    result = ai_classifier.classify_with_gemini(_emails(1)[0])
+
+    assert model.calls == 3
+    assert result.source == "llm" and result.category == "BILLING"
+    assert LLM_CALLS.value(outcome="rate_limited") == rate_limited + 2
+
+def test_rate_limit_gives_up_after_max_retries(temp_db, monkeypatch):
+    model = RateLimitedModel(failures=100)
+    _llm_only(monkeypatch, model)
+    result = ai_classifier.classify_with_gemini(_emails(1)[0])
+    assert model.calls == ai_classifier.LLM_MAX_RETRIES + 1
+    assert result.source == "heuristic"
+
+def _cached_llm(monkeypatch, model) -> ClassificationCache:
+    _llm_only(monkeypatch, model)
+    cache = ClassificationCache(enabled=True)
+    monkeypatch.setattr(ai_classifier, "classification_cache", cache)
+    return cache
+
+def test_cache_hit_skips_the_model(temp_db, monkeypatch):
+    model = RateLimitedModel(failures=0)
+    cache = _cached_llm(monkeypatch, model)
+    first = ai_classifier.classify_with_gemini(_emails(1)[0])
+    # same content under another message id, with different case and spacing
+    again = _emails(1)[0].model_copy(update={"id": "other", "body": "  please pay INVOICE 0   urgently. "})
+    assert ai_classifier.classify_with_gemini(again) == first
+    assert model.calls == 1 and cache.stats()["hits"] == 1
+    # a fresh process starts with an empty LRU and finds the result in SQLite
+    fresh = _cached_llm(monkeypatch, model)
+    assert ai_classifier.classify_with_gemini(_emails(1)[0]) == first
+    assert model.calls == 1 and fresh.stats()["db_hits"] == 1
+
+def test_prompt_version_is_part_of_the_key(temp_db, monkeypatch):
+    model = RateLimitedModel(failures=0)
+    _cached_llm(monkeypatch, model)
+    email = _emails(1)[0]
+    old_key = ai_classifier.cache_key(email, ai_classifier.MODEL_NAME, ai_classifier.PROMPT_VERSION)
+    ai_classifier.classify_with_gemini(email)
+    monkeypatch.setattr(ai_classifier, "PROMPT_VERSION", ai_classifier.PROMPT_VERSION + "-next")
+    assert ai_classifier.cache_key(email, ai_classifier.MODEL_NAME, ai_classifier.PROMPT_VERSION) != old_key
+    ai_classifier.classify_with_gemini(email)
+    assert model.calls == 2
+
+def test_heuristic_fallbacks_are_not_cached(temp_db, monkeypatch):
+    model = RateLimitedModel(failures=100)
+    cache = _cached_llm(monkeypatch, model)
+    monkeypatch.setattr(ai_classifier, "LLM_MAX_RETRIES", 0)
+    assert ai_classifier.classify_with_gemini(_emails(1)[0]).source == "heuristic"
+    assert ai_classifier.classify_with_gemini(_emails(1)[0]).source == "heuristic"
+    assert model.calls == 2 and cache.stats()["hits"] == 0
@@ -0,0 +1,78 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from Backend import database as db
+from Backend.models import EmailRecord, EmailFilters, ClassificationResult, ProcessedEmail
+
+PLUS_2 = timezone(timedelta(hours=2))
+
+def _email(email_id: str, sent_date: datetime) -> EmailRecord:
+    return EmailRecord(id=email_id, sender="a@example.com", subject=email_id, body="body", sent_date=sent_date)
+
+def _save(*records: EmailRecord):
+    cls = ClassificationResult(summary="s", category="CUSTOMER_SUPPORT", sentiment="neutral",
+                               priority="not_urgent", urgency_score=3)
+    db.save_processed([ProcessedEmail(record=r, classification=cls, draft=None) for r in records])
+
+def _mixed_offsets():
+    # 12:30+02:00 is 10:30Z, so it falls between the other two
+    _save(
+        _email("a", datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)),
+        _email("b", datetime(2024, 5, 1, 11, 0, tzinfo=timezone.utc)),
+        _email("c", datetime(2024, 5, 1, 12, 30, tzinfo=PLUS_2)),
+    )
+
+def test_listing_orders_by_utc_instant(temp_db):
+    _mixed_offsets()
+    page, _ = db.list_summaries_page(limit=10)
+    assert [e.id for e in page] == ["b", "c", "a"]
+
+def test_since_until_filters_compare_utc(temp_db):
+    _mixed_offsets()
+    since = datetime(2024, 5, 1, 10, 15, tzinfo=timezone.utc)
+    page, _ = db.list_summaries_page(limit=10, filters=EmailFilters(since=since))
+    assert sorted(e.id for e in page) == ["b", "c"]
+    until = datetime(2024, 5, 1, 12, 45, tzinfo=PLUS_2)  # 10:45Z
+    page, _ = db.list_summaries_page(limit=10, filters=EmailFilters(until=until))
+    assert sorted(e.id for e in page) == ["a", "c"]
+
+def test_keyset_pages_follow_utc_order(temp_db):
+    _mixed_offsets()
+    seen, cursor = [], None
+    while True:
+        page, cursor = db.list_processed_page(limit=1, cursor=cursor)
+        seen += [p.record.id for p in page]
+        if cursor is None:
+            break
+    assert seen == ["b", "c", "a"]
+
+def test_init_db_normalizes_stored_offsets(temp_db):
+    _save(_email("old", datetime(2024, 5, 1, 10, 30)))
+    with sqlite3.connect(temp_db) as con:  # as written before sent_date was normalized
+        con.execute("UPDATE emails SET sent_date = '2024-05-01T12:30:00+02:00' WHERE id = 'old';")
+    db.init_db()
+    assert db.get_processed("old").record.sent_date == datetime(2024, 5, 1, 10, 30)
+
+def test_hourly_stats_use_utc_hour(temp_db):
+    _mixed_offsets()
+    counts = db.get_hourly_counts("category", "2024-05-01T00")
+    assert counts == {"2024-05-01T10": {"CUSTOMER_SUPPORT": 2}, "2024-05-01T11": {"CUSTOMER_SUPPORT": 1}}
+
+def test_normalizing_stored_offsets_moves_stats_buckets(temp_db):
+    _save(_email("old", datetime(2024, 5, 1, 10, 30)))
+    with sqlite3.connect(temp_db) as con:  # as written before sent_date was normalized: bucketed by local hour
+        con.execute("UPDATE emails SET sent_date = '2024-05-01T12:30:00+02:00' WHERE id = 'old';")
+    assert list(db.get_hourly_counts("category", "2024-05-01T00")) == ["2024-05-01T12"]
+    db.init_db()
+    assert db.get_hourly_counts("category", "2024-05-01T00") == {"2024-05-01T10": {"CUSTOMER_SUPPORT": 1}}
+    assert db.get_stats()["category"] == {"CUSTOMER_SUPPORT": 1}
+
+def test_init_db_backfills_classification_source(temp_db):
+    _save(_email("llm", datetime(2024, 5, 1)), _email("fallback", datetime(2024, 5, 2)))
+    with sqlite3.connect(temp_db) as con:  # as written before classifications.source existed
+        con.execute("UPDATE classifications SET source = NULL, confidence = 0.8 WHERE email_id = 'llm';")
+        con.execute("UPDATE classifications SET source = NULL, confidence = 0.6 WHERE email_id = 'fallback';")
+    db.init_db()
+    assert db.get_processed("llm").classification.source == "llm"
+    assert db.get_processed("fallback").classification.source == "heuristic"
+    assert [row[0] for row in db.get_labelled_examples(10)] == ["llm"]
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from Backend import ai_classifier, dedup
+from Backend.dedup import NearDuplicateIndex, signature, similarity
+from Backend.models import EmailRecord
+from Backend.pipeline import classify_all
+from Backend.text_utils import word_tokens
+
+ALERT = ("Monitoring alert: the payments API in region eu-west returned errors for 12 percent of requests "
+         "between 10:02 and 10:07. The on-call engineer has been paged and is investigating the cause.")
+
+def _email(email_id: str, subject: str, body: str) -> EmailRecord:
+    return EmailRecord(id=email_id, sender="alerts@example.com", subject=subject, body=body,
+                       sent_date=datetime(2024, 5, 1))
+
+def test_word_tokens_fold_digits_and_case():
+    assert word_tokens("Ticket #4521 CLOSED at 10:07", 100) == [b"ticket", b"0000", b"closed", b"at", b"00", b"00"]
+
+def test_signature_tolerates_ids_and_quoted_history():
+    a = signature("Payments API errors", ALERT)
+    b = signature("Payments API errors", ALERT.replace("12 percent", "15 percent") + "\n> earlier alert quoted here")
+    other = signature("Lunch on Friday", "Shall we try the new noodle place near the office on Friday around noon?")
+    assert similarity(a, b) == 1.0
+    assert similarity(a, other) < 0.2
+
+def test_short_mail_is_never_clustered():
+    assert signature("hi", "thanks!") is None
+
+def test_index_clusters_near_duplicates_under_the_first_email(temp_db):
+    index = NearDuplicateIndex(threshold=0.8, enabled=True)
+    first = index.assign([_email("a1", "Payments API errors", ALERT)])
+    later = index.assign([
+        _email("a2", "Payments API errors", ALERT.replace("10:02", "11:40")),
+        _email("x1", "Quarterly planning", "Please send me your team's goals for next quarter before the "
+                                           "planning meeting so we can agree on priorities together."),
+    ])
+    assert first[0].cluster_id == "a1"
+    assert later[0].cluster_id == "a1" and later[0].similarity >= 0.8
+    assert later[1].cluster_id == "x1"
+    # a second assignment keeps the stored cluster
+    assert index.assign([_email("a2", "Payments API errors", ALERT)])[0].cluster_id == "a1"
+
+OUTAGE = ("Our checkout page has been returning a 502 error since this morning and customers cannot pay. "
+          "The whole team is blocked and we are losing orders every minute, please escalate this now. "
+          "Call me back on {phone} or write to {email} as soon as you have an update on the outage.")
+
+def test_near_duplicates_keep_their_own_contact_details(temp_db, monkeypatch):
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    monkeypatch.setattr(dedup, "near_duplicates", NearDuplicateIndex(threshold=0.8, enabled=True))
+    alice = EmailRecord(id="alice", sender="alice@x.com", subject="Checkout down",
+                        body=OUTAGE.format(phone="+1 555 123 4567", email="alice@x.com"), sent_date=datetime(2024, 5, 1))
+    bob = EmailRecord(id="bob", sender="bob@y.com", subject="Checkout down",
+                      body=OUTAGE.format(phone="+1 555 987 6543", email="bob@y.com"), sent_date=datetime(2024, 5, 1))
+
+    (a_cls, a_draft), (b_cls, b_draft) = classify_all([alice, bob])
+
+    assert b_cls.source == "duplicate"
+    assert (b_cls.category, b_cls.priority, b_cls.sentiment) == (a_cls.category, a_cls.priority, a_cls.sentiment)
+    assert b_cls.extraction.emails == ["bob@y.com"]
+    assert b_cls.extraction.phone_numbers != a_cls.extraction.phone_numbers
+    assert "alice" not in b_cls.summary and "123" not in b_cls.summary
+    assert "alice" not in b_draft.body and "123 4567" not in b_draft.body
+    assert b_draft.subject == "Re: Checkout down"
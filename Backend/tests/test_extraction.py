@@ -0,0 +1,42 @@
+import re
+import time
+
+from Backend.benchmarks import _extraction_bodies, _legacy_extract
+from Backend.extraction import DEFAULT_DICTIONARY, Extractor, extractor
+
+ORDINARY = [
+    "Call me on 555-123-4567 or +1 (555) 765-4321, or write to jane.doe@example.com.",
+    "Our office: 212.555.0188. Billing questions go to billing@Accounts.Example.co.uk",
+    "Reach support at help+tickets@example.org or 5551234567 after 5pm.",
+    "No contact details here, just a thank you.",
+]
+
+def _digits(phones):
+    return {re.sub(r"\D", "", p) for p in phones}
+
+def test_ordinary_mail_matches_the_legacy_regexes():
+    # formats the old patterns handled; elsewhere (e.g. UK numbers) they split or truncated numbers
+    for body in ORDINARY:
+        legacy_phones, legacy_emails = _legacy_extract(body)
+        result = extractor.extract(body)
+        assert _digits(result.phone_numbers) == _digits(legacy_phones), body
+        assert set(result.emails) == {e.rpartition("@")[0] + "@" + e.rpartition("@")[2].lower()
+                                      for e in legacy_emails}, body
+
+def test_dates_and_addresses_are_not_phones():
+    result = extractor.extract("Logged 2024-01-31 from 10.20.30.40, due 31/01/2024. Real one: +44 20 7946 0958")
+    assert result.phone_numbers == ["+442079460958"]
+
+def test_dictionary_terms_match_whole_words_once():
+    custom = Extractor({"products": ["Acme Cloud", "Acme"], "keywords": DEFAULT_DICTIONARY["keywords"]})
+    result = custom.extract("acme cloud has a bug; the ACME CLOUD API bug again. Debugging is not a bug word.")
+    assert result.product_mentions == ["Acme Cloud"]
+    assert result.keywords == ["bug", "api"]
+
+def test_pathological_input_stays_linear():
+    # the legacy patterns backtrack on these; the bounded ones must finish in well under a second
+    bodies = list(_extraction_bodies(200_000).values()) + ["1" * 200_000, "a" * 200_000 + "@", "a@" + "b." * 100_000]
+    for body in bodies:
+        start = time.perf_counter()
+        extractor.extract(body)
+        assert time.perf_counter() - start < 1.0
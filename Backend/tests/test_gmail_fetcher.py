@@ -0,0 +1,123 @@
+import base64
+from datetime import datetime, timezone
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+from googleapiclient.http import DEFAULT_HTTP_TIMEOUT_SEC
+
+from Backend import gmail_fetcher
+from Backend.gmail_fetcher import GmailClient, _build_service, _decode_part, _html_to_text
+from Backend.importer import _parse_date
+from Backend.synthetic import FakeGmailService, MailboxShape, generate_mailbox, _Request
+
+def test_service_transport_has_socket_timeout():
+    # without one, a hung Gmail request blocks its fetch worker forever
+    service = _build_service(Credentials("token"))
+    assert service._http.http.timeout == DEFAULT_HTTP_TIMEOUT_SEC
+
+def _message(headers, internal_ms=None):
+    msg = {"id": "m1", "threadId": "t1", "snippet": "hi",
+           "payload": {"mimeType": "text/plain", "headers": headers, "body": {"data": ""}}}
+    if internal_ms is not None:
+        msg["internalDate"] = str(internal_ms)
+    return msg
+
+def test_date_header_offset_is_converted_to_utc():
+    record = GmailClient(service=object())._to_record(_message([
+        {"name": "From", "value": "a@example.com"}, {"name": "Date", "value": "Wed, 01 May 2024 12:30:00 +0200"},
+    ]))
+    assert record.sent_date == datetime(2024, 5, 1, 10, 30)
+
+def test_internal_date_fallback_is_utc():
+    ms = int(datetime(2024, 5, 1, 10, 30, tzinfo=timezone.utc).timestamp() * 1000)
+    record = GmailClient(service=object())._to_record(_message([{"name": "Date", "value": "not a date"}], ms))
+    assert record.sent_date == datetime(2024, 5, 1, 10, 30)
+
+def test_fetch_and_import_store_the_same_sent_date():
+    date = "Wed, 01 May 2024 23:15:00 -0700"
+    fetched = GmailClient(service=object())._to_record(_message([{"name": "Date", "value": date}]))
+    assert fetched.sent_date == _parse_date(date) == datetime(2024, 5, 2, 6, 15)
+
+class HistoryService(FakeGmailService):
+    """
+    historyId n means "after the n oldest messages"; history older than `expired_before` is gone (404).
+    """
+    def __init__(self, messages, expired_before: int = 0) -> None:
+        super().__init__(messages)
+        self.expired_before = expired_before
+        self.calls = []
+
+    def list(self, userId, maxResults=100, pageToken=None, startHistoryId=None, **kwargs):
+        self.calls.append("history" if startHistoryId is not None else "messages")
+        if startHistoryId is None:
+            return super().list(userId, maxResults, pageToken, **kwargs)
+        if int(startHistoryId) < self.expired_before:
+            def expired():
+                raise HttpError(httplib2.Response({"status": 404}), b"historyId too old")
+            return _Request(expired)
+        oldest_first = list(reversed(self._messages))
+        added = oldest_first[int(startHistoryId):]
+        return _Request(lambda: {"history": [{"messagesAdded": [{"message": {"id": m["id"]}}]} for m in added],
+                                 "historyId": str(len(self._messages))})
+
+def _mailbox(n: int):
+    return generate_mailbox(MailboxShape(n_emails=n, unread_ratio=1.0, seed=3))
+
+def test_fetch_since_returns_only_messages_added_after_the_history_id():
+    messages = _mailbox(8)  # newest first
+    service = HistoryService(messages)
+    records, latest = GmailClient(service=service).fetch_since("5", max_results=1)
+    # the three newest, newest first, uncapped by max_results
+    assert [r.id for r in records] == [m["id"] for m in messages[:3]]
+    assert latest == "8"
+    assert service.calls == ["history"]
+
+def test_fetch_since_falls_back_to_a_full_sync_when_the_history_id_expired():
+    messages = _mailbox(8)
+    service = HistoryService(messages, expired_before=4)
+    records, latest = GmailClient(service=service).fetch_since("2", max_results=5)
+    assert [r.id for r in records] == [m["id"] for m in messages[:5]]
+    assert latest == "8"
+    assert service.calls == ["history", "messages"]
+
+def test_fetch_since_without_a_history_id_does_a_full_sync():
+    messages = _mailbox(4)
+    service = HistoryService(messages)
+    records, latest = GmailClient(service=service).fetch_since(None, max_results=10)
+    assert len(records) == 4 and latest == "4"
+    assert service.calls == ["messages"]
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _part(mime: str, text: str, **extra):
+    return {"mimeType": mime, "headers": [], "body": {"data": _b64(text)}, **extra}
+
+def test_html_to_text_drops_markup_scripts_and_entities():
+    html = ("<html><head><title>t</title><style>p {color: red}</style></head><body>"
+            "<p>Hello&nbsp;&amp; welcome</p><script>alert(1)</script><div>Second<br>line</div></body></html>")
+    assert _html_to_text(html, 1000) == "Hello & welcome\n\nSecond\nline"
+
+def test_html_to_text_stops_at_max_chars():
+    html = "<p>" + "word " * 100_000 + "</p>"
+    assert len(_html_to_text(html, 50)) == 50
+
+def test_plain_text_wins_over_html_in_nested_multipart():
+    payload = {"mimeType": "multipart/mixed", "body": {}, "parts": [
+        {"mimeType": "multipart/alternative", "body": {}, "parts": [
+            _part("text/html", "<p>html version</p>"), _part("text/plain", "plain version"),
+        ]},
+        _part("application/pdf", "%PDF", filename="invoice.pdf"),
+    ]}
+    assert GmailClient(service=object())._extract_body(payload) == "plain version"
+    html_only = {"mimeType": "multipart/alternative", "body": {}, "parts": [_part("text/html", "<b>bold</b> text")]}
+    assert GmailClient(service=object())._extract_body(html_only) == "bold text"
+
+def test_decoding_is_capped_per_part_and_per_body(monkeypatch):
+    monkeypatch.setattr(gmail_fetcher, "PART_MAX_BYTES", 1000)
+    huge = _part("text/plain", "x" * 1_000_000)
+    assert len(_decode_part(huge, 1000)) == 1000
+    payload = {"mimeType": "multipart/mixed", "body": {}, "parts": [huge, _part("text/plain", "y" * 500)]}
+    body = GmailClient(service=object())._extract_body(payload, max_chars=1200)
+    assert len(body) <= 1200 and body.startswith("x" * 1000)
@@ -0,0 +1,48 @@
+import random
+
+from Backend import heuristics
+from Backend.benchmarks import _legacy_heuristics
+from Backend.heuristics import RuleEngine, trie_pattern
+
+def _rule(label, keywords, dimension="category", **extra):
+    return {"dimension": dimension, "label": label, "weight": 1, "keywords": keywords, **extra}
+
+def test_trie_pattern_shares_prefixes():
+    assert trie_pattern(["down", "downtime"]) == "down(?:time)?"
+
+def test_overlapping_keywords_all_match():
+    engine = RuleEngine([_rule("UNDO", ["undo"]), _rule("DONE", ["done"])])
+    h = engine.score("", "the migration was undone")
+    assert sorted(h.matched) == ["done", "undo"]
+    assert h.category in ("UNDO", "DONE")
+    assert engine._fire("undone", 0)[0] == {0, 1}
+
+def test_longer_keyword_credits_the_ones_it_contains():
+    engine = RuleEngine([_rule("ACCESS", ["cannot access"]), _rule("NEG", ["cannot"])])
+    assert engine._fire("i cannot access it", 0)[0] == {0, 1}
+
+def test_keywords_are_case_insensitive_and_counted_once_per_rule():
+    engine = RuleEngine([{"dimension": "urgency", "label": "urgent", "weight": 4, "keywords": ["down", "error"]}])
+    h = engine.score("SERVER DOWN", "error, error, down again")
+    assert h.urgency_score == 9 and h.priority == "urgent"
+
+def test_sentiment_only_reads_the_body():
+    engine = heuristics.engine
+    assert engine.score("Error in last invoice?", "All sorted now, thanks.").sentiment == "neutral"
+    assert engine.score("Question", "We are unable to log in.").sentiment == "negative"
+    # the urgency rule still reads the subject
+    assert engine.score("Server down", "See above.").priority == "urgent"
+
+def test_default_rules_match_the_legacy_scans():
+    rng = random.Random(3)
+    words = ("the we cannot access server down error issue unable failed asap ok login report thanks "
+             "blocked critical undone downtime").split()
+    for _ in range(500):
+        subject = " ".join(rng.choice(words) for _ in range(rng.randint(0, 4)))
+        body = " ".join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+        h = heuristics.engine.score(subject, body)
+        assert (h.priority, h.urgency_score, h.sentiment) == _legacy_heuristics(subject, body), (subject, body)
+
+def test_empty_rules_and_text():
+    assert RuleEngine([]).score("urgent", "down").category == heuristics.DEFAULT_CATEGORY
+    assert heuristics.engine.score("", "").priority == "not_urgent"
@@ -0,0 +1,50 @@
+import csv
+
+from Backend import ai_classifier
+from Backend import database as db
+from Backend.importer import BulkImporter
+from Backend.models import ImportOptions
+
+SUBJECTS = ["Invoice overdue", "Team offsite", "Password reset", "Shipping delay", "Contract renewal"]
+
+def _write_csv(path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["from", "subject", "body", "date"])
+        for i, subject in enumerate(SUBJECTS):
+            writer.writerow([f"user{i}@example.com", subject, f"Message {i} about {subject.lower()}.",
+                             f"Wed, 01 May 2024 1{i}:30:00 +0200"])
+        writer.writerow(["nobody@example.com", "", "", ""])  # nothing to import
+
+def _stored():
+    page, _ = db.list_summaries_page(limit=100)
+    return sorted(e.subject for e in page)
+
+def test_stopped_import_resumes_where_it_left_off(temp_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    path = tmp_path / "mail.csv"
+    _write_csv(path)
+    importer = BulkImporter()
+    options = ImportOptions(path=str(path), batch_size=2)
+
+    first = importer.run(path, options, on_batch=lambda s: importer.stop())
+    assert (first.position, first.imported, first.error) == (2, 2, None)
+    assert len(_stored()) == 2
+
+    second = importer.run(path, options)
+    assert second.resumed_from == 2
+    assert (second.imported, second.imported_total, second.skipped) == (3, 5, 1)
+    assert _stored() == sorted(SUBJECTS)
+
+    # nothing left to do, and a restart re-imports without duplicating rows
+    assert importer.run(path, options).imported == 0
+    assert importer.run(path, options.model_copy(update={"restart": True})).imported == 5
+    assert len(_stored()) == 5
+
+def test_imported_dates_are_stored_as_utc(temp_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    path = tmp_path / "mail.csv"
+    _write_csv(path)
+    BulkImporter().run(path, ImportOptions(path=str(path)))
+    page, _ = db.list_summaries_page(limit=100)
+    assert {e.subject: e.sent_date.hour for e in page}["Invoice overdue"] == 8
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from Backend import ai_classifier, ingestion
+from Backend import database as db
+from Backend.gmail_fetcher import GmailClient, history_state_key
+from Backend.ingestion import IngestionScheduler
+from Backend.models import FetchOptions
+from Backend.synthetic import FakeGmailService, MailboxShape, generate_mailbox
+
+N_EMAILS = 30
+
+def _scheduler(monkeypatch, client_factory=None) -> IngestionScheduler:
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    monkeypatch.setattr(ai_classifier.local_classifier, "predict", lambda emails: [None] * len(emails))
+    monkeypatch.setattr(ai_classifier, "BATCH_MAX_EMAILS", 4)  # several batches per run
+    messages = generate_mailbox(MailboxShape(n_emails=N_EMAILS, seed=11))
+    options = FetchOptions(incremental=True, max_results=N_EMAILS, only_unread=False, concurrency=3)
+    return IngestionScheduler(
+        interval_s=0, options=options,
+        client_factory=client_factory or (lambda account: GmailClient(service=FakeGmailService(messages))),
+    )
+
+def _run_with_deadline(scheduler: IngestionScheduler, deadline_s: float = 20.0):
+    # a stage left blocked on a full queue would hang the run; fail instead
+    runner = threading.Thread(target=scheduler.run_once, daemon=True)
+    runner.start()
+    runner.join(deadline_s)
+    assert not runner.is_alive(), "ingestion run did not finish"
+    return scheduler.status
+
+def _stored_ids():
+    with db._conn() as con:
+        return {r[0] for r in con.execute("SELECT id FROM emails;")}
+
+def test_run_streams_mail_through_every_stage(temp_db, monkeypatch):
+    scheduler = _scheduler(monkeypatch)
+    status = _run_with_deadline(scheduler)
+    assert status.last_error is None and status.runs == 1 and not status.running
+    assert status.last_fetched == N_EMAILS and status.last_processed == N_EMAILS
+    assert len(_stored_ids()) == N_EMAILS
+    assert all(p.draft is not None for p in db.get_processed_many(list(_stored_ids())).values())
+    assert db.queue_depth(time.time())["pending"] > 0
+    assert db.get_sync_state(history_state_key()) == str(N_EMAILS)
+
+def test_stage_error_drains_the_pipeline_and_keeps_the_cursor(temp_db, monkeypatch):
+    scheduler = _scheduler(monkeypatch)
+    save_processed = db.save_processed
+    calls = []
+
+    def failing_save(items):
+        calls.append(len(items))
+        if len(calls) == 2:
+            raise RuntimeError("disk full")
+        return save_processed(items)
+
+    monkeypatch.setattr(ingestion.db, "save_processed", failing_save)
+    status = _run_with_deadline(scheduler)
+    assert "disk full" in status.last_error
+    assert not status.running and status.last_processed < N_EMAILS
+    # batches after the failure are dropped, not persisted
+    assert len(calls) == 2
+    # the history cursor only advances once everything up to it is stored
+    assert db.get_sync_state(history_state_key()) is None
+
+def test_fetch_error_is_reported_and_the_next_run_recovers(temp_db, monkeypatch):
+    good = _scheduler(monkeypatch).client_factory
+    failures = []
+
+    def flaky(account):
+        if not failures:
+            failures.append(account)
+            raise ConnectionError("gmail unreachable")
+        return good(account)
+
+    scheduler = _scheduler(monkeypatch, client_factory=flaky)
+    assert "gmail unreachable" in _run_with_deadline(scheduler).last_error
+    status = _run_with_deadline(scheduler)
+    assert status.last_error is None and status.runs == 2 and status.last_processed == N_EMAILS
+
+def test_fetches_reuse_one_thread_across_runs(temp_db, monkeypatch):
+    fetch_threads = []
+    scheduler = _scheduler(monkeypatch)
+    make_client = scheduler.client_factory
+
+    def recording(account):
+        fetch_threads.append(threading.current_thread())
+        return make_client(account)
+
+    scheduler.client_factory = recording
+    try:
+        for _ in range(3):
+            assert _run_with_deadline(scheduler).last_error is None
+    finally:
+        scheduler.stop()
+    # gmail_clients caches services per thread; a new thread per run would rebuild them every time
+    assert len(fetch_threads) == 3 and len(set(fetch_threads)) == 1
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from Backend import ai_classifier, local_model
+from Backend.local_model import LocalClassifier
+from Backend.models import EmailRecord
+
+def _email() -> EmailRecord:
+    return EmailRecord(id="e1", sender="a@example.com", subject="Refund request",
+                       body="Please refund my last order.", sent_date=datetime(2024, 5, 1))
+
+def test_corrupt_model_file_counts_as_no_model(tmp_path):
+    path = tmp_path / "local_model.npz"
+    path.write_bytes(b"PK\x03\x04 truncated by a crashed training run")
+    classifier = LocalClassifier(path=path, enabled=True)
+    assert classifier.model() is None
+    assert classifier.predict([_email()]) == [None]
+    status = classifier.status()
+    assert status["loaded"] is False and "error" in status
+
+def test_corrupt_model_file_falls_back_to_other_classifiers(tmp_path, monkeypatch):
+    path = tmp_path / "local_model.npz"
+    path.write_bytes(b"not a model")
+    monkeypatch.setattr(ai_classifier, "local_classifier", LocalClassifier(path=path, enabled=True))
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    result = ai_classifier.classify_with_gemini(_email())
+    assert result.source == "heuristic"
+
+def test_first_call_checks_the_file_whatever_the_clock(tmp_path, monkeypatch):
+    # time.monotonic() has an arbitrary origin and may be below LOCAL_MODEL_CHECK_S right after boot
+    monkeypatch.setattr(local_model.time, "monotonic", lambda: 0.0)
+    path = tmp_path / "local_model.npz"
+    path.write_bytes(b"not a model")
+    classifier = LocalClassifier(path=path, enabled=True)
+    assert classifier.model() is None
+    assert "error" in classifier.status()
@@ -0,0 +1,32 @@
+import re
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from Backend import ai_classifier
+from Backend import main
+from Backend.models import EmailRecord
+
+def _sample(text: str, name: str, labels: str) -> float:
+    match = re.search(rf"^{re.escape(name + labels)} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+def test_metrics_count_a_classification(temp_db, monkeypatch):
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    client = TestClient(main.app)
+    before = client.get("/metrics").text
+
+    email = EmailRecord(id="m1", sender="a@example.com", subject="Server down",
+                        body="Production is down, please help urgently.", sent_date=datetime(2024, 5, 1))
+    ai_classifier.classify_with_gemini(email, use_local=False)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+    assert "# TYPE email_assistant_classifications_total counter" in after
+    fallbacks = ("email_assistant_llm_fallbacks_total", '{reason="no_api_key"}')
+    assert _sample(after, *fallbacks) == _sample(before, *fallbacks) + 1
+    # the scrape before this one was itself timed
+    assert _sample(after, "email_assistant_http_request_seconds_count",
+                   '{method="GET",route="/metrics",status="200"}') >= 1
@@ -0,0 +1,68 @@
+import sqlite3
+from datetime import datetime
+
+from Backend import database as db
+from Backend.models import ClassificationResult, EmailRecord, ProcessedEmail
+
+NOW = 1_700_000_000.0
+HOUR = 3600.0
+
+def _push(*entries, now=NOW):
+    # (email_id, urgency); sent just now with a long SLA, so aging plays no part
+    db.queue_push([(eid, -urgency, now, 1000 * HOUR) for eid, urgency in entries], now)
+
+def test_claims_come_out_most_urgent_first(temp_db):
+    _push(("low", 2), ("high", 9), ("mid", 5))
+    assert [db.queue_claim(f"t{i}", NOW, 60) for i in range(4)] == ["high", "mid", "low", None]
+
+def test_claim_is_hidden_until_visibility_timeout(temp_db):
+    _push(("a", 5))
+    assert db.queue_claim("first", NOW, 60) == "a"
+    assert db.queue_claim("second", NOW + 30, 60) is None
+    assert db.queue_claim("second", NOW + 61, 60) == "a"
+    # the expired claim can no longer ack; the new holder can
+    assert not db.queue_ack("a", "first", NOW + 62)
+    assert db.queue_ack("a", "second", NOW + 62)
+    assert db.queue_depth(NOW + 62) == {"pending": 0, "claimed": 0}
+
+def test_release_makes_an_email_claimable_again(temp_db):
+    _push(("a", 5))
+    assert db.queue_claim("t1", NOW, 60) == "a"
+    assert not db.queue_release("a", "wrong-token")
+    assert db.queue_release("a", "t1")
+    assert db.queue_claim("t2", NOW + 1, 60) == "a"
+
+def test_acked_email_is_not_requeued(temp_db):
+    _push(("a", 5))
+    assert db.queue_claim("t1", NOW, 60) == "a"
+    assert db.queue_ack("a", "t1", NOW)
+    _push(("a", 5), now=NOW + 1)
+    assert db.queue_claim("t2", NOW + 2, 60) is None
+
+def test_aging_lifts_an_email_to_the_top_by_its_sla(temp_db):
+    # a low-urgency email whose 4 h SLA has run out outranks a fresh urgent one
+    db.queue_push([("stale", -2, NOW - 5 * HOUR, 4 * HOUR), ("fresh", -9, NOW, 4 * HOUR)], NOW)
+    assert db.queue_claim("t1", NOW, 60) == "stale"
+    assert db.queue_claim("t2", NOW, 60) == "fresh"
+
+def test_peek_applies_aging_without_writing(temp_db):
+    cls = ClassificationResult(summary="s", category="CUSTOMER_SUPPORT", sentiment="neutral",
+                               priority="not_urgent", urgency_score=2)
+    db.save_processed([ProcessedEmail(record=EmailRecord(
+        id=eid, sender="a@example.com", subject=eid, body="body", sent_date=datetime(2024, 5, 1)),
+        classification=cls, draft=None) for eid in ("stale", "fresh")])
+    db.queue_push([("stale", -2, NOW - 5 * HOUR, 4 * HOUR), ("fresh", -9, NOW, 4 * HOUR)], NOW)
+    with sqlite3.connect(temp_db) as con:
+        stored = con.execute("SELECT email_id, priority FROM email_queue ORDER BY email_id;").fetchall()
+    other = sqlite3.connect(temp_db)
+    other.execute("BEGIN IMMEDIATE;")  # a writer holds the lock; a peek must not wait on it
+    try:
+        peeked = db.queue_peek(5, NOW)
+    finally:
+        other.rollback()
+        other.close()
+    assert [e.id for e in peeked] == ["stale", "fresh"]
+    assert peeked[0].effective_urgency == 10
+    with sqlite3.connect(temp_db) as con:
+        assert con.execute("SELECT email_id, priority FROM email_queue ORDER BY email_id;").fetchall() == stored
+    assert db.queue_claim("t1", NOW, 60) == "stale"
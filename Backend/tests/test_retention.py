@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from Backend import database as db
+from Backend.models import EmailRecord, ClassificationResult, ResponseDraft, ProcessedEmail
+from Backend.retention import RetentionScheduler, RETENTION_INTERVAL_S
+
+def _save_aged(days_ago: dict):
+    now = datetime.utcnow()
+    cls = ClassificationResult(summary="s", category="BILLING", sentiment="neutral", priority="not_urgent",
+                               urgency_score=3, extraction={"order": "A-1"})
+    db.save_processed([
+        ProcessedEmail(
+            record=EmailRecord(id=eid, sender="a@example.com", subject=f"Order {eid}",
+                               body=f"The zanzibar parcel for {eid} never arrived. " * 20,
+                               sent_date=now - timedelta(days=age)),
+            classification=cls,
+            draft=ResponseDraft(subject=f"Re: Order {eid}", body="We are looking into it."),
+        )
+        for eid, age in days_ago.items()
+    ])
+
+def test_schedule_is_off_by_default():
+    assert RETENTION_INTERVAL_S == 0
+
+def test_archived_bodies_read_back_and_stay_searchable(temp_db):
+    _save_aged({"old": 90, "new": 1})
+    before = db.get_processed("old")
+    status = RetentionScheduler(interval_s=0, archive_after_days=30, delete_after_days=0).run_once(vacuum=True)
+    assert status.last_error is None
+    assert status.archived == 1 and status.vacuumed and status.analyzed
+    assert 0 < status.compressed_bytes < status.text_bytes
+
+    after = db.get_processed("old")
+    assert after.record.body == before.record.body
+    assert after.draft.body == before.draft.body
+    assert after.classification.extraction == before.classification.extraction
+    hits, _ = db.search_emails("zanzibar")
+    assert {h.id for h in hits} == {"old", "new"}
+    db.rebuild_search_index()
+    hits, _ = db.search_emails("zanzibar")
+    assert {h.id for h in hits} == {"old", "new"}
+
+def test_delete_after_days_removes_everything_stored(temp_db):
+    _save_aged({"expired": 400, "kept": 10})
+    status = RetentionScheduler(interval_s=0, archive_after_days=0, delete_after_days=365).run_once()
+    assert status.deleted == 1
+    assert db.get_processed("expired") is None
+    assert db.get_processed("kept") is not None
+    assert db.get_stats()["category"] == {"BILLING": 1}
@@ -0,0 +1,63 @@
+import sqlite3
+from datetime import datetime
+
+from Backend import database as db
+from Backend.models import EmailRecord, ClassificationResult, ProcessedEmail
+
+def _save(email_id: str, subject: str, body: str, summary: str = "routine message",
+          sent_date: datetime = datetime(2024, 5, 1)):
+    cls = ClassificationResult(summary=summary, category="GENERAL", sentiment="neutral", priority="not_urgent",
+                               urgency_score=2)
+    record = EmailRecord(id=email_id, sender="carol@example.com", subject=subject, body=body,
+                         sent_date=sent_date)
+    db.save_processed([ProcessedEmail(record=record, classification=cls, draft=None)])
+
+def _ids(query: str):
+    hits, _ = db.search_emails(query)
+    return [h.id for h in hits]
+
+def test_new_mail_is_searchable_by_each_column(temp_db):
+    _save("e1", "Quarterly invoice", "The kangaroo shipment is delayed.", summary="logistics delay")
+    assert _ids("invoice") == ["e1"]
+    assert _ids("kangaroo") == ["e1"]
+    assert _ids("logistics") == ["e1"]
+    assert _ids("carol") == ["e1"]
+
+def test_updates_reindex_and_deletes_unindex(temp_db):
+    _save("e1", "Old subject", "walrus body")
+    _save("e1", "New subject", "penguin body")
+    assert _ids("walrus") == []
+    assert _ids("penguin") == ["e1"]
+    with sqlite3.connect(db.DB_PATH) as con:
+        con.execute("DELETE FROM emails WHERE id = 'e1';")
+    assert _ids("penguin") == []
+
+def test_index_survives_vacuum_and_rebuild(temp_db):
+    for i in range(5):
+        _save(f"e{i}", f"Note {i}", f"ocelot number {i}")
+    with sqlite3.connect(db.DB_PATH) as con:
+        con.execute("DELETE FROM emails WHERE id = 'e0';")
+    db.vacuum()
+    assert sorted(_ids("ocelot")) == ["e1", "e2", "e3", "e4"]
+    db.rebuild_search_index()
+    assert sorted(_ids("ocelot")) == ["e1", "e2", "e3", "e4"]
+
+def test_best_match_wins_over_many_newer_ones(temp_db):
+    _save("old", "Lynx lynx", "lynx sighting report", sent_date=datetime(2020, 1, 1))
+    for i in range(300):
+        _save(f"new{i}", f"Weekly digest {i}", "a long digest that mentions a lynx once among many other "
+              "words about the weather, the garden, the office move and the quarterly numbers",
+              sent_date=datetime(2024, 5, 1, i // 60, i % 60))
+    hits, cursor = db.search_emails("lynx", limit=5)
+    assert hits[0].id == "old" and cursor is not None
+
+def test_equal_scores_list_newest_first_across_pages(temp_db):
+    for day in (3, 1, 2):
+        _save(f"d{day}", "Heron", "heron", sent_date=datetime(2024, 5, day))
+    seen, cursor = [], None
+    while True:
+        hits, cursor = db.search_emails("heron", limit=2, cursor=cursor)
+        seen += [h.id for h in hits]
+        if cursor is None:
+            break
+    assert seen == ["d3", "d2", "d1"]
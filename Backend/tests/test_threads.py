@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from Backend import ai_classifier, threads
+from Backend import database as db
+from Backend.models import EmailRecord
+from Backend.priority_queue import PriorityEmailQueue
+from Backend.threads import process_threads
+
+def _email(email_id: str, thread_id: str, minute: int, body: str) -> EmailRecord:
+    return EmailRecord(id=email_id, thread_id=thread_id, sender=f"{email_id}@example.com", subject=f"Thread {thread_id}",
+                       body=body, sent_date=datetime(2024, 5, 1, 9, minute))
+
+def _heuristics_only(monkeypatch):
+    monkeypatch.setattr(ai_classifier, "GEMINI_KEY", "")
+    monkeypatch.setattr(ai_classifier.local_classifier, "predict", lambda emails: [None] * len(emails))
+    classified = []
+    classify_all = threads.classify_all
+
+    def recording(records, concurrency=None):
+        classified.append([r.id for r in records])
+        return classify_all(records, concurrency=concurrency)
+
+    monkeypatch.setattr(threads, "classify_all", recording)
+    return classified
+
+CONVERSATION = [
+    _email("t1-a", "t1", 0, "Our dashboard export keeps timing out."),
+    _email("t2-a", "t2", 1, "Could you send me last month's report?"),
+    _email("t1-b", "t1", 5, "It is still failing this morning, the server seems down."),
+]
+
+def test_only_the_newest_message_of_each_thread_is_classified(temp_db, monkeypatch):
+    classified = _heuristics_only(monkeypatch)
+    processed, heads = process_threads(CONVERSATION)
+    assert classified == [["t1-b", "t2-a"]]
+    assert [p.record.id for p in processed] == ["t1-a", "t2-a", "t1-b"]
+    assert sorted(h.record.id for h in heads) == ["t1-b", "t2-a"]
+    by_id = {p.record.id: p for p in processed}
+    # earlier messages inherit the thread's labels and get no draft of their own
+    assert by_id["t1-a"].classification == by_id["t1-b"].classification and by_id["t1-a"].draft is None
+    assert by_id["t1-b"].classification.priority == "urgent"
+    # the stored head keeps its own body; only the prompt saw the context
+    assert by_id["t1-b"].record.body == CONVERSATION[2].body
+
+def test_head_prompt_carries_earlier_messages(temp_db, monkeypatch):
+    _heuristics_only(monkeypatch)
+    seen = {}
+    monkeypatch.setattr(threads, "classify_all",
+                        lambda records, concurrency=None: seen.update({r.id: r.body for r in records}) or
+                        [(ai_classifier.classify_with_gemini(r), None) for r in records])
+    process_threads(CONVERSATION)
+    assert seen["t1-b"].startswith("Earlier in this thread")
+    assert "dashboard export" in seen["t1-b"] and seen["t1-b"].endswith(CONVERSATION[2].body)
+    assert seen["t2-a"] == CONVERSATION[1].body
+
+def test_unchanged_head_reuses_its_stored_result(temp_db, monkeypatch):
+    classified = _heuristics_only(monkeypatch)
+    processed, _ = process_threads(CONVERSATION)
+    db.save_processed(processed)
+    again, heads = process_threads(CONVERSATION)
+    assert classified == [["t1-b", "t2-a"], []]
+    assert {h.record.id: h.draft for h in heads} == {p.record.id: p.draft for p in processed if p.draft}
+    # an edited head is classified again
+    edited = CONVERSATION[:2] + [CONVERSATION[2].model_copy(update={"body": "Fixed now, thanks."})]
+    process_threads(edited)
+    assert classified[-1] == ["t1-b"]
+
+def test_a_new_head_supersedes_the_threads_queued_entry(temp_db, monkeypatch):
+    _heuristics_only(monkeypatch)
+    queue = PriorityEmailQueue()
+    first, heads = process_threads(CONVERSATION[:2])
+    db.save_processed(first)
+    queue.push_many(heads, one_per_thread=True)
+
+    later, heads = process_threads([CONVERSATION[2]])
+    db.save_processed(later)
+    queue.push_many(heads, one_per_thread=True)
+
+    claimed = []
+    while (item := queue.claim()) is not None:
+        claimed.append(item[1].record.id)
+    assert sorted(claimed) == ["t1-b", "t2-a"]
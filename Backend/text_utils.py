@@ -0,0 +1,14 @@
+from typing import List
+
+# Shared by the local classifier's features and near-duplicate shingling.
+# bytes.translate table: ASCII letters and all non-ASCII bytes (UTF-8 sequences) are token bytes; digits fold
+# to "0", so ticket/order/phone numbers become a few shape features instead of thousands of one-off ones
+_TOKENIZE = bytes(
+    0x30 if chr(c).isdigit() else c if c >= 0x80 or chr(c).isalpha() else 0x20 for c in range(256)
+)
+
+def word_tokens(text: str, limit: int) -> List[bytes]:
+    """
+    Lower-cased UTF-8 word tokens of the first `limit` characters, digits folded to "0".
+    """
+    return text[:limit].lower().encode("utf-8", "replace").translate(_TOKENIZE).split()
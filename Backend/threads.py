@@ -0,0 +1,87 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .models import EmailRecord, ProcessedEmail
+from .pipeline import classify_all
+from . import database as db
+
+THREAD_CONTEXT_MESSAGES = int(os.getenv("THREAD_CONTEXT_MESSAGES", "5"))
+THREAD_CONTEXT_CHARS = 240  # per earlier message
+
+def group_by_thread(records: List[EmailRecord]) -> List[List[EmailRecord]]:
+    """
+    Groups records by thread_id (records without one are their own thread), each group oldest first.
+    Groups are ordered by where their first record appears in the input.
+    """
+    groups: Dict[str, List[EmailRecord]] = {}
+    for r in records:
+        groups.setdefault(r.thread_id or f"msg:{r.id}", []).append(r)
+    return [sorted(g, key=lambda r: r.sent_date) for g in groups.values()]
+
+def _with_context(head: EmailRecord, earlier: List[Tuple[str, str, str]]) -> EmailRecord:
+    """
+    Copy of head whose body is prefixed with one line per earlier message, so a single
+    classification sees the conversation. Context goes first because the prompt truncates the body.
+    """
+    if not earlier:
+        return head
+    lines = [f"- {sender} ({sent_date[:16]}): {' '.join((text or '').split())[:THREAD_CONTEXT_CHARS]}"
+             for sender, sent_date, text in earlier]
+    body = "Earlier in this thread (oldest first):\n" + "\n".join(lines) + "\n\nLatest message:\n" + (head.body or "")
+    return head.model_copy(update={"body": body})
+
+def _unchanged(stored: Optional[ProcessedEmail], record: EmailRecord) -> bool:
+    return (
+        stored is not None
+        and stored.record.subject == record.subject
+        and stored.record.body == record.body
+    )
+
+def process_threads(
+    records: List[EmailRecord], concurrency: Optional[int] = None
+) -> Tuple[List[ProcessedEmail], List[ProcessedEmail]]:
+    """
+    Conversation-level processing: per thread, only the newest message is classified (with a compact
+    summary of the earlier ones) and drafted; earlier messages reuse their stored classification or
+    inherit the thread's. A newest message already classified with identical content is not re-classified.
+
+    Returns (every record processed, in input order; the newest message of each thread, to enqueue).
+    """
+    groups = group_by_thread(records)
+    stored = db.get_processed_many([r.id for r in records])
+
+    heads: Dict[str, ProcessedEmail] = {}
+    to_classify: List[Tuple[EmailRecord, EmailRecord]] = []  # (original head, head with thread context)
+    for group in groups:
+        head = group[-1]
+        prior = stored.get(head.id)
+        if _unchanged(prior, head) and prior.draft is not None:
+            heads[head.id] = ProcessedEmail(record=head, classification=prior.classification, draft=prior.draft)
+            continue
+        earlier: Dict[str, Tuple[str, str, str]] = {}
+        if head.thread_id:
+            for eid, sender, sent_date, text in db.get_thread_context(
+                head.thread_id, [r.id for r in group], THREAD_CONTEXT_MESSAGES
+            ):
+                earlier[eid] = (sender, sent_date, text)
+        for r in group[:-1]:
+            p = stored.get(r.id)
+            summary = p.classification.summary if _unchanged(p, r) else (r.snippet or r.body)
+            earlier[r.id] = (r.sender, r.sent_date.isoformat(), summary)
+        context = sorted(earlier.values(), key=lambda e: e[1])[-THREAD_CONTEXT_MESSAGES:]
+        to_classify.append((head, _with_context(head, context)))
+
+    results = classify_all([ctx for _, ctx in to_classify], concurrency=concurrency)
+    for (head, _), (cls, draft) in zip(to_classify, results):
+        heads[head.id] = ProcessedEmail(record=head, classification=cls, draft=draft)
+
+    thread_head = {(g[-1].thread_id or f"msg:{g[-1].id}"): heads[g[-1].id] for g in groups}
+    processed: List[ProcessedEmail] = []
+    for r in records:
+        if r.id in heads:
+            processed.append(heads[r.id])
+            continue
+        p = stored.get(r.id)
+        cls = p.classification if _unchanged(p, r) else thread_head[r.thread_id or f"msg:{r.id}"].classification
+        processed.append(ProcessedEmail(record=r, classification=cls, draft=None))
+    return processed, [thread_head[k] for k in thread_head]
@@ -5,7 +5,7 @@ export default function Dashboard() {
   const [emails, setEmails] = useState([]);
 
   useEffect(() => {
-    fetch(`${import.meta.env.VITE_BACKEND_URL}/emails`)
+    fetch(`${import.meta.env.VITE_BACKEND_URL}/emails/summaries`)
       .then(res => res.json())
       .then(data => setEmails(data))
       .catch(err => console.error("Error fetching:", err));
@@ -16,8 +16,8 @@ export default function Dashboard() {
       {emails.length === 0 ? (
         <p className="text-gray-600">No emails processed yet.</p>
       ) : (
-        emails.map((item, idx) => (
-          <EmailCard key={idx} email={item} />
+        emails.map(item => (
+          <EmailCard key={item.id} email={item} />
         ))
       )}
     </div>
@@ -1,21 +1,44 @@
+import { useState } from "react";
+
 export default function EmailCard({ email }) {
-  const { record, classification, draft } = email;
+  const [draft, setDraft] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  // The listing only carries summary fields; the draft is fetched on demand.
+  const loadDraft = () => {
+    setLoading(true);
+    fetch(`${import.meta.env.VITE_BACKEND_URL}/emails/${encodeURIComponent(email.id)}`)
+      .then(res => res.json())
+      .then(data => setDraft(data.draft))
+      .catch(err => console.error("Error fetching email:", err))
+      .finally(() => setLoading(false));
+  };
 
   return (
     <div className="bg-white shadow-md rounded-2xl p-4 space-y-3">
-      <h2 className="font-bold text-lg">{record.subject}</h2>
-      <p className="text-sm text-gray-600">From: {record.sender}</p>
-      <p className="text-gray-700">{record.snippet}</p>
+      <h2 className="font-bold text-lg">{email.subject}</h2>
+      <p className="text-sm text-gray-600">From: {email.sender}</p>
+      <p className="text-gray-700">{email.snippet}</p>
 
-      {classification && (
+      {email.summary && (
         <div className="bg-gray-50 p-3 rounded-md">
-          <p><strong>Summary:</strong> {classification.summary}</p>
-          <p><strong>Category:</strong> {classification.category}</p>
-          <p><strong>Sentiment:</strong> {classification.sentiment}</p>
-          <p><strong>Priority:</strong> {classification.priority}</p>
+          <p><strong>Summary:</strong> {email.summary}</p>
+          <p><strong>Category:</strong> {email.category}</p>
+          <p><strong>Sentiment:</strong> {email.sentiment}</p>
+          <p><strong>Priority:</strong> {email.priority} ({email.urgency_score}/10)</p>
         </div>
       )}
 
+      {email.has_draft && !draft && (
+        <button
+          className="text-blue-600 text-sm underline"
+          onClick={loadDraft}
+          disabled={loading}
+        >
+          {loading ? "Loading reply…" : "Show suggested reply"}
+        </button>
+      )}
+
       {draft && (
         <div className="bg-blue-50 p-3 rounded-md">
           <h3 className="font-semibold">Suggested Reply</h3>